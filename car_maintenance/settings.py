@@ -32,14 +32,23 @@ INSTALLED_APPS = [
     "vehicles",
     "insurance",
     "compliance",
+    "fleets",
+    "sync",
+    "jobs",
+    "reminders",
+    "monitoring",
 ]
 
 MIDDLEWARE = [
+    "monitoring.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "monitoring.slow_queries.SlowQueryMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "registration.throttle.AuthThrottleMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "monitoring.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -48,7 +57,7 @@ ROOT_URLCONF = "car_maintenance.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "monitoring.template_backend.TimedDjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, "templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -76,6 +85,32 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "monitoring.cache.InstrumentedLocMemCache",
+        "METRICS_LABEL": "default",
+    }
+}
+
+# Rendered iCalendar feeds are invalidated on writes, so they can live long.
+CALENDAR_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Login and registration attempts allowed per client IP and per username,
+# checked before any password hashing. Set AUTH_THROTTLE_SHARED to keep the
+# buckets in the default cache so all worker processes share them.
+AUTH_THROTTLE_RATES = {"ip": "30/min", "username": "10/min"}
+AUTH_THROTTLE_SHARED = False
+
+# Worker processes hashing passwords when staff provision drivers in bulk,
+# started once per web process and shared by its requests; 0 hashes them
+# inline in the request.
+PROVISION_HASH_WORKERS = 2
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -113,6 +148,76 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
+# Service record attachments are stored content-addressed (by SHA-256) here;
+# thumbnails are generated by a pool of worker processes, 0 renders inline.
+ATTACHMENT_ROOT = BASE_DIR / "attachments"
+ATTACHMENT_MAX_UPLOAD_SIZE = 25 * 1024 * 1024
+ATTACHMENT_THUMBNAIL_WORKERS = 2
+
+# Vehicle history reports are rendered by worker processes into REPORT_ROOT;
+# 0 workers renders them inline in the request.
+REPORT_ROOT = BASE_DIR / "reports"
+REPORT_WORKERS = 2
+
+# A sync pull that starts from a caught-up cursor re-sends the changes of the
+# SYNC_SAFETY_WINDOW seconds before it, since updated_at is stamped before a
+# transaction commits and a late commit can land behind a client's cursor.
+SYNC_SAFETY_WINDOW = 120
+
+# Service records dated more than this many days ago are moved to the archive
+# table by the archive_service_records command.
+SERVICE_RECORD_ARCHIVE_AFTER_DAYS = 730
+
+# Typical service costs are only shown for make/model/year groups with
+# service records from at least this many different owners. Raising it only
+# takes effect once refresh_service_stats --rebuild has run.
+SERVICE_STATS_MIN_OWNERS = 5
+
+# Reminders are sent this many days before each kind of deadline, at
+# REMINDER_HOUR local time. Recurring services fall due the given number of
+# days after the vehicle's last service of that type.
+REMINDER_LEAD_DAYS = {"registration": 30, "inspection": 14, "insurance": 30, "service": 7}
+REMINDER_HOUR = 9
+SERVICE_REMINDER_INTERVALS = {
+    "oil_change": 180,
+    "tire_rotation": 180,
+    "air_filter": 365,
+    "cabin_filter": 365,
+    "brake_service": 730,
+    "transmission_service": 1095,
+}
+
+# Requests are profiled with cProfile when a staff user sends PROFILE_HEADER,
+# and at random for PROFILE_SAMPLE_RATE (0 to 1) of all requests. Profiles are
+# kept in PROFILE_ROOT, the oldest removed beyond PROFILE_MAX_FILES.
+PROFILE_HEADER = "X-Profile"
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_ROOT = BASE_DIR / "profiles"
+PROFILE_MAX_FILES = 500
+
+# Queries slower than SLOW_QUERY_THRESHOLD_MS (None to disable) are logged
+# with their query plan. Each process keeps the SLOW_QUERY_LOG_SIZE most
+# recently seen query fingerprints and writes them to SLOW_QUERY_ROOT at most
+# every SLOW_QUERY_FLUSH_INTERVAL seconds.
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG_SIZE = 200
+SLOW_QUERY_ROOT = BASE_DIR / "slow_queries"
+SLOW_QUERY_FLUSH_INTERVAL = 5
+
+# Prometheus metrics are served at /metrics to staff, to METRICS_ALLOWED_IPS
+# and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>". Behind a
+# reverse proxy every request may come from 127.0.0.1, so no address is
+# allowed by default. Each process writes its counters to METRICS_ROOT at
+# most every METRICS_FLUSH_INTERVAL seconds; the endpoint sums the files of
+# all processes.
+METRICS_ALLOWED_IPS = []
+METRICS_TOKEN = None
+METRICS_ROOT = BASE_DIR / "metrics"
+METRICS_FLUSH_INTERVAL = 5
+
+# Keeps the files monitoring writes per process out of the project tree
+TEST_RUNNER = "car_maintenance.test_runner.TestRunner"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
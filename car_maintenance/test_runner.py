@@ -0,0 +1,33 @@
+"""Test runner keeping per-process monitoring files out of the project tree."""
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Point the metrics and slow query roots at a temporary directory.
+
+    The in-process values are dropped before the real roots are restored,
+    so that nothing is left for the exit handlers to write there.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.monitoring_root = tempfile.mkdtemp()
+        self.monitoring_settings = override_settings(
+            METRICS_ROOT=f"{self.monitoring_root}/metrics",
+            SLOW_QUERY_ROOT=f"{self.monitoring_root}/slow_queries",
+        )
+        self.monitoring_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        from monitoring.metrics import registry
+        from monitoring.slow_queries import reset_log
+
+        registry.reset()
+        reset_log()
+        self.monitoring_settings.disable()
+        shutil.rmtree(self.monitoring_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
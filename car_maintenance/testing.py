@@ -0,0 +1,23 @@
+"""Helpers shared by the apps' tests."""
+import datetime
+
+from django.utils import timezone
+
+
+class FakeClock:
+    """A stand-in for ``time.time`` that only moves when a test moves it."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    @classmethod
+    def on(cls, day):
+        """A clock at the start of ``day`` in the current time zone."""
+        midnight = datetime.datetime.combine(day, datetime.time())
+        return cls(timezone.make_aware(midnight).timestamp())
+
+    def __call__(self):
+        return self.now
+
+    def advance_to(self, when):
+        self.now = when.timestamp()
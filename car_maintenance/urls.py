@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from .views import home_view
+from monitoring.views import metrics_view
 from vehicles.views import VehicleListView
 
 
@@ -11,6 +12,11 @@ urlpatterns = [
     path("vehicles/", include(("vehicles.urls", "vehicles"), namespace="vehicles")),
     path("insurance/", include(("insurance.urls", "insurance"), namespace="insurance")),
     path("compliance/", include(("compliance.urls", "compliance"), namespace="compliance")),
+    path("fleets/", include(("fleets.urls", "fleets"), namespace="fleets")),
+    path("sync/", include(("sync.urls", "sync"), namespace="sync")),
+    path("jobs/", include(("jobs.urls", "jobs"), namespace="jobs")),
+    path("monitoring/", include(("monitoring.urls", "monitoring"), namespace="monitoring")),
+    path("metrics", metrics_view, name="metrics"),
     path("", home_view, name="home"),
     path("my-garage/", VehicleListView.as_view(), name="vehicle_list"),  # ✅ Fixes E009
 ]
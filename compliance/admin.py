@@ -1,4 +1,6 @@
 from django.contrib import admin
-from .models import CarRegistration
+from .models import CalendarFeed, CarRegistration
 
 admin.site.register(CarRegistration)
+admin.site.register(CalendarFeed)
+
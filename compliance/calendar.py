@@ -0,0 +1,138 @@
+"""iCalendar (RFC 5545) feed of a user's registration, inspection and
+insurance deadlines.
+
+Rendered feeds are cached together with their ETag under a key holding the
+feed's ``version``, a counter kept in the database and bumped whenever one
+of the underlying rows changes (see ``compliance.signals``, and the bulk
+writers that call :func:`invalidate_feeds` themselves). The version is read
+with the token lookup that every feed request makes anyway, so a change
+made by any process is seen by all of them, whatever cache backend is
+configured; superseded entries simply expire.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from insurance.models import InsurancePolicy
+from .models import CalendarFeed, CarRegistration
+
+PRODID = "-//CarCare//Vehicle Deadlines//EN"
+UID_DOMAIN = "carcare"
+
+
+def feed_cache_key(feed):
+    return f"compliance:calendar_feed:{feed.pk}:{feed.version}"
+
+
+def invalidate_feeds(user_ids):
+    """Bump the feed version of ``user_ids`` (an iterable or a values queryset)."""
+    CalendarFeed.objects.filter(user_id__in=user_ids).update(version=F("version") + 1)
+
+
+def invalidate_feed(user_id):
+    invalidate_feeds([user_id])
+
+
+def get_feed(feed):
+    """Return ``(etag, body)`` for a ``CalendarFeed``, rendering it on a cache miss."""
+    key = feed_cache_key(feed)
+    cached = cache.get(key)
+    if cached is None:
+        body = render_feed(feed.user)
+        etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+        cached = (etag, body)
+        cache.set(
+            key,
+            cached,
+            getattr(settings, "CALENDAR_FEED_CACHE_TIMEOUT", 60 * 60 * 24),
+        )
+    return cached
+
+
+def render_feed(user):
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:Vehicle deadlines",
+    ]
+
+    registrations = CarRegistration.objects.filter(
+        vehicle__user=user
+    ).select_related("vehicle")
+    for registration in registrations:
+        lines += _event(
+            f"registration-{registration.pk}-expiration",
+            registration.expiration_date,
+            f"Registration expires: {registration.vehicle}",
+            f"{registration.state} {registration.registration_number}",
+            stamp,
+        )
+        if registration.inspection_due_date:
+            lines += _event(
+                f"registration-{registration.pk}-inspection",
+                registration.inspection_due_date,
+                f"Inspection due: {registration.vehicle}",
+                f"{registration.state} {registration.registration_number}",
+                stamp,
+            )
+
+    policies = InsurancePolicy.objects.filter(vehicle__user=user).select_related(
+        "vehicle"
+    )
+    for policy in policies:
+        lines += _event(
+            f"insurance-{policy.pk}-coverage-end",
+            policy.coverage_end,
+            f"Insurance ends: {policy.vehicle}",
+            f"{policy.provider} {policy.policy_number}",
+            stamp,
+        )
+
+    lines.append("END:VCALENDAR")
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+def _event(uid, day, summary, description, stamp):
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@{UID_DOMAIN}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{day + datetime.timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{_escape(summary)}",
+        f"DESCRIPTION:{_escape(description)}",
+        "TRANSP:TRANSPARENT",
+        "END:VEVENT",
+    ]
+
+
+def _escape(text):
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line, limit=75):
+    """Fold content lines longer than ``limit`` octets as RFC 5545 requires."""
+    if len(line.encode()) <= limit:
+        return line
+    parts = []
+    current = ""
+    for char in line:
+        if len((current + char).encode()) > limit:
+            parts.append(current)
+            current = " "  # continuation lines start with a single space
+        current += char
+    parts.append(current)
+    return "\r\n".join(parts)
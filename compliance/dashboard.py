@@ -0,0 +1,123 @@
+"""Upcoming registration, inspection and insurance deadlines across a garage.
+
+Each section is counted per window with a single aggregate query and lists
+at most ``limit`` items, so the number and cost of queries do not grow with
+the number of vehicles. Registrations and policies replaced by a later one
+for the same vehicle are ignored.
+"""
+import datetime
+
+from django.db.models import Count, Exists, OuterRef, Q
+
+from insurance.models import InsurancePolicy
+from .models import CarRegistration
+
+# (key, label, first day offset, last day offset); None means unbounded
+WINDOWS = [
+    ("overdue", "Overdue", None, -1),
+    ("within_30", "Next 30 days", 0, 30),
+    ("within_60", "31-60 days", 31, 60),
+    ("within_90", "61-90 days", 61, 90),
+]
+HORIZON_DAYS = WINDOWS[-1][3]
+
+
+def _window_q(field, today, first, last):
+    q = Q(**{f"{field}__lte": today + datetime.timedelta(days=last)})
+    if first is not None:
+        q &= Q(**{f"{field}__gte": today + datetime.timedelta(days=first)})
+    return q
+
+
+def _window_counts(field, today, prefix="", condition=None):
+    counts = {}
+    for key, _label, first, last in WINDOWS:
+        window = _window_q(field, today, first, last)
+        if condition is not None:
+            window &= condition
+        counts[f"{prefix}{key}"] = Count("pk", filter=window)
+    return counts
+
+
+def _section(key, title, counts, items, prefix=""):
+    return {
+        "key": key,
+        "title": title,
+        "windows": [
+            {"key": window, "label": label, "count": counts[f"{prefix}{window}"]}
+            for window, label, _first, _last in WINDOWS
+        ],
+        "items": items,
+    }
+
+
+def current_registrations(user):
+    newer = CarRegistration.objects.filter(
+        vehicle=OuterRef("vehicle"), expiration_date__gt=OuterRef("expiration_date")
+    )
+    return CarRegistration.objects.filter(vehicle__user=user).exclude(Exists(newer))
+
+
+def current_policies(user):
+    newer = InsurancePolicy.objects.filter(
+        vehicle=OuterRef("vehicle"), coverage_end__gt=OuterRef("coverage_end")
+    )
+    return InsurancePolicy.objects.filter(vehicle__user=user).exclude(Exists(newer))
+
+
+def upcoming_deadlines(user, today=None, limit=25):
+    """Return dashboard sections for registrations, inspections and insurance."""
+    today = today or datetime.date.today()
+    until = _window_q("expiration_date", today, None, HORIZON_DAYS)
+    inspection_until = _window_q("inspection_due_date", today, None, HORIZON_DAYS)
+    coverage_until = _window_q("coverage_end", today, None, HORIZON_DAYS)
+    pending_inspection = Q(inspection_completed_date__isnull=True)
+
+    registrations = current_registrations(user)
+    registration_counts = registrations.aggregate(
+        **_window_counts("expiration_date", today, prefix="registration_"),
+        **_window_counts(
+            "inspection_due_date",
+            today,
+            prefix="inspection_",
+            condition=pending_inspection,
+        ),
+    )
+    policy_counts = current_policies(user).aggregate(
+        **_window_counts("coverage_end", today)
+    )
+
+    expiring = (
+        registrations.filter(until)
+        .select_related("vehicle")
+        .order_by("expiration_date")[:limit]
+    )
+    inspections = (
+        registrations.filter(inspection_until, pending_inspection)
+        .select_related("vehicle")
+        .order_by("inspection_due_date")[:limit]
+    )
+    ending = (
+        current_policies(user)
+        .filter(coverage_until)
+        .select_related("vehicle")
+        .order_by("coverage_end")[:limit]
+    )
+
+    return [
+        _section(
+            "registrations",
+            "Registrations",
+            registration_counts,
+            expiring,
+            "registration_",
+        ),
+        _section(
+            "inspections",
+            "Inspections",
+            registration_counts,
+            inspections,
+            "inspection_",
+        ),
+        _section("insurance", "Insurance", policy_counts, ending),
+    ]
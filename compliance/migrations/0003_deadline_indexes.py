@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compliance', '0002_calendarfeed'),
+        ('vehicles', '0002_servicerecord'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carregistration',
+            index=models.Index(fields=['vehicle', 'expiration_date'], name='compliance__vehicle_d9fed3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carregistration',
+            index=models.Index(fields=['inspection_due_date'], name='compliance__inspect_38147e_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compliance', '0003_deadline_indexes'),
+        ('vehicles', '0005_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carregistration',
+            index=models.Index(fields=['updated_at', 'id'], name='compliance__updated_f38cb0_idx'),
+        ),
+    ]
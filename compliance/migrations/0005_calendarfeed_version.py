@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compliance', '0004_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarfeed',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import User
 from vehicles.models import Vehicle
@@ -73,6 +75,34 @@ class CarRegistration(models.Model):
 
     class Meta:
         ordering = ["-expiration_date", "vehicle"]
+        indexes = [
+            models.Index(fields=["vehicle", "expiration_date"]),
+            models.Index(fields=["inspection_due_date"]),
+            models.Index(fields=["updated_at", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.vehicle} - {self.state} {self.registration_number}"
+
+
+class CalendarFeed(models.Model):
+    """Secret token that gives calendar apps read access to a user's deadlines."""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name="calendar_feed"
+    )
+    token = models.CharField(max_length=64, unique=True)
+    # Bumped on every change to the user's deadlines; part of the cache key
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Calendar feed for {self.user}"
+
+    @staticmethod
+    def generate_token():
+        return secrets.token_urlsafe(32)
+
+    def regenerate_token(self):
+        self.token = self.generate_token()
+        self.save(update_fields=["token"])
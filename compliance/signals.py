@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from insurance.models import InsurancePolicy
+from vehicles.models import Vehicle
+from .calendar import invalidate_feed
+from .models import CarRegistration
+
+
+def vehicle_owner_id(instance):
+    """Return the user id owning ``instance.vehicle`` without refetching it."""
+    if instance._meta.get_field("vehicle").is_cached(instance):
+        return instance.vehicle.user_id
+    return (
+        Vehicle.objects.filter(pk=instance.vehicle_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+def vehicle_changed(sender, instance, **kwargs):
+    invalidate_feed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=CarRegistration)
+@receiver([post_save, post_delete], sender=InsurancePolicy)
+def deadline_changed(sender, instance, **kwargs):
+    user_id = vehicle_owner_id(instance)
+    if user_id is not None:
+        invalidate_feed(user_id)
@@ -1,23 +1,53 @@
 import json
+from functools import lru_cache
+
 from django import template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
 from compliance.models import CarRegistration
 
 register = template.Library()
 
+# Attribute used to memoize parsed error JSON on the current request
+ERROR_MAP_CACHE_ATTR = "_compliance_error_maps"
 
-@register.simple_tag
-def get_field_errors(errors_json, field_name):
-    """Extract errors for a specific field from JSON error string"""
+
+def parse_errors(errors_json, request=None):
+    """Parse a JSON error string into a dict, at most once per request"""
     if not errors_json:
-        return []
+        return {}
+    cache = None
+    if request is not None:
+        cache = getattr(request, ERROR_MAP_CACHE_ATTR, None)
+        if cache is None:
+            cache = {}
+            setattr(request, ERROR_MAP_CACHE_ATTR, cache)
+        if errors_json in cache:
+            return cache[errors_json]
     try:
-        errors_dict = json.loads(errors_json)
-        return errors_dict.get(field_name, [])
+        errors = json.loads(errors_json)
     except (json.JSONDecodeError, TypeError):
-        return []
+        errors = {}
+    if not isinstance(errors, dict):
+        errors = {}
+    if cache is not None:
+        cache[errors_json] = errors
+    return errors
+
+
+@register.simple_tag(takes_context=True)
+def get_error_map(context, errors_json):
+    """Get the parsed field -> errors map for a JSON error string"""
+    return parse_errors(errors_json, context.get("request"))
+
+
+@register.simple_tag(takes_context=True)
+def get_field_errors(context, errors_json, field_name):
+    """Extract errors for a specific field from JSON error string"""
+    return parse_errors(errors_json, context.get("request")).get(field_name, [])
 
 
-@register.simple_tag  
+@register.simple_tag
 def get_current_value(form_data, form_id, registration_id, field_name, default_value):
     """Get current value for a field, preferring form_data if available"""
     if form_data and form_id == registration_id:
@@ -28,4 +58,40 @@ def get_current_value(form_data, form_id, registration_id, field_name, default_v
 @register.simple_tag
 def get_state_choices():
     """Get state choices from the model"""
-    return CarRegistration.STATE_CHOICES
\ No newline at end of file
+    return CarRegistration.STATE_CHOICES
+
+
+STATE_CODES = frozenset(value for value, _label in CarRegistration.STATE_CHOICES)
+
+
+@lru_cache(maxsize=None)
+def _state_options(selected):
+    """Pre-render the state <option> list, once per selected value"""
+    return format_html_join(
+        "",
+        '<option value="{}"{}>{}</option>',
+        (
+            (value, mark_safe(" selected") if value == selected else "", label)
+            for value, label in CarRegistration.STATE_CHOICES
+        ),
+    )
+
+
+@register.simple_tag
+def state_select(name, selected=None, suffix=None, css_class="form-select"):
+    """Render a state <select> from the cached, pre-rendered option list.
+
+    The element id is ``<name>-<suffix>``, e.g. ``state-42`` for the edit
+    modal of registration 42, or ``id_<name>`` when no suffix is given.
+    """
+    if selected not in STATE_CODES:
+        # Keeps the option cache bounded when form data holds a bogus value
+        selected = None
+    element_id = f"{name}-{suffix}" if suffix is not None else f"id_{name}"
+    return format_html(
+        '<select class="{}" id="{}" name="{}" required>{}</select>',
+        css_class,
+        element_id,
+        name,
+        _state_options(selected),
+    )
@@ -2,9 +2,19 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.urls import reverse
+from django.core.cache import cache
+from django.test import RequestFactory
 from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+import json
 from vehicles.models import Vehicle
-from .models import CarRegistration
+from insurance.models import InsurancePolicy
+from insurance.reconcile import Reconciliation, read_csv
+from .dashboard import upcoming_deadlines
+from .models import CalendarFeed, CarRegistration
+from .templatetags import compliance_extras
+from .templatetags.compliance_extras import parse_errors, state_select
 
 
 class CarRegistrationModelTest(TestCase):
@@ -294,3 +304,284 @@ class CarRegistrationViewTest(TestCase):
         # Follow the redirect to check session data
         response = self.client.get(reverse('vehicles:vehicle_detail', kwargs={'pk': self.vehicle.pk}))
         self.assertEqual(response.status_code, 200)
+
+
+class CalendarFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.registration = CarRegistration.objects.create(
+            vehicle=self.vehicle,
+            registration_number='ABC123',
+            state='NC',
+            registration_date=date(2024, 1, 1),
+            expiration_date=date(2025, 1, 1),
+            inspection_due_date=date(2024, 12, 1)
+        )
+        InsurancePolicy.objects.create(
+            user=self.user,
+            vehicle=self.vehicle,
+            provider='State Farm',
+            policy_number='SF123',
+            coverage_start=date(2024, 1, 1),
+            coverage_end=date(2024, 7, 1),
+            premium='1200.00'
+        )
+        self.feed = CalendarFeed.objects.create(
+            user=self.user, token=CalendarFeed.generate_token()
+        )
+        self.url = reverse('compliance:calendar_feed', kwargs={'token': self.feed.token})
+
+    def test_feed_lists_all_deadlines(self):
+        """Test that the feed contains registration, inspection and insurance events"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        content = response.content.decode()
+        self.assertIn('DTSTART;VALUE=DATE:20250101', content)
+        self.assertIn('DTSTART;VALUE=DATE:20241201', content)
+        self.assertIn('DTSTART;VALUE=DATE:20240701', content)
+        self.assertEqual(content.count('BEGIN:VEVENT'), 3)
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_unknown_token_returns_404(self):
+        """Test that an invalid token does not expose any feed"""
+        response = self.client.get(
+            reverse('compliance:calendar_feed', kwargs={'token': 'not-a-token'})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_matching_etag_returns_not_modified_from_cache(self):
+        """Test that polling with the current ETag answers 304 without rendering"""
+        etag = self.client.get(self.url)['ETag']
+
+        # Only the token lookup hits the database once the feed is cached
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_feed_invalidated_when_registration_changes(self):
+        """Test that saving a registration changes the served feed and ETag"""
+        etag = self.client.get(self.url)['ETag']
+
+        self.registration.expiration_date = date(2025, 2, 1)
+        self.registration.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'DTSTART;VALUE=DATE:20250201')
+
+    def test_feed_invalidated_by_bulk_update_without_signals(self):
+        """Test that a carrier file applied with bulk_update changes the feed"""
+        etag = self.client.get(self.url)['ETag']
+        records = read_csv(StringIO(
+            'policy_number,coverage_start,coverage_end,premium\n'
+            'SF123,2024-01-01,2024-08-01,1200.00\n'
+        ))
+        list(Reconciliation(records, apply=True).run())
+
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.version, 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'DTSTART;VALUE=DATE:20240801')
+
+    def test_settings_page_creates_and_regenerates_token(self):
+        """Test that the settings page shows the feed URL and can revoke it"""
+        self.client.login(username='testuser', password='testpass123')
+
+        response = self.client.get(reverse('compliance:calendar_settings'))
+        self.assertContains(response, self.feed.token)
+
+        self.client.post(reverse('compliance:calendar_settings'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ComplianceDashboardTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.today = date(2024, 6, 1)
+        self.vehicles = [
+            Vehicle.objects.create(
+                user=self.user,
+                make='Toyota',
+                model=f'Camry {i}',
+                year=2020,
+                current_mileage=25000
+            )
+            for i in range(3)
+        ]
+
+    def create_registration(self, vehicle, expiration_date, **kwargs):
+        return CarRegistration.objects.create(
+            vehicle=vehicle,
+            registration_number=f'REG{CarRegistration.objects.count()}',
+            state='NC',
+            registration_date=expiration_date - timedelta(days=365),
+            expiration_date=expiration_date,
+            **kwargs
+        )
+
+    def test_deadlines_grouped_into_windows(self):
+        """Test that registrations, inspections and policies are counted per window"""
+        self.create_registration(self.vehicles[0], self.today - timedelta(days=3))
+        self.create_registration(
+            self.vehicles[1], self.today + timedelta(days=10),
+            inspection_due_date=self.today + timedelta(days=45)
+        )
+        self.create_registration(self.vehicles[2], self.today + timedelta(days=200))
+        InsurancePolicy.objects.create(
+            user=self.user,
+            vehicle=self.vehicles[0],
+            provider='State Farm',
+            policy_number='SF1',
+            coverage_start=self.today - timedelta(days=300),
+            coverage_end=self.today + timedelta(days=70),
+            premium='1200.00'
+        )
+
+        sections = {s['key']: s for s in upcoming_deadlines(self.user, today=self.today)}
+
+        def counts(key):
+            return [window['count'] for window in sections[key]['windows']]
+
+        self.assertEqual(counts('registrations'), [1, 1, 0, 0])
+        self.assertEqual(counts('inspections'), [0, 0, 1, 0])
+        self.assertEqual(counts('insurance'), [0, 0, 0, 1])
+        self.assertEqual(len(sections['registrations']['items']), 2)
+
+    def test_renewed_registration_not_overdue(self):
+        """Test that a registration replaced by a renewal is ignored"""
+        self.create_registration(self.vehicles[0], self.today - timedelta(days=3))
+        self.create_registration(self.vehicles[0], self.today + timedelta(days=362))
+
+        sections = upcoming_deadlines(self.user, today=self.today)
+
+        self.assertEqual(sections[0]['windows'][0]['count'], 0)
+        self.assertEqual(list(sections[0]['items']), [])
+
+    def test_query_count_independent_of_vehicle_count(self):
+        """Test that the dashboard uses a fixed number of queries"""
+        for vehicle in self.vehicles:
+            self.create_registration(vehicle, self.today + timedelta(days=5))
+
+        with self.assertNumQueries(5):
+            for section in upcoming_deadlines(self.user, today=self.today):
+                list(section['items'])
+
+    def test_dashboard_view(self):
+        """Test that the dashboard page renders the user's deadlines"""
+        self.create_registration(self.vehicles[0], date.today() + timedelta(days=5))
+        self.client.login(username='testuser', password='testpass123')
+
+        response = self.client.get(reverse('compliance:dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Compliance Dashboard')
+        self.assertContains(response, 'Next 30 days: 1')
+
+
+class ComplianceExtrasTest(TestCase):
+    def test_state_select_marks_selected_state(self):
+        """Test that the cached state select marks only the chosen state"""
+        html = state_select('state', 'NC', suffix=7)
+
+        self.assertIn('id="state-7"', html)
+        self.assertIn('<option value="NC" selected>North Carolina</option>', html)
+        self.assertEqual(html.count(' selected'), 1)
+        self.assertEqual(html.count('<option'), len(CarRegistration.STATE_CHOICES))
+
+    def test_state_select_ignores_unknown_state(self):
+        """Test that unknown submitted values select nothing"""
+        html = state_select('state', '<script>')
+
+        self.assertNotIn(' selected', html)
+        self.assertNotIn('<script>', html)
+
+    def test_errors_parsed_once_per_request(self):
+        """Test that the same error JSON is only decoded once per request"""
+        request = RequestFactory().get('/')
+        errors_json = '{"state": [{"message": "Invalid", "code": "invalid"}]}'
+
+        with mock.patch.object(compliance_extras, 'json', wraps=json) as json_module:
+            for _ in range(10):
+                errors = parse_errors(errors_json, request)
+
+        self.assertEqual(json_module.loads.call_count, 1)
+        self.assertEqual(errors['state'][0]['message'], 'Invalid')
+        self.assertEqual(parse_errors('not json', request), {})
+
+
+class VehicleDetailRenderBenchmarkTest(TestCase):
+    """Render benchmark for vehicle_detail.html with 200 registrations."""
+
+    REGISTRATIONS = 200
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        CarRegistration.objects.bulk_create([
+            CarRegistration(
+                vehicle=self.vehicle,
+                registration_number=f'REG{i}',
+                state='NC',
+                registration_date=date(2024, 1, 1),
+                expiration_date=date(2025, 1, 1)
+            )
+            for i in range(self.REGISTRATIONS)
+        ])
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_render_with_edit_errors(self):
+        """Test that a full render parses error JSON once and reuses state options"""
+        registration = CarRegistration.objects.first()
+        session = self.client.session
+        session['registration_edit_form_errors'] = (
+            '{"registration_number": [{"message": "This field is required.", "code": "required"}]}'
+        )
+        session['registration_edit_form_data'] = {'registration_number': '', 'state': 'CA'}
+        session['registration_edit_form_id'] = registration.id
+        session.save()
+        url = reverse('vehicles:vehicle_detail', kwargs={'pk': self.vehicle.pk})
+
+        compliance_extras._state_options.cache_clear()
+        with mock.patch.object(compliance_extras, 'json', wraps=json) as json_module:
+            response = self.client.get(url)
+
+        self.assertEqual(json_module.loads.call_count, 1)
+        self.assertContains(response, 'This field is required.')
+        self.assertContains(response, '<option value="CA" selected>California</option>', count=1)
+        self.assertContains(
+            response, '<option value="NC" selected>North Carolina</option>',
+            count=self.REGISTRATIONS - 1
+        )
+        # The option list is rendered once each for NC and CA, then reused
+        cache_info = compliance_extras._state_options.cache_info()
+        self.assertEqual(cache_info.misses, 2)
+        self.assertEqual(cache_info.hits, self.REGISTRATIONS - 2)
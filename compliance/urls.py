@@ -1,8 +1,18 @@
 from django.urls import path
-from .views import CarRegistrationCreateView, CarRegistrationUpdateView, CarRegistrationDeleteView
+from .views import (
+    CalendarFeedView,
+    ComplianceDashboardView,
+    CarRegistrationCreateView,
+    CarRegistrationUpdateView,
+    CarRegistrationDeleteView,
+    calendar_feed,
+)
 
 urlpatterns = [
     path("add/", CarRegistrationCreateView.as_view(), name="registration_add"),
     path("<int:pk>/edit/", CarRegistrationUpdateView.as_view(), name="registration_edit"),
     path("<int:pk>/delete/", CarRegistrationDeleteView.as_view(), name="registration_delete"),
-]
\ No newline at end of file
+    path("dashboard/", ComplianceDashboardView.as_view(), name="dashboard"),
+    path("calendar/", CalendarFeedView.as_view(), name="calendar_settings"),
+    path("calendar/<str:token>.ics", calendar_feed, name="calendar_feed"),
+]
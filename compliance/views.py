@@ -1,10 +1,17 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.views.generic import CreateView, UpdateView, DeleteView, TemplateView
+from django.urls import reverse, reverse_lazy
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
 from vehicles.models import Vehicle
-from .models import CarRegistration
+from sync.tombstones import record_deletion
+from .calendar import get_feed
+from .dashboard import upcoming_deadlines
+from .models import CalendarFeed, CarRegistration
 from .forms import CarRegistrationForm
 
 
@@ -74,5 +81,56 @@ class CarRegistrationDeleteView(LoginRequiredMixin, DeleteView):
         # Only allow deleting registrations for vehicles owned by the current user
         return CarRegistration.objects.filter(vehicle__user=self.request.user)
 
+    def form_valid(self, form):
+        with transaction.atomic():
+            record_deletion(self.request.user, self.object)
+            return super().form_valid(form)
+
     def get_success_url(self):
         return reverse_lazy("vehicles:vehicle_detail", kwargs={"pk": self.object.vehicle.pk})
+
+
+class ComplianceDashboardView(LoginRequiredMixin, TemplateView):
+    template_name = "compliance/dashboard.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["sections"] = upcoming_deadlines(self.request.user)
+        return context
+
+
+class CalendarFeedView(LoginRequiredMixin, TemplateView):
+    template_name = "compliance/calendar_feed.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        feed, _ = CalendarFeed.objects.get_or_create(
+            user=self.request.user,
+            defaults={"token": CalendarFeed.generate_token()},
+        )
+        context["feed_url"] = self.request.build_absolute_uri(
+            reverse("compliance:calendar_feed", kwargs={"token": feed.token})
+        )
+        return context
+
+    def post(self, request, *args, **kwargs):
+        # Regenerating the token revokes every previously shared feed URL
+        feed, created = CalendarFeed.objects.get_or_create(
+            user=request.user, defaults={"token": CalendarFeed.generate_token()}
+        )
+        if not created:
+            feed.regenerate_token()
+        return redirect("compliance:calendar_settings")
+
+
+@require_safe
+def calendar_feed(request, token):
+    """Serve a user's deadlines as iCalendar, answering 304 when unchanged."""
+    feed = get_object_or_404(CalendarFeed.objects.select_related("user"), token=token)
+    etag, body = get_feed(feed)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="text/calendar; charset=utf-8")
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
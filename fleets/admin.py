@@ -0,0 +1,5 @@
+from django.contrib import admin
+from .models import Fleet, FleetMembership
+
+admin.site.register(Fleet)
+admin.site.register(FleetMembership)
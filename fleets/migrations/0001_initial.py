@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Fleet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FleetMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('dispatcher', 'Dispatcher'), ('driver', 'Driver')], default='driver', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fleet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='fleets.fleet')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fleet_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['fleet', 'user'],
+            },
+        ),
+        migrations.AddField(
+            model_name='fleet',
+            name='members',
+            field=models.ManyToManyField(related_name='fleets', through='fleets.FleetMembership', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='fleetmembership',
+            constraint=models.UniqueConstraint(fields=('fleet', 'user'), name='unique_fleet_membership'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class Fleet(models.Model):
+    name = models.CharField(max_length=100)
+    members = models.ManyToManyField(
+        User, through="FleetMembership", related_name="fleets"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class FleetMembership(models.Model):
+    ROLE_OWNER = "owner"
+    ROLE_DISPATCHER = "dispatcher"
+    ROLE_DRIVER = "driver"
+    ROLE_CHOICES = [
+        (ROLE_OWNER, "Owner"),
+        (ROLE_DISPATCHER, "Dispatcher"),
+        (ROLE_DRIVER, "Driver"),
+    ]
+
+    fleet = models.ForeignKey(
+        Fleet, on_delete=models.CASCADE, related_name="memberships"
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="fleet_memberships"
+    )
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default=ROLE_DRIVER)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["fleet", "user"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fleet", "user"], name="unique_fleet_membership"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.fleet} ({self.get_role_display()})"
+
+    @property
+    def can_view_all_vehicles(self):
+        """Owners and dispatchers see the whole fleet; drivers see their own."""
+        return self.role in (self.ROLE_OWNER, self.ROLE_DISPATCHER)
@@ -0,0 +1,74 @@
+"""Keyset (seek) pagination over a single sort column plus the primary key.
+
+Unlike OFFSET pagination, every page is an index range scan that starts
+where the previous page ended, so late pages cost the same as the first.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(pk, int):
+        raise InvalidCursor(cursor)
+    return value, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_page(queryset, field, descending=False, cursor=None, page_size=50):
+    """Return the page of ``queryset`` that follows ``cursor``.
+
+    Rows are ordered by ``field`` then ``pk`` in the same direction, so the
+    ordering is total even when ``field`` has duplicates.
+    """
+    if descending:
+        queryset = queryset.order_by(f"-{field}", "-pk")
+        after = "lt"
+    else:
+        queryset = queryset.order_by(field, "pk")
+        after = "gt"
+
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        # A forged cursor must not reach the database with the wrong type
+        try:
+            value = queryset.model._meta.get_field(field).to_python(value)
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{field}__{after}": value})
+            | Q(**{field: value, f"pk__{after}": pk})
+        )
+
+    rows = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(rows, next_cursor)
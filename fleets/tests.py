@@ -0,0 +1,139 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from unittest import mock
+from vehicles.models import Vehicle
+from .facets import facet_counts
+from .models import Fleet, FleetMembership
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+from .views import FleetVehicleListView
+
+
+class FleetVehicleListViewTest(TestCase):
+    def setUp(self):
+        self.dispatcher = User.objects.create_user(
+            username='dispatcher',
+            password='testpass123'
+        )
+        self.driver = User.objects.create_user(
+            username='driver',
+            password='testpass123'
+        )
+        self.outsider = User.objects.create_user(
+            username='outsider',
+            password='testpass123'
+        )
+        self.fleet = Fleet.objects.create(name='Acme Logistics')
+        FleetMembership.objects.create(
+            fleet=self.fleet, user=self.dispatcher, role=FleetMembership.ROLE_DISPATCHER
+        )
+        FleetMembership.objects.create(
+            fleet=self.fleet, user=self.driver, role=FleetMembership.ROLE_DRIVER
+        )
+        models = [('Ford', 'Transit', 2020), ('Ford', 'F-150', 2021), ('Ram', 'ProMaster', 2020)]
+        for i in range(9):
+            make, model, year = models[i % 3]
+            Vehicle.objects.create(
+                user=self.driver if i == 0 else self.dispatcher,
+                fleet=self.fleet,
+                make=make,
+                model=model,
+                year=year,
+                current_mileage=1000 * i,
+                condition='good' if i % 2 else 'fair'
+            )
+        self.url = reverse('fleets:fleet_vehicles', kwargs={'pk': self.fleet.pk})
+    def test_non_member_gets_404(self):
+        """Test that only fleet members can list fleet vehicles"""
+        self.client.login(username='outsider', password='testpass123')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_driver_sees_only_own_vehicles(self):
+        """Test that the driver role is limited to the driver's vehicles"""
+        self.client.login(username='driver', password='testpass123')
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.context['vehicles']), 1)
+
+    def test_filter_and_facets(self):
+        """Test that filters narrow the list and facets count the filtered set"""
+        self.client.login(username='dispatcher', password='testpass123')
+
+        response = self.client.get(self.url, {'make': 'Ford', 'year': '2020'})
+
+        vehicles = response.context['vehicles']
+        self.assertEqual(len(vehicles), 3)
+        self.assertTrue(all(v.make == 'Ford' and v.year == 2020 for v in vehicles))
+        facets = {f['field']: f['values'] for f in response.context['facets']}
+        self.assertEqual([(v['value'], v['count']) for v in facets['model']], [('Transit', 3)])
+
+    @mock.patch.object(FleetVehicleListView, 'page_size', 4)
+    def test_keyset_pagination_walks_every_vehicle_once(self):
+        """Test that following next-page cursors returns each vehicle exactly once"""
+        self.client.login(username='dispatcher', password='testpass123')
+        seen = []
+        query = {'sort': '-year'}
+        pages = 0
+        while True:
+            pages += 1
+            response = self.client.get(self.url, query)
+            seen.extend(v.pk for v in response.context['vehicles'])
+            if not response.context['page'].has_next:
+                break
+            query = {'sort': '-year', 'cursor': response.context['page'].next_cursor}
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), sorted(Vehicle.objects.values_list('pk', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_forged_cursor_falls_back_to_first_page(self):
+        """Test that a cursor with a mistyped value shows the first page instead of failing"""
+        self.client.login(username='dispatcher', password='testpass123')
+
+        response = self.client.get(
+            self.url, {'sort': 'mileage', 'cursor': encode_cursor('lots', 1)}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['vehicles']), Vehicle.objects.count())
+
+    def test_fleet_list_shows_memberships(self):
+        """Test that the fleet list shows each fleet with its vehicle count"""
+        self.client.login(username='dispatcher', password='testpass123')
+        response = self.client.get(reverse('fleets:fleet_list'))
+        self.assertContains(response, 'Acme Logistics')
+        self.assertContains(response, '9 vehicles')
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        for i in range(5):
+            Vehicle.objects.create(
+                user=user, make='Ford', model='Transit', year=2020, current_mileage=i
+            )
+
+    def test_cursor_round_trip(self):
+        """Test that cursors decode to the value and primary key they encode"""
+        self.assertEqual(decode_cursor(encode_cursor('Ford', 42)), ('Ford', 42))
+
+    def test_cursor_value_of_wrong_type_is_invalid(self):
+        """Test that a cursor whose value does not fit the sort field is rejected"""
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Vehicle.objects.all(), 'year', cursor=encode_cursor('abc', 1))
+
+    def test_ties_broken_by_primary_key(self):
+        """Test that duplicate sort values do not skip or repeat rows"""
+        first = keyset_page(Vehicle.objects.all(), 'year', page_size=2)
+        second = keyset_page(Vehicle.objects.all(), 'year', cursor=first.next_cursor, page_size=2)
+        third = keyset_page(Vehicle.objects.all(), 'year', cursor=second.next_cursor, page_size=2)
+
+        pks = [v.pk for page in (first, second, third) for v in page.object_list]
+        self.assertEqual(pks, sorted(Vehicle.objects.values_list('pk', flat=True)))
+        self.assertFalse(third.has_next)
+
+    def test_facets_use_one_query(self):
+        """Test that all facet counts come from one grouped query"""
+        with self.assertNumQueries(1):
+            counts = facet_counts(Vehicle.objects.all())
+        self.assertEqual(counts['make'], [('Ford', 5)])
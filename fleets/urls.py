@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import FleetListView, FleetVehicleListView
+
+urlpatterns = [
+    path("", FleetListView.as_view(), name="fleet_list"),
+    path("<int:pk>/vehicles/", FleetVehicleListView.as_view(), name="fleet_vehicles"),
+]
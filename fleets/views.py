@@ -0,0 +1,134 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Count
+from django.shortcuts import get_object_or_404
+from django.views.generic import ListView, TemplateView
+from vehicles.forecast import fleet_forecast
+from vehicles.models import Vehicle
+from .facets import FACET_FIELDS, facet_counts
+from .models import FleetMembership
+from .pagination import InvalidCursor, keyset_page
+
+# Public sort keys mapped to the indexed Vehicle columns they order by
+SORT_FIELDS = {
+    "make": "make",
+    "model": "model",
+    "year": "year",
+    "condition": "condition",
+    "mileage": "current_mileage",
+}
+DEFAULT_SORT = "make"
+
+
+class FleetListView(LoginRequiredMixin, ListView):
+    template_name = "fleets/fleet_list.html"
+    context_object_name = "memberships"
+
+    def get_queryset(self):
+        return (
+            FleetMembership.objects.filter(user=self.request.user)
+            .select_related("fleet")
+            .annotate(vehicle_count=Count("fleet__vehicles"))
+            .order_by("fleet__name")
+        )
+
+
+class FleetVehicleListView(LoginRequiredMixin, TemplateView):
+    template_name = "fleets/fleet_vehicle_list.html"
+    page_size = 50
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        membership = get_object_or_404(
+            FleetMembership.objects.select_related("fleet"),
+            fleet_id=self.kwargs["pk"],
+            user=self.request.user,
+        )
+        vehicles = Vehicle.objects.filter(fleet=membership.fleet)
+        if not membership.can_view_all_vehicles:
+            vehicles = vehicles.filter(user=self.request.user)
+
+        filters = self.get_filters()
+        vehicles = vehicles.filter(**filters)
+
+        sort = self.request.GET.get("sort", DEFAULT_SORT)
+        descending = sort.startswith("-")
+        if sort.lstrip("-") not in SORT_FIELDS:
+            sort, descending = DEFAULT_SORT, False
+        field = SORT_FIELDS[sort.lstrip("-")]
+
+        try:
+            page = keyset_page(
+                vehicles,
+                field,
+                descending=descending,
+                cursor=self.request.GET.get("cursor"),
+                page_size=self.page_size,
+            )
+        except InvalidCursor:
+            page = keyset_page(vehicles, field, descending, page_size=self.page_size)
+
+        context.update(
+            {
+                "fleet": membership.fleet,
+                "membership": membership,
+                "vehicles": page.object_list,
+                "page": page,
+                "filters": filters,
+                "sort": sort,
+                "sort_options": list(SORT_FIELDS),
+                "facets": self.build_facets(facet_counts(vehicles), filters),
+                "forecast": (
+                    fleet_forecast(membership.fleet)
+                    if membership.can_view_all_vehicles
+                    else None
+                ),
+                "first_query": self.query_string(cursor=None),
+                "next_query": self.query_string(cursor=page.next_cursor)
+                if page.has_next
+                else None,
+            }
+        )
+        return context
+
+    def get_filters(self):
+        filters = {}
+        for field in FACET_FIELDS:
+            value = self.request.GET.get(field)
+            if not value:
+                continue
+            if field == "year":
+                if not value.isdigit():
+                    continue
+                value = int(value)
+            filters[field] = value
+        return filters
+
+    def query_string(self, **changes):
+        """Return the current query string with ``changes`` applied."""
+        query = self.request.GET.copy()
+        for key, value in changes.items():
+            if value is None:
+                query.pop(key, None)
+            else:
+                query[key] = value
+        return query.urlencode()
+
+    def build_facets(self, counts, filters):
+        facets = []
+        for field in FACET_FIELDS:
+            values = []
+            for value, count in counts[field]:
+                active = filters.get(field) == value
+                values.append(
+                    {
+                        "value": value,
+                        "count": count,
+                        "active": active,
+                        # Toggling a facet restarts pagination from the first page
+                        "query": self.query_string(
+                            cursor=None, **{field: None if active else value}
+                        ),
+                    }
+                )
+            facets.append({"field": field, "values": values})
+        return facets
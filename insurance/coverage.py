@@ -0,0 +1,109 @@
+"""Detect uninsured gaps and double-paid overlaps in insurance coverage.
+
+Coverage periods are treated as half-open ``[coverage_start, coverage_end)``
+intervals, so a renewal that starts on the day the previous policy ends is
+neither a gap nor an overlap.
+"""
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+from .models import InsurancePolicy
+
+PolicyInterval = namedtuple(
+    "PolicyInterval", ["vehicle_id", "policy_id", "policy_number", "start", "end"]
+)
+
+CoverageIssue = namedtuple(
+    "CoverageIssue", ["kind", "vehicle_id", "start", "end", "policies"]
+)
+
+GAP = "gap"
+OVERLAP = "overlap"
+
+INTERVAL_FIELDS = ("vehicle_id", "pk", "policy_number", "coverage_start", "coverage_end")
+
+
+def find_coverage_issues(intervals, as_of=None, presorted=False):
+    """Sweep one vehicle's policy intervals and return its gaps and overlaps.
+
+    ``intervals`` may be ``PolicyInterval`` tuples or ``InsurancePolicy``
+    instances. When ``as_of`` is given, coverage that lapses before that date
+    is reported as a trailing gap ending on ``as_of``.
+    """
+    intervals = [_as_interval(interval) for interval in intervals]
+    if not presorted:
+        intervals.sort(key=attrgetter("start", "end"))
+
+    issues = []
+    covering = None  # interval that currently extends coverage the furthest
+    for interval in intervals:
+        if covering is None:
+            covering = interval
+            continue
+        if interval.start > covering.end:
+            issues.append(
+                CoverageIssue(
+                    GAP,
+                    interval.vehicle_id,
+                    covering.end,
+                    interval.start,
+                    (covering.policy_number, interval.policy_number),
+                )
+            )
+        elif interval.start < covering.end:
+            issues.append(
+                CoverageIssue(
+                    OVERLAP,
+                    interval.vehicle_id,
+                    interval.start,
+                    min(interval.end, covering.end),
+                    (covering.policy_number, interval.policy_number),
+                )
+            )
+        if interval.end > covering.end:
+            covering = interval
+
+    if as_of is not None and covering is not None and covering.end < as_of:
+        issues.append(
+            CoverageIssue(
+                GAP,
+                covering.vehicle_id,
+                covering.end,
+                as_of,
+                (covering.policy_number,),
+            )
+        )
+    return issues
+
+
+def fleet_policy_intervals(queryset=None, chunk_size=5000):
+    """Stream policy intervals ordered by vehicle and start date in one query."""
+    if queryset is None:
+        queryset = InsurancePolicy.objects.all()
+    rows = (
+        queryset.order_by("vehicle_id", "coverage_start", "coverage_end")
+        .values_list(*INTERVAL_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        yield PolicyInterval(*row)
+
+
+def iter_fleet_coverage_issues(queryset=None, as_of=None, chunk_size=5000):
+    """Yield coverage issues for every vehicle in ``queryset``.
+
+    Policies are read in a single ordered pass, so only one vehicle's
+    intervals are held in memory at a time.
+    """
+    intervals = fleet_policy_intervals(queryset, chunk_size=chunk_size)
+    for _vehicle_id, vehicle_intervals in groupby(intervals, attrgetter("vehicle_id")):
+        yield from find_coverage_issues(vehicle_intervals, as_of=as_of, presorted=True)
+
+
+def _as_interval(obj):
+    if isinstance(obj, PolicyInterval):
+        return obj
+    return PolicyInterval(
+        obj.vehicle_id, obj.pk, obj.policy_number, obj.coverage_start, obj.coverage_end
+    )
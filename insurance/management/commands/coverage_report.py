@@ -0,0 +1,60 @@
+import csv
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from insurance.coverage import GAP, OVERLAP, iter_fleet_coverage_issues
+from insurance.models import InsurancePolicy
+
+
+class Command(BaseCommand):
+    help = "Report insurance coverage gaps and overlaps for every vehicle as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="Only report vehicles insured by this username."
+        )
+        parser.add_argument(
+            "--as-of",
+            help="Report coverage lapsed before this date (YYYY-MM-DD) as a gap.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Rows fetched from the database per round trip.",
+        )
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options["as_of"]:
+            try:
+                as_of = datetime.date.fromisoformat(options["as_of"])
+            except ValueError:
+                raise CommandError("--as-of must be a date in YYYY-MM-DD format.")
+
+        queryset = InsurancePolicy.objects.all()
+        if options["user"]:
+            queryset = queryset.filter(user__username=options["user"])
+
+        writer = csv.writer(self.stdout, lineterminator="\n")
+        writer.writerow(["vehicle_id", "kind", "start", "end", "policies"])
+        counts = {GAP: 0, OVERLAP: 0}
+        issues = iter_fleet_coverage_issues(
+            queryset, as_of=as_of, chunk_size=options["chunk_size"]
+        )
+        for issue in issues:
+            counts[issue.kind] += 1
+            writer.writerow(
+                [
+                    issue.vehicle_id,
+                    issue.kind,
+                    issue.start.isoformat(),
+                    issue.end.isoformat(),
+                    " ".join(issue.policies),
+                ]
+            )
+
+        self.stderr.write(
+            f"{counts[GAP]} gap(s) and {counts[OVERLAP]} overlap(s) found."
+        )
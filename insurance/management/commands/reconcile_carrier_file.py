@@ -0,0 +1,104 @@
+import codecs
+import csv
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from insurance.reconcile import (
+    CarrierFileError,
+    Reconciliation,
+    read_csv,
+    read_fixed_width,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile a carrier file of active policies against stored insurance "
+        "policies and write the discrepancies as CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Carrier file to reconcile.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "fixed"],
+            default="csv",
+            help="Carrier file format (default: csv).",
+        )
+        parser.add_argument(
+            "--provider",
+            help="Limit matching to this provider and report its active "
+            "policies that are absent from the file. Without it, absent "
+            "policies are not reported, since a carrier file only lists its "
+            "own carrier's policies.",
+        )
+        parser.add_argument(
+            "--as-of",
+            help="Date (YYYY-MM-DD) used to decide which policies are active.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Policy numbers looked up per query (default: 2000).",
+        )
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help="Overwrite mismatched dates and premiums with the carrier's values.",
+        )
+        parser.add_argument(
+            "--encoding", default="utf-8", help="Carrier file encoding."
+        )
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options["as_of"]:
+            try:
+                as_of = datetime.date.fromisoformat(options["as_of"])
+            except ValueError:
+                raise CommandError("--as-of must be a date in YYYY-MM-DD format.")
+
+        try:
+            codecs.lookup(options["encoding"])
+        except LookupError:
+            raise CommandError(f"Unknown encoding {options['encoding']!r}.")
+
+        reader = read_csv if options["format"] == "csv" else read_fixed_width
+        writer = csv.writer(self.stdout, lineterminator="\n")
+        writer.writerow(["kind", "policy_number", "field", "ours", "theirs", "line"])
+
+        started = time.perf_counter()
+        try:
+            fileobj = open(options["path"], newline="", encoding=options["encoding"])
+            with fileobj:
+                reconciliation = Reconciliation(
+                    reader(fileobj),
+                    provider=options["provider"],
+                    as_of=as_of,
+                    batch_size=options["batch_size"],
+                    apply=options["apply"],
+                )
+                for discrepancy in reconciliation.run():
+                    writer.writerow(discrepancy)
+        except OSError as exc:
+            raise CommandError(f"Cannot read {options['path']}: {exc}")
+        except UnicodeDecodeError as exc:
+            raise CommandError(
+                f"Cannot decode {options['path']} as {options['encoding']} "
+                f"(byte {exc.start}); pass the file's --encoding."
+            )
+        except CarrierFileError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        counts = reconciliation.counts
+        rate = counts["lines"] / elapsed if elapsed else 0
+        self.stderr.write(
+            "{lines} lines, {matched} matched, {missing} missing, {extra} extra, "
+            "{mismatch} mismatched field(s), {invalid} invalid, "
+            "{updated} updated".format(**counts)
+        )
+        self.stderr.write(f"{elapsed:.2f}s ({rate:,.0f} lines/s)")
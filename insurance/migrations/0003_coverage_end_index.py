@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insurance', '0002_insurancepolicy_coverage_index'),
+        ('vehicles', '0002_servicerecord'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='insurancepolicy',
+            index=models.Index(fields=['vehicle', 'coverage_end'], name='insurance_i_vehicle_2a32dc_idx'),
+        ),
+    ]
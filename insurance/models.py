@@ -14,5 +14,11 @@ class InsurancePolicy(models.Model):
     coverage_end = models.DateField()
     premium = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["vehicle", "coverage_start"]),
+            models.Index(fields=["vehicle", "coverage_end"]),
+        ]
+
     def __str__(self):
         return f"{self.provider} - {self.policy_number}"
@@ -0,0 +1,223 @@
+"""Reconcile carrier policy files against ``InsurancePolicy`` rows.
+
+Carrier files are streamed record by record and matched against the
+database in batches, one ``policy_number IN (...)`` query per batch.
+"""
+import csv
+import datetime
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from compliance.calendar import invalidate_feeds
+from reminders.models import ReminderEvent
+from reminders.schedule import queue_events
+from .models import InsurancePolicy
+
+CarrierRecord = namedtuple(
+    "CarrierRecord",
+    ["line", "policy_number", "coverage_start", "coverage_end", "premium"],
+)
+
+Discrepancy = namedtuple(
+    "Discrepancy", ["kind", "policy_number", "field", "ours", "theirs", "line"]
+)
+
+MISSING = "missing"  # in the carrier file, not in our database
+EXTRA = "extra"  # active in our database, absent from the carrier file
+MISMATCH = "mismatch"
+INVALID = "invalid"
+
+COMPARED_FIELDS = ("coverage_start", "coverage_end", "premium")
+
+# Default fixed-width layout: field name -> (start, end) column offsets.
+FIXED_WIDTH_LAYOUT = {
+    "policy_number": (0, 20),
+    "coverage_start": (20, 30),
+    "coverage_end": (30, 40),
+    "premium": (40, 52),
+}
+
+
+class CarrierFileError(ValueError):
+    """Raised for a carrier file line that cannot be parsed."""
+
+
+def parse_date(value):
+    value = value.strip()
+    if len(value) == 8 and value.isdigit():
+        value = f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CarrierFileError(f"Invalid date {value!r}")
+
+
+def parse_premium(value):
+    try:
+        return Decimal(value.strip()).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise CarrierFileError(f"Invalid premium {value!r}")
+
+
+def _record(line, policy_number, coverage_start, coverage_end, premium):
+    policy_number = policy_number.strip()
+    if not policy_number:
+        raise CarrierFileError("Missing policy number")
+    return CarrierRecord(
+        line,
+        policy_number,
+        parse_date(coverage_start),
+        parse_date(coverage_end),
+        parse_premium(premium),
+    )
+
+
+def read_csv(fileobj):
+    """Yield ``CarrierRecord``s, or ``CarrierFileError``s for bad lines.
+
+    The file must have a header row naming ``policy_number``,
+    ``coverage_start``, ``coverage_end`` and ``premium`` columns.
+    """
+    reader = csv.reader(fileobj)
+    header = [name.strip().lower() for name in next(reader, [])]
+    try:
+        columns = [header.index(name) for name in CarrierRecord._fields[1:]]
+    except ValueError:
+        raise CarrierFileError(
+            "CSV header must include policy_number, coverage_start, "
+            "coverage_end and premium"
+        )
+    for line, row in enumerate(reader, start=2):
+        if not row:
+            continue
+        try:
+            yield _record(line, *(row[column] for column in columns))
+        except (CarrierFileError, IndexError) as exc:
+            yield CarrierFileError(f"Line {line}: {exc or 'too few columns'}")
+
+
+def read_fixed_width(fileobj, layout=None):
+    """Yield ``CarrierRecord``s, or ``CarrierFileError``s for bad lines."""
+    slices = [
+        slice(*(layout or FIXED_WIDTH_LAYOUT)[name])
+        for name in CarrierRecord._fields[1:]
+    ]
+    for line, text in enumerate(fileobj, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield _record(line, *(text[column] for column in slices))
+        except CarrierFileError as exc:
+            yield CarrierFileError(f"Line {line}: {exc}")
+
+
+class Reconciliation:
+    """Compare a stream of carrier records against stored policies.
+
+    ``run()`` yields ``Discrepancy`` tuples as they are found and keeps
+    running totals in ``counts``. With ``apply=True`` mismatched dates and
+    premiums are overwritten with the carrier's values using
+    ``bulk_update``, one transaction per batch.
+    """
+
+    def __init__(self, records, provider=None, as_of=None, batch_size=2000,
+                 apply=False):
+        self.records = records
+        self.provider = provider
+        self.as_of = as_of or datetime.date.today()
+        self.batch_size = batch_size
+        self.apply = apply
+        self.counts = {
+            "lines": 0,
+            "matched": 0,
+            "updated": 0,
+            MISSING: 0,
+            EXTRA: 0,
+            MISMATCH: 0,
+            INVALID: 0,
+        }
+        self._seen = set()
+
+    def run(self):
+        records = iter(self.records)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            yield from self._reconcile_batch(batch)
+        if self.provider:
+            yield from self._find_extra()
+
+    def _queryset(self):
+        queryset = InsurancePolicy.objects.all()
+        if self.provider:
+            queryset = queryset.filter(provider=self.provider)
+        return queryset
+
+    def _reconcile_batch(self, batch):
+        self.counts["lines"] += len(batch)
+        records = []
+        for record in batch:
+            if isinstance(record, CarrierFileError):
+                self.counts[INVALID] += 1
+                yield Discrepancy(INVALID, "", "", "", str(record), None)
+            else:
+                records.append(record)
+
+        policies = {
+            policy.policy_number: policy
+            for policy in self._queryset()
+            .filter(policy_number__in=[record.policy_number for record in records])
+            .only("pk", "policy_number", *COMPARED_FIELDS)
+        }
+        changed = {}
+        for record in records:
+            self._seen.add(record.policy_number)
+            policy = policies.get(record.policy_number)
+            if policy is None:
+                self.counts[MISSING] += 1
+                yield Discrepancy(
+                    MISSING, record.policy_number, "", "", "", record.line
+                )
+                continue
+
+            self.counts["matched"] += 1
+            for field in COMPARED_FIELDS:
+                ours, theirs = getattr(policy, field), getattr(record, field)
+                if ours != theirs:
+                    self.counts[MISMATCH] += 1
+                    yield Discrepancy(
+                        MISMATCH, record.policy_number, field, ours, theirs,
+                        record.line,
+                    )
+                    setattr(policy, field, theirs)
+                    changed[policy.pk] = policy
+
+        if self.apply and changed:
+            with transaction.atomic():
+                InsurancePolicy.objects.bulk_update(
+                    changed.values(), COMPARED_FIELDS, batch_size=self.batch_size
+                )
+                # bulk_update sends no signals
+                invalidate_feeds(
+                    InsurancePolicy.objects.filter(pk__in=changed).values(
+                        "vehicle__user_id"
+                    )
+                )
+                queue_events((ReminderEvent.SOURCE_POLICY, pk) for pk in changed)
+            self.counts["updated"] += len(changed)
+
+    def _find_extra(self):
+        active = (
+            self._queryset()
+            .filter(coverage_start__lte=self.as_of, coverage_end__gt=self.as_of)
+            .values_list("policy_number", flat=True)
+            .iterator(chunk_size=self.batch_size)
+        )
+        for policy_number in active:
+            if policy_number not in self._seen:
+                self.counts[EXTRA] += 1
+                yield Discrepancy(EXTRA, policy_number, "", "", "", None)
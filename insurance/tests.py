@@ -5,7 +5,17 @@ from django.db import IntegrityError
 from vehicles.models import Vehicle
 from .models import InsurancePolicy
 from .forms import InsurancePolicyForm
+from .coverage import GAP, OVERLAP, find_coverage_issues, iter_fleet_coverage_issues
+from .reconcile import Reconciliation, read_csv, read_fixed_width
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from decimal import Decimal
+from io import StringIO
+import csv
 import datetime
+import os
+import tempfile
+from unittest import mock
 
 
 class InsuranceCreateViewTest(TestCase):
@@ -65,3 +75,234 @@ class InsuranceCreateViewTest(TestCase):
         # Should not create any insurance policy
         policy = InsurancePolicy.objects.filter(policy_number='SF123456789').first()
         self.assertIsNone(policy)
+
+
+class CoverageIssueDetectionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+
+    def create_policy(self, policy_number, start, end, vehicle=None):
+        return InsurancePolicy.objects.create(
+            user=self.user,
+            vehicle=vehicle or self.vehicle,
+            provider='State Farm',
+            policy_number=policy_number,
+            coverage_start=start,
+            coverage_end=end,
+            premium='1200.00'
+        )
+
+    def test_back_to_back_renewal_has_no_issues(self):
+        """Test that a renewal starting on the previous end date is continuous"""
+        self.create_policy('P1', datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        self.create_policy('P2', datetime.date(2024, 1, 1), datetime.date(2025, 1, 1))
+
+        issues = find_coverage_issues(InsurancePolicy.objects.all())
+        self.assertEqual(issues, [])
+
+    def test_gap_and_overlap_detected(self):
+        """Test that gaps and overlaps are found regardless of input order"""
+        self.create_policy('P3', datetime.date(2024, 6, 1), datetime.date(2025, 6, 1))
+        self.create_policy('P1', datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        self.create_policy('P2', datetime.date(2024, 3, 1), datetime.date(2024, 9, 1))
+
+        issues = find_coverage_issues(InsurancePolicy.objects.all())
+
+        self.assertEqual(len(issues), 2)
+        gap, overlap = issues
+        self.assertEqual(gap.kind, GAP)
+        self.assertEqual((gap.start, gap.end), (datetime.date(2024, 1, 1), datetime.date(2024, 3, 1)))
+        self.assertEqual(overlap.kind, OVERLAP)
+        self.assertEqual((overlap.start, overlap.end), (datetime.date(2024, 6, 1), datetime.date(2024, 9, 1)))
+        self.assertEqual(overlap.policies, ('P2', 'P3'))
+
+    def test_lapsed_coverage_reported_as_of_date(self):
+        """Test that coverage ending before as_of is reported as a trailing gap"""
+        self.create_policy('P1', datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+
+        issues = find_coverage_issues(
+            InsurancePolicy.objects.all(), as_of=datetime.date(2024, 2, 1)
+        )
+        self.assertEqual(len(issues), 1)
+        self.assertEqual(issues[0].kind, GAP)
+        self.assertEqual(issues[0].end, datetime.date(2024, 2, 1))
+
+    def test_fleet_sweep_groups_by_vehicle(self):
+        """Test that the fleet sweep never compares policies across vehicles"""
+        other_vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Honda',
+            model='Civic',
+            year=2019,
+            current_mileage=30000
+        )
+        self.create_policy('P1', datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        self.create_policy('P2', datetime.date(2023, 6, 1), datetime.date(2024, 6, 1), vehicle=other_vehicle)
+        self.create_policy('P3', datetime.date(2023, 9, 1), datetime.date(2024, 9, 1), vehicle=other_vehicle)
+
+        with self.assertNumQueries(1):
+            issues = list(iter_fleet_coverage_issues())
+
+        self.assertEqual(len(issues), 1)
+        self.assertEqual(issues[0].vehicle_id, other_vehicle.id)
+        self.assertEqual(issues[0].kind, OVERLAP)
+
+    def test_coverage_report_command(self):
+        """Test that the coverage report command writes one CSV row per issue"""
+        self.create_policy('P1', datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        self.create_policy('P2', datetime.date(2024, 2, 1), datetime.date(2025, 2, 1))
+        out = StringIO()
+
+        call_command('coverage_report', stdout=out, stderr=StringIO())
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'vehicle_id,kind,start,end,policies')
+        self.assertEqual(lines[1], f'{self.vehicle.id},gap,2024-01-01,2024-02-01,P1 P2')
+
+    def test_vehicle_detail_shows_coverage_issues(self):
+        """Test that coverage issues are displayed on the vehicle detail page"""
+        self.create_policy('P1', datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        self.create_policy('P2', datetime.date(2023, 6, 1), datetime.date(2024, 6, 1))
+        self.client.login(username='testuser', password='testpass123')
+
+        response = self.client.get(reverse('vehicles:vehicle_detail', kwargs={'pk': self.vehicle.pk}))
+
+        self.assertContains(response, 'Overlapping coverage')
+        self.assertEqual(len(response.context['coverage_issues']), 2)
+
+
+class CarrierReconciliationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        for number, premium in [('SF1', '1200.00'), ('SF2', '900.00'), ('SF3', '500.00')]:
+            InsurancePolicy.objects.create(
+                user=self.user,
+                vehicle=self.vehicle,
+                provider='State Farm',
+                policy_number=number,
+                coverage_start=datetime.date(2024, 1, 1),
+                coverage_end=datetime.date(2025, 1, 1),
+                premium=premium
+            )
+
+    def write_carrier_file(self, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def reconcile(self, path, *args):
+        out = StringIO()
+        call_command(
+            'reconcile_carrier_file', path, '--provider', 'State Farm',
+            '--as-of', '2024-06-01', *args, stdout=out, stderr=StringIO()
+        )
+        return list(csv.reader(out.getvalue().splitlines()))[1:]
+
+    def test_reports_missing_extra_and_mismatched_policies(self):
+        """Test that each kind of discrepancy is reported"""
+        path = self.write_carrier_file(
+            'policy_number,coverage_start,coverage_end,premium\n'
+            'SF1,2024-01-01,2025-01-01,1200.00\n'
+            'SF2,2024-01-01,2025-01-01,950.00\n'
+            'SF9,2024-01-01,2025-01-01,100.00\n'
+            'SF4,not-a-date,2025-01-01,100.00\n'
+        )
+
+        rows = self.reconcile(path)
+
+        kinds = sorted((row[0], row[1]) for row in rows)
+        self.assertEqual(
+            kinds,
+            [('extra', 'SF3'), ('invalid', ''), ('mismatch', 'SF2'), ('missing', 'SF9')]
+        )
+        mismatch = next(row for row in rows if row[0] == 'mismatch')
+        self.assertEqual(mismatch[2:5], ['premium', '900.00', '950.00'])
+        # Nothing is written without --apply
+        self.assertEqual(
+            InsurancePolicy.objects.get(policy_number='SF2').premium, Decimal('900.00')
+        )
+
+    def test_apply_updates_mismatched_fields(self):
+        """Test that --apply bulk updates dates and premiums from the carrier"""
+        path = self.write_carrier_file(
+            'policy_number,coverage_start,coverage_end,premium\n'
+            'SF2,20240101,20250301,950\n'
+        )
+
+        self.reconcile(path, '--apply')
+
+        policy = InsurancePolicy.objects.get(policy_number='SF2')
+        self.assertEqual(policy.premium, Decimal('950.00'))
+        self.assertEqual(policy.coverage_end, datetime.date(2025, 3, 1))
+
+    def test_wrongly_encoded_file_is_a_command_error(self):
+        """Test that a file that does not decode raises CommandError"""
+        handle = tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False)
+        with handle:
+            handle.write(
+                'policy_number,coverage_start,coverage_end,premium\n'
+                'SF1,2024-01-01,2025-01-01,1200.00\n'
+                'Société,2024-01-01,2025-01-01,1200.00\n'.encode('latin-1')
+            )
+        self.addCleanup(os.remove, handle.name)
+
+        with self.assertRaisesMessage(CommandError, 'Cannot decode'):
+            self.reconcile(handle.name)
+
+    def test_unknown_encoding_and_reconcile_errors_are_told_apart(self):
+        """Test that only a bad --encoding is reported as an unknown encoding"""
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        with handle:
+            handle.write('policy_number,coverage_start,coverage_end,premium\n')
+        self.addCleanup(os.remove, handle.name)
+
+        with self.assertRaisesMessage(CommandError, "Unknown encoding 'no-such-codec'"):
+            self.reconcile(handle.name, '--encoding', 'no-such-codec')
+        with mock.patch.object(Reconciliation, 'run', side_effect=KeyError('bug')):
+            with self.assertRaises(KeyError):
+                self.reconcile(handle.name)
+
+    def test_batches_lookups(self):
+        """Test that policy numbers are looked up one batch per query"""
+        records = read_csv(StringIO(
+            'policy_number,coverage_start,coverage_end,premium\n'
+            + ''.join(f'SF{i},2024-01-01,2025-01-01,1200.00\n' for i in range(1, 6))
+        ))
+        reconciliation = Reconciliation(records, batch_size=2)
+
+        with self.assertNumQueries(3):
+            list(reconciliation.run())
+        self.assertEqual(reconciliation.counts['lines'], 5)
+        self.assertEqual(reconciliation.counts['missing'], 2)
+
+    def test_fixed_width_reader(self):
+        """Test that fixed-width lines are parsed with the default layout"""
+        line = f"{'SF1':<20}2024-01-01202501010000001200.00\n"
+
+        record, = read_fixed_width(StringIO(line))
+
+        self.assertEqual(record.policy_number, 'SF1')
+        self.assertEqual(record.coverage_end, datetime.date(2025, 1, 1))
+        self.assertEqual(record.premium, Decimal('1200.00'))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.queue import queue_metrics
+from jobs.worker import MODES, Worker
+
+
+class Command(BaseCommand):
+    help = "Claim and run background jobs from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queue",
+            action="append",
+            dest="queues",
+            help="Queue to take jobs from; repeat for several (default: all).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of jobs run at the same time.",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=MODES,
+            default="thread",
+            help="Run jobs in threads (I/O-bound work) or processes (CPU-bound work).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once no due jobs are left instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        worker = Worker(
+            queues=options["queues"],
+            concurrency=options["concurrency"],
+            mode=options["mode"],
+            poll_interval=options["poll_interval"],
+            burst=options["burst"],
+        )
+        worker.run()
+        for metrics in queue_metrics():
+            self.stdout.write(
+                f"{metrics.queue}: {metrics.queued} queued, {metrics.running} running, "
+                f"{metrics.succeeded} succeeded, {metrics.failed} failed"
+            )
@@ -0,0 +1,13 @@
+"""Entry point of spawned worker processes.
+
+A spawned process imports this module before Django is set up, so it must
+not import models at module level.
+"""
+import django
+
+
+def main(index, queues, poll_interval, burst):
+    django.setup()
+    from .worker import run_loop
+
+    run_loop(index, queues, poll_interval, burst)
@@ -0,0 +1,279 @@
+"""A small job queue stored in the application database.
+
+Tasks are plain functions registered with :func:`task` in an app's
+``tasks`` module and queued with :func:`enqueue`. Workers claim due jobs
+with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it,
+and otherwise (SQLite) with a compare-and-swap ``UPDATE`` that only succeeds
+for the worker that still sees the job queued, so a job is never run twice
+concurrently. Failed jobs are retried with exponential backoff.
+
+A running job's ``locked_at`` is refreshed every ``HEARTBEAT_INTERVAL`` by
+a thread of its worker, so only jobs whose worker died go stale. Stale jobs
+are queued again, unless they have used up their attempts; a job that
+keeps killing its worker then fails instead of being retried forever.
+"""
+import logging
+import random
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 10  # seconds before the first retry, doubled on every attempt
+BACKOFF_MAX = 60 * 60
+STALE_AFTER = timedelta(minutes=30)
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+LOCK_RETRIES = 50
+
+TASKS = {}
+
+QueueMetrics = namedtuple(
+    "QueueMetrics",
+    [
+        "queue",
+        "queued",
+        "running",
+        "succeeded",
+        "failed",
+        "throughput",
+        "avg_wait",
+        "avg_runtime",
+        "lag",
+    ],
+)
+
+
+class UnknownTask(LookupError):
+    pass
+
+
+def task(func=None, *, name=None):
+    """Register ``func`` so it can be enqueued and run by workers."""
+
+    def register(func):
+        func.task_name = name or f"{func.__module__}.{func.__qualname__}"
+        TASKS[func.task_name] = func
+        return func
+
+    return register(func) if func is not None else register
+
+
+def enqueue(func, *args, queue="default", run_at=None, max_attempts=3, **kwargs):
+    """Queue a call of the registered task ``func`` (or its name)."""
+    name = getattr(func, "task_name", func)
+    if name not in TASKS:
+        raise UnknownTask(name)
+    return Job.objects.create(
+        queue=queue,
+        task=name,
+        args=list(args),
+        kwargs=kwargs,
+        max_attempts=max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying after ``attempts`` failed attempts."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _retry_locked(func, *args, **kwargs):
+    """Call ``func``, retrying while SQLite reports the database as locked.
+
+    SQLite allows a single writer; a worker that loses the race for the
+    write lock waits briefly instead of leaving its job in a wrong state.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as exc:
+            if "locked" not in str(exc) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(0.01 * (attempt + 1))
+
+
+def _update(pk, **fields):
+    return _retry_locked(Job.objects.filter(pk=pk).update, **fields)
+
+
+def _due(queues, now):
+    jobs = Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+    if queues:
+        jobs = jobs.filter(queue__in=queues)
+    return jobs.order_by("run_at", "id")
+
+
+def claim(worker_id, queues=None, now=None):
+    """Claim the next due job for ``worker_id`` and return it, or None."""
+    now = now or timezone.now()
+    claimed = {
+        "status": Job.STATUS_RUNNING,
+        "locked_by": worker_id,
+        "locked_at": now,
+        "started_at": now,
+        "attempts": F("attempts") + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _due(queues, now).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(**claimed)
+    else:
+        while True:
+            candidate = _retry_locked(
+                _due(queues, now).values_list("pk", flat=True).first
+            )
+            if candidate is None:
+                return None
+            swapped = _retry_locked(
+                Job.objects.filter(pk=candidate, status=Job.STATUS_QUEUED).update,
+                **claimed,
+            )
+            if swapped:
+                job = Job(pk=candidate)
+                break
+            # Another worker won the race for this job; try the next one
+    _retry_locked(job.refresh_from_db)
+    return job
+
+
+class Heartbeat(threading.Thread):
+    """Refresh the lock of a running job until stopped."""
+
+    def __init__(self, job, interval):
+        super().__init__(daemon=True)
+        self.job = job
+        self.interval = interval.total_seconds()
+        self.stopped = threading.Event()
+
+    def run(self):
+        jobs = Job.objects.filter(
+            pk=self.job.pk, status=Job.STATUS_RUNNING, locked_by=self.job.locked_by
+        )
+        try:
+            while not self.stopped.wait(self.interval):
+                _retry_locked(jobs.update, locked_at=timezone.now())
+        except Exception:
+            logger.exception("Heartbeat of job %s stopped", self.job.pk)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def execute(job):
+    """Run a claimed job and record its outcome; returns True on success."""
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            raise UnknownTask(job.task)
+        heartbeat = Heartbeat(job, HEARTBEAT_INTERVAL)
+        heartbeat.start()
+        try:
+            func(*job.args, **job.kwargs)
+        finally:
+            heartbeat.stop()
+    except Exception:
+        finished = timezone.now()
+        update = {"finished_at": finished, "last_error": traceback.format_exc()}
+        if job.attempts < job.max_attempts:
+            update.update(
+                status=Job.STATUS_QUEUED,
+                run_at=finished + timedelta(seconds=backoff(job.attempts)),
+                locked_by="",
+                locked_at=None,
+            )
+        else:
+            update["status"] = Job.STATUS_FAILED
+        _update(job.pk, **update)
+        return False
+    _update(
+        job.pk, status=Job.STATUS_SUCCEEDED, finished_at=timezone.now(), last_error=""
+    )
+    return True
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Return jobs whose worker died mid-run to the queue.
+
+    Jobs that have no attempts left are marked failed instead. Returns the
+    number of jobs queued again.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=now - older_than)
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.STATUS_FAILED,
+        finished_at=now,
+        last_error="The worker stopped while running the job.",
+        locked_by="",
+        locked_at=None,
+    )
+    return stale.update(status=Job.STATUS_QUEUED, locked_by="", locked_at=None)
+
+
+def queue_metrics(window=timedelta(minutes=15), now=None):
+    """Return per-queue counts, throughput (jobs/s), latency and lag.
+
+    ``avg_wait`` is the time from a job becoming due to being started and
+    ``avg_runtime`` the time it ran, both over jobs finished in ``window``;
+    ``lag`` is how long the oldest due job has been waiting.
+    """
+    now = now or timezone.now()
+    counts = {}
+    rows = Job.objects.order_by().values("queue", "status").annotate(n=Count("pk"))
+    for row in rows:
+        counts.setdefault(row["queue"], {})[row["status"]] = row["n"]
+
+    def duration(start, end):
+        return ExpressionWrapper(F(end) - F(start), output_field=DurationField())
+
+    recent = {
+        row["queue"]: row
+        for row in Job.objects.filter(finished_at__gte=now - window)
+        .order_by()
+        .values("queue")
+        .annotate(
+            finished=Count("pk"),
+            avg_wait=Avg(duration("run_at", "started_at")),
+            avg_runtime=Avg(duration("started_at", "finished_at")),
+        )
+    }
+    oldest = dict(
+        Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+        .order_by()
+        .values("queue")
+        .annotate(oldest=Min("run_at"))
+        .values_list("queue", "oldest")
+    )
+    metrics = []
+    for queue in sorted(counts):
+        by_status = counts[queue]
+        stats = recent.get(queue, {})
+        metrics.append(
+            QueueMetrics(
+                queue=queue,
+                queued=by_status.get(Job.STATUS_QUEUED, 0),
+                running=by_status.get(Job.STATUS_RUNNING, 0),
+                succeeded=by_status.get(Job.STATUS_SUCCEEDED, 0),
+                failed=by_status.get(Job.STATUS_FAILED, 0),
+                throughput=stats.get("finished", 0) / window.total_seconds(),
+                avg_wait=stats.get("avg_wait"),
+                avg_runtime=stats.get("avg_runtime"),
+                lag=now - oldest[queue] if queue in oldest else timedelta(0),
+            )
+        )
+    return metrics
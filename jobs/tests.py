@@ -0,0 +1,201 @@
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from .models import Job
+from .queue import UnknownTask, claim, enqueue, execute, queue_metrics, requeue_stale, task
+from .worker import Worker, run_loop
+
+calls = []
+calls_lock = threading.Lock()
+
+
+@task(name="jobs.tests.record")
+def record(value, suffix=""):
+    with calls_lock:
+        calls.append(f"{value}{suffix}")
+
+
+@task(name="jobs.tests.linger")
+def linger(seconds):
+    time.sleep(seconds)
+
+
+@task(name="jobs.tests.explode")
+def explode():
+    raise RuntimeError("boom")
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_requires_registered_task(self):
+        """Test that only registered tasks can be queued"""
+        with self.assertRaises(UnknownTask):
+            enqueue("jobs.tests.missing")
+
+        job = enqueue(record, 1, suffix="!", queue="imports")
+
+        self.assertEqual(job.task, "jobs.tests.record")
+        self.assertEqual(job.queue, "imports")
+        self.assertEqual((job.args, job.kwargs), ([1], {"suffix": "!"}))
+
+    def test_claim_and_execute(self):
+        """Test that a claimed job runs once and is marked succeeded"""
+        job = enqueue(record, "a", suffix="b")
+
+        claimed = claim("worker-1")
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, Job.STATUS_RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim("worker-2"))
+
+        self.assertTrue(execute(claimed))
+        self.assertEqual(calls, ["ab"])
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, Job.STATUS_SUCCEEDED)
+
+    def test_claim_respects_queue_and_run_at(self):
+        """Test that workers only claim due jobs from their queues"""
+        enqueue(record, 1, run_at=timezone.now() + timedelta(hours=1))
+        other = enqueue(record, 2, queue="reports")
+        due = enqueue(record, 3)
+
+        self.assertEqual(claim("w", queues=["default"]).pk, due.pk)
+        self.assertIsNone(claim("w", queues=["default"]))
+        self.assertEqual(claim("w").pk, other.pk)
+
+    def test_failed_job_retries_with_backoff(self):
+        """Test that failures are retried later until attempts run out"""
+        job = enqueue(explode, max_attempts=2)
+
+        self.assertFalse(execute(claim("w")))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=7))
+        self.assertIn("RuntimeError: boom", job.last_error)
+        self.assertIsNone(claim("w"))
+
+        self.assertFalse(execute(claim("w", now=job.run_at)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_jobs_are_requeued(self):
+        """Test that jobs left running by a dead worker are returned"""
+        two_hours_ago = timezone.now() - timedelta(hours=2)
+        job = enqueue(record, 1, run_at=two_hours_ago)
+        claim("w", now=two_hours_ago)
+
+        self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+
+    def test_stale_jobs_without_attempts_left_fail(self):
+        """Test that a stale job that used its last attempt is not requeued"""
+        two_hours_ago = timezone.now() - timedelta(hours=2)
+        job = enqueue(record, 1, run_at=two_hours_ago, max_attempts=1)
+        claim("w", now=two_hours_ago)
+
+        self.assertEqual(requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIsNone(claim("w"))
+
+    def test_loop_requeues_stale_jobs_periodically(self):
+        """Test that a running loop returns jobs of dead workers to the queue"""
+        two_hours_ago = timezone.now() - timedelta(hours=2)
+        enqueue(record, "stale", run_at=two_hours_ago)
+        claim("dead-worker", now=two_hours_ago)
+
+        with mock.patch("jobs.worker.REQUEUE_INTERVAL", timedelta(0)):
+            self.assertEqual(run_loop(0, burst=True), 1)
+
+        self.assertEqual(calls, ["stale"])
+
+    def test_burst_loop_drains_queue(self):
+        """Test that a burst worker runs every due job then stops"""
+        for value in range(5):
+            enqueue(record, value)
+
+        self.assertEqual(run_loop(0, burst=True), 5)
+        self.assertEqual(sorted(calls), ["0", "1", "2", "3", "4"])
+
+    def test_queue_metrics(self):
+        """Test per-queue counts, throughput and lag"""
+        now = timezone.now()
+        enqueue(record, 1, run_at=now - timedelta(minutes=5))
+        enqueue(record, 2, queue="reports")
+        execute(claim("w", queues=["reports"]))
+
+        metrics = {m.queue: m for m in queue_metrics(now=timezone.now())}
+
+        self.assertEqual(metrics["default"].queued, 1)
+        self.assertGreaterEqual(metrics["default"].lag, timedelta(minutes=5))
+        self.assertEqual(metrics["reports"].succeeded, 1)
+        self.assertGreater(metrics["reports"].throughput, 0)
+        self.assertIsNotNone(metrics["reports"].avg_runtime)
+
+    def test_metrics_view_is_staff_only(self):
+        """Test that queue metrics are served to staff only"""
+        enqueue(record, 1)
+        User.objects.create_user(username="user", password="testpass123")
+        User.objects.create_user(username="staff", password="testpass123", is_staff=True)
+        url = reverse("jobs:metrics")
+
+        self.client.login(username="user", password="testpass123")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.login(username="staff", password="testpass123")
+        data = self.client.get(url).json()
+        self.assertEqual(data["queues"][0]["queue"], "default")
+        self.assertEqual(data["queues"][0]["queued"], 1)
+
+
+class WorkerConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_threads_run_each_job_exactly_once(self):
+        """Test that concurrent workers never run a job twice"""
+        for value in range(30):
+            enqueue(record, value)
+
+        Worker(concurrency=4, mode="thread", burst=True).run()
+
+        self.assertEqual(sorted(calls, key=int), [str(value) for value in range(30)])
+        self.assertEqual(Job.objects.filter(status=Job.STATUS_SUCCEEDED).count(), 30)
+
+    def test_heartbeat_keeps_long_jobs_from_going_stale(self):
+        """Test that a running job's lock is refreshed while it runs"""
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        enqueue(linger, 0.5, run_at=an_hour_ago)
+        job = claim("w", now=an_hour_ago)
+
+        with mock.patch("jobs.queue.HEARTBEAT_INTERVAL", timedelta(seconds=0.1)):
+            runner = threading.Thread(target=execute, args=(job,))
+            runner.start()
+            time.sleep(0.3)
+            requeued = requeue_stale(older_than=timedelta(minutes=30))
+            runner.join()
+
+        self.assertEqual(requeued, 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+
+    def test_run_worker_command(self):
+        """Test that run_worker --burst processes the queue and reports it"""
+        enqueue(record, 1)
+        enqueue(record, 2)
+
+        with self.settings(DEBUG=False):
+            call_command("run_worker", "--burst", "--concurrency", "2", stdout=open("/dev/null", "w"))
+
+        self.assertEqual(sorted(calls), ["1", "2"])
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import queue_metrics_view
+
+urlpatterns = [
+    path("metrics/", queue_metrics_view, name="metrics"),
+]
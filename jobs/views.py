@@ -0,0 +1,33 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .queue import queue_metrics
+
+
+def _seconds(value):
+    return round(value.total_seconds(), 3) if value is not None else None
+
+
+@staff_member_required
+@require_GET
+def queue_metrics_view(request):
+    """Per-queue job counts, throughput (jobs/s), latency and lag in seconds."""
+    return JsonResponse(
+        {
+            "queues": [
+                {
+                    "queue": metrics.queue,
+                    "queued": metrics.queued,
+                    "running": metrics.running,
+                    "succeeded": metrics.succeeded,
+                    "failed": metrics.failed,
+                    "throughput": round(metrics.throughput, 4),
+                    "avg_wait": _seconds(metrics.avg_wait),
+                    "avg_runtime": _seconds(metrics.avg_runtime),
+                    "lag": _seconds(metrics.lag),
+                }
+                for metrics in queue_metrics()
+            ]
+        }
+    )
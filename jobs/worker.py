@@ -0,0 +1,107 @@
+"""Worker loops that claim and run jobs, in threads or in processes."""
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from django.db import close_old_connections, connection
+
+from . import process
+from .queue import STALE_AFTER, claim, execute, requeue_stale
+
+logger = logging.getLogger(__name__)
+
+MODES = ("thread", "process")
+# How often each loop returns jobs of dead workers to the queue
+REQUEUE_INTERVAL = STALE_AFTER / 2
+
+
+def worker_id(index):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def run_loop(index, queues=None, poll_interval=1.0, burst=False, stop=None):
+    """Claim and run jobs until ``stop`` is set, or until idle with ``burst``.
+
+    Every ``REQUEUE_INTERVAL`` the loop also requeues stale jobs, so that a
+    job whose worker died is picked up again without restarting the pool.
+    Returns the number of jobs run.
+    """
+    identity = worker_id(index)
+    processed = 0
+    requeued_at = time.monotonic()
+    try:
+        while stop is None or not stop.is_set():
+            close_old_connections()
+            if time.monotonic() - requeued_at >= REQUEUE_INTERVAL.total_seconds():
+                requeued_at = time.monotonic()
+                requeue_stale()
+            job = claim(identity, queues)
+            if job is None:
+                if burst:
+                    break
+                time.sleep(poll_interval)
+                continue
+            ok = execute(job)
+            processed += 1
+            logger.info(
+                "%s %s job %s (%s) attempt %s",
+                identity,
+                "finished" if ok else "failed",
+                job.pk,
+                job.task,
+                job.attempts,
+            )
+    finally:
+        connection.close()
+    return processed
+
+
+class Worker:
+    """Run ``concurrency`` job loops as threads or spawned processes."""
+
+    def __init__(
+        self, queues=None, concurrency=1, mode="thread", poll_interval=1.0, burst=False
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}.")
+        self.queues = queues or None
+        self.concurrency = concurrency
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.stop = threading.Event()
+
+    def run(self):
+        requeue_stale()
+        args = (self.queues, self.poll_interval, self.burst)
+        if self.mode == "process":
+            # Spawned so no process inherits the parent's database connection
+            context = multiprocessing.get_context("spawn")
+            workers = [
+                context.Process(target=process.main, args=(index, *args), daemon=True)
+                for index in range(self.concurrency)
+            ]
+        else:
+            workers = [
+                threading.Thread(
+                    target=run_loop,
+                    args=(index, *args),
+                    kwargs={"stop": self.stop},
+                    daemon=True,
+                )
+                for index in range(self.concurrency)
+            ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.stop.set()
+            for worker in workers:
+                if self.mode == "process":
+                    worker.terminate()
+                worker.join()
@@ -0,0 +1,33 @@
+"""Cache backends that count hits and misses for ``/metrics``."""
+from django.core.cache.backends.locmem import LocMemCache
+
+from .metrics import registry
+
+_missing = object()
+
+
+class InstrumentedCacheMixin:
+    """Count every ``get`` (and so ``get_many`` and ``get_or_set``) by result.
+
+    The ``cache`` label is the ``METRICS_LABEL`` key of the cache's entry in
+    ``CACHES``, which defaults to the backend class name.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        label = params.get("METRICS_LABEL") or type(self).__name__
+        self._labels = {
+            result: (("cache", label), ("result", result)) for result in ("hit", "miss")
+        }
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if value is _missing:
+            registry.inc("cache_requests_total", self._labels["miss"])
+            return default
+        registry.inc("cache_requests_total", self._labels["hit"])
+        return value
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
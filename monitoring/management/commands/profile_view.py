@@ -0,0 +1,72 @@
+import pstats
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from monitoring.profiling import CATEGORIES, profiling, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a GET request as a user under cProfile and print the hottest "
+        "functions, split into ORM, template, view and other code."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Path to request, e.g. /vehicles/12/.")
+        parser.add_argument("--user", help="Username to request the page as.")
+        parser.add_argument(
+            "--repeat", type=int, default=10, help="Profiled requests (default 10)."
+        )
+        parser.add_argument(
+            "--limit", type=int, default=10, help="Functions listed per category."
+        )
+        parser.add_argument(
+            "--host", default="localhost", help="Host header sent with the requests."
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be positive.")
+        if options["limit"] < 0:
+            raise CommandError("--limit must not be negative.")
+        client = Client(HTTP_HOST=options["host"])
+        if options["user"]:
+            User = get_user_model()
+            try:
+                client.force_login(User._default_manager.get_by_natural_key(options["user"]))
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']!r}.")
+
+        # The first request compiles templates and fills caches; it is not profiled
+        response = client.get(options["url"])
+        if response.status_code != 200:
+            raise CommandError(f"{options['url']} answered {response.status_code}.")
+
+        with profiling() as profiler:
+            if profiler is None:
+                raise CommandError("Another profile is running in this process.")
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                client.get(options["url"])
+            elapsed = time.perf_counter() - started
+
+        summary = summarize(
+            pstats.Stats(profiler), limit=options["limit"], per_call=options["repeat"]
+        )
+        self.stdout.write(
+            f"{options['url']}: {elapsed / options['repeat'] * 1000:.1f} ms per request "
+            f"over {options['repeat']} request(s)"
+        )
+        for name in CATEGORIES:
+            share = summary.by_category[name] / summary.total if summary.total else 0
+            self.stdout.write(
+                f"\n{name.upper()}: {summary.by_category[name] * 1000:.1f} ms ({share:.0%})"
+            )
+            for function in summary.hottest[name]:
+                self.stdout.write(
+                    f"  {function.tottime * 1000:8.2f} ms own {function.cumtime * 1000:8.2f} ms "
+                    f"total {function.calls:6d} calls  {function.name}"
+                )
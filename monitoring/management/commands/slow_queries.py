@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.slow_queries import read_log, reset_log
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the slowest query fingerprints logged by every process, by total "
+        "time, with their call sites and query plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Fingerprints to print (default 20)."
+        )
+        parser.add_argument(
+            "--no-plans", action="store_true", help="Leave out the query plans."
+        )
+        parser.add_argument(
+            "--reset", action="store_true", help="Delete the logs after printing them."
+        )
+
+    def handle(self, *args, **options):
+        if options["limit"] < 1:
+            raise CommandError("--limit must be positive.")
+        queries = read_log(options["limit"])
+        if not queries:
+            self.stdout.write("No slow queries logged.")
+        for query in queries:
+            self.stdout.write(
+                f"{query.fingerprint}  {query.count} call(s), "
+                f"{query.total_time * 1000:.1f} ms total, "
+                f"{query.total_time / query.count * 1000:.1f} ms mean, "
+                f"{query.max_time * 1000:.1f} ms max"
+            )
+            self.stdout.write(f"  {query.sql}")
+            self.stdout.write(f"  params: {query.params or '-'}")
+            self.stdout.write(
+                f"  view: {query.view or '-'}  code: {query.location or '-'}  "
+                f"template: {query.template or '-'}"
+            )
+            if query.plan and not options["no_plans"]:
+                for line in query.plan:
+                    self.stdout.write(f"  plan: {line}")
+            self.stdout.write("")
+        if options["reset"]:
+            reset_log()
+            self.stdout.write("Slow query logs cleared.")
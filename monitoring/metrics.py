@@ -0,0 +1,387 @@
+"""Prometheus metrics aggregated across worker processes.
+
+Counters and histograms are kept in process memory, so recording a value
+costs a dictionary update under a lock. Each process writes its values to
+``METRICS_ROOT/<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL``
+seconds (from the request path, and on exit), and ``/metrics`` sums the
+files of every process, so the totals stay right under a prefork server
+whatever worker answers the scrape. Files of exited workers cannot simply
+be dropped, since counters would go backwards: a scrape folds them into a
+single ``retired.json``, under a file lock so that no file is added twice.
+A forked child starts from zero rather than counting its parent's values
+again, and a process that reuses the pid of an exited one whose file was
+not folded in yet carries on from it.
+
+Job lag is read from the job table when scraped; everything else is
+recorded by :class:`MetricsMiddleware`, the instrumented cache backend in
+``monitoring.cache`` and the template backend in
+``monitoring.template_backend``.
+"""
+import atexit
+import json
+import math
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import locks
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+Metric = namedtuple("Metric", ["kind", "help", "buckets"])
+
+RETIRED = "retired"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+METRICS = {
+    "http_request_duration_seconds": Metric(
+        "histogram", "Time to answer a request, by URL name.", LATENCY_BUCKETS
+    ),
+    "http_request_db_queries": Metric(
+        "histogram", "Database queries run per request, by URL name.", QUERY_BUCKETS
+    ),
+    "sessions_loaded_total": Metric("counter", "Stored sessions loaded by requests.", None),
+    "cache_requests_total": Metric("counter", "Cache lookups, by cache and result.", None),
+    "template_render_seconds": Metric(
+        "histogram", "Time to render a top-level template, by name.", LATENCY_BUCKETS
+    ),
+    "auth_throttle_attempts_total": Metric(
+        "counter", "Login and registration attempts, by throttle outcome.", None
+    ),
+}
+
+
+class Registry:
+    """The counters and histograms of this process."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        # Held while writing the file, never while recording
+        self.write_lock = threading.Lock()
+        # (name, labels) -> value, or [per-bucket counts..., +Inf count, sum]
+        self.values = {}
+        self.flushed_at = 0.0
+        self.restored = False
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name].buckets
+        key = (name, labels)
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [name, list(labels), value if isinstance(value, (int, float)) else list(value)]
+                for (name, labels), value in self.values.items()
+            ]
+
+    def _restore(self, path):
+        """Carry on from the file of an exited process that had our pid."""
+        self.restored = True
+        try:
+            series = json.loads(path.read_text())["series"]
+        except (OSError, ValueError, KeyError):
+            return
+        values = {}
+        _merge(values, series)
+        with self.lock:
+            for key, value in values.items():
+                current = self.values.get(key)
+                if current is None:
+                    self.values[key] = value
+                elif isinstance(current, list):
+                    self.values[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    self.values[key] = current + value
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self.write_lock:
+            self.flushed_at = now
+            root = Path(settings.METRICS_ROOT)
+            root.mkdir(parents=True, exist_ok=True)
+            path = root / f"{os.getpid()}.json"
+            if not self.restored and path.exists():
+                self._restore(path)
+            self.restored = True
+            series = self._with_throttle(self.snapshot())
+            fd, temporary = tempfile.mkstemp(
+                dir=root, prefix=f"{path.stem}.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "w") as handle:
+                    json.dump({"series": series}, handle)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+
+    @staticmethod
+    def _with_throttle(series):
+        # The throttle keeps its own per-process counters
+        from registration.throttle import throttle_metrics
+
+        for outcome, count in sorted(throttle_metrics().items()):
+            series.append(["auth_throttle_attempts_total", [["outcome", outcome]], count])
+        return series
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.reset)
+
+
+@atexit.register
+def _flush_on_exit():
+    if registry.values and settings.configured:
+        try:
+            registry.flush(force=True)
+        except OSError:
+            pass
+
+
+def _merge(totals, series):
+    for name, labels, value in series:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        current = totals.get(key)
+        if current is None:
+            totals[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            totals[key] = [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = current + value
+
+
+def process_exited(pid):
+    """Whether no process with ``pid`` is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # Running, under another user
+        return False
+    return False
+
+
+def _read_series(path):
+    try:
+        return json.loads(path.read_text())["series"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _as_series(totals):
+    return [
+        [name, [list(pair) for pair in labels], value]
+        for (name, labels), value in totals.items()
+    ]
+
+
+def retire_exited(root):
+    """Fold the files of exited processes into ``retired.json``."""
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / "lock", "a") as handle:
+        locks.lock(handle, locks.LOCK_EX)
+        try:
+            exited = [
+                path
+                for path in root.glob("*.json")
+                if path.stem.isdigit() and process_exited(int(path.stem))
+            ]
+            if not exited:
+                return
+            retired = root / f"{RETIRED}.json"
+            totals = {}
+            for path in [retired, *exited]:
+                _merge(totals, _read_series(path) or [])
+            temporary = retired.with_suffix(".tmp")
+            temporary.write_text(json.dumps({"series": _as_series(totals)}))
+            os.replace(temporary, retired)
+            for path in exited:
+                path.unlink(missing_ok=True)
+        finally:
+            locks.unlock(handle)
+
+
+def collect():
+    """Sum the metrics of every process; returns ``{(name, labels): value}``."""
+    registry.flush(force=True)
+    root = Path(settings.METRICS_ROOT)
+    retire_exited(root)
+    totals = {}
+    for path in root.glob("*.json"):
+        series = _read_series(path)
+        if series is not None:
+            _merge(totals, series)
+    return totals
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render(totals, gauges=()):
+    """Format ``totals`` and ``(name, help, [(labels, value)])`` gauges as text."""
+    lines = []
+    by_name = {}
+    for (name, labels), value in sorted(totals.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, metric in METRICS.items():
+        if name not in by_name:
+            continue
+        _header(lines, name, metric.kind, metric.help)
+        for labels, value in by_name[name]:
+            if metric.kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*metric.buckets, math.inf), value[:-1]):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_labels(labels, [('le', _number(float(bound)))])} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    for name, help_text, samples in gauges:
+        _header(lines, name, "gauge", help_text)
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def cache_hit_ratio(totals):
+    """``[(labels, ratio)]`` per cache from the summed lookup counters."""
+    lookups = {}
+    for (name, labels), value in totals.items():
+        if name != "cache_requests_total":
+            continue
+        labels = dict(labels)
+        counts = lookups.setdefault(labels.get("cache", ""), [0, 0])
+        counts[labels.get("result") == "hit"] += value
+    return [
+        ((("cache", cache),), hits / (hits + misses))
+        for cache, (misses, hits) in sorted(lookups.items())
+        if hits + misses
+    ]
+
+
+def job_gauges():
+    from jobs.queue import queue_metrics
+
+    queues = queue_metrics()
+    return [
+        (
+            "jobs_queued",
+            "Jobs waiting in each queue.",
+            [((("queue", metrics.queue),), metrics.queued) for metrics in queues],
+        ),
+        (
+            "jobs_lag_seconds",
+            "How long the oldest due job of each queue has waited.",
+            [
+                (
+                    (("queue", metrics.queue),),
+                    metrics.lag.total_seconds() if metrics.lag is not None else 0,
+                )
+                for metrics in queues
+            ],
+        ),
+    ]
+
+
+def exposition():
+    """The text served at ``/metrics``."""
+    totals = collect()
+    gauges = [
+        ("cache_hit_ratio", "Share of cache lookups that hit.", cache_hit_ratio(totals)),
+        *job_gauges(),
+    ]
+    return render(totals, gauges)
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Record latency, query count and session loads of every request.
+
+    Goes first, so that the time of the other middleware is included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        labels = (("url_name", match.view_name if match else "unresolved"),)
+        registry.observe("http_request_duration_seconds", elapsed, labels)
+        registry.observe("http_request_db_queries", counter.count, labels)
+        session = getattr(request, "session", None)
+        if session is not None and session.accessed and session.session_key:
+            registry.inc("sessions_loaded_total")
+        try:
+            registry.flush()
+        except OSError:
+            # The counters are kept in memory and written by a later flush
+            logger.exception("Could not write the metrics of process %s", os.getpid())
+        return response
@@ -0,0 +1,240 @@
+"""On-demand cProfile of single requests.
+
+:class:`ProfilingMiddleware` profiles a request when a staff user sends the
+``PROFILE_HEADER`` header, or at random for ``PROFILE_SAMPLE_RATE`` of all
+requests. The rest of the middleware stack, the view and the template
+rendering run under the profiler; the stats are written with
+``pstats.dump_stats`` to ``PROFILE_ROOT`` next to a JSON file naming the URL,
+the user, the status and the duration. Unprofiled requests pay for one
+header lookup and, with sampling on, one random number.
+
+Only one cProfile profiler can be active at a time, so a process profiles
+one request at a time and serves the others unprofiled while it is busy.
+
+:func:`summarize` splits a profile into ORM, template, view (code of this
+project) and other time. Built-in functions, such as the database driver's
+``execute``, are charged to the category of the caller they spent the most
+time under.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("orm", "template", "view", "other")
+METADATA_SUFFIX = ".json"
+STATS_SUFFIX = ".prof"
+
+FunctionStat = namedtuple("FunctionStat", ["name", "calls", "tottime", "cumtime"])
+Summary = namedtuple("Summary", ["total", "by_category", "hottest"])
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def profiling():
+    """Profile the block; yields the profiler, or None if one is running."""
+    if not _lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+    finally:
+        _lock.release()
+
+
+def profile_root():
+    return Path(settings.PROFILE_ROOT)
+
+
+def _slug(value):
+    return "".join(c if c.isalnum() or c in "-_" else "-" for c in value)[:60] or "-"
+
+
+def save_profile(profiler, metadata):
+    """Write the stats and ``metadata`` of a profile; return its id.
+
+    Returns None, after logging why, if the profile cannot be written: a
+    full disk or a bad ``PROFILE_ROOT`` must not fail the request.
+    """
+    try:
+        return _write_profile(profiler, metadata)
+    except OSError:
+        logger.exception("Could not save the profile of %s", metadata.get("path"))
+        return None
+
+
+def _write_profile(profiler, metadata):
+    root = profile_root()
+    root.mkdir(parents=True, exist_ok=True)
+    created = timezone.now()
+    profile_id = "-".join(
+        [
+            created.strftime("%Y%m%dT%H%M%S%f"),
+            _slug(metadata.get("url_name") or "unresolved"),
+            str(os.getpid()),
+        ]
+    )
+    profiler.dump_stats(root / f"{profile_id}{STATS_SUFFIX}")
+    (root / f"{profile_id}{METADATA_SUFFIX}").write_text(
+        json.dumps({"id": profile_id, "created": created.isoformat(), **metadata})
+    )
+    _prune(root)
+    return profile_id
+
+
+def _prune(root):
+    """Remove the oldest profiles beyond ``PROFILE_MAX_FILES``."""
+    profiles = sorted(root.glob(f"*{METADATA_SUFFIX}"))
+    for metadata in profiles[: max(0, len(profiles) - settings.PROFILE_MAX_FILES)]:
+        metadata.unlink(missing_ok=True)
+        metadata.with_suffix(STATS_SUFFIX).unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first."""
+    profiles = []
+    for path in sorted(profile_root().glob(f"*{METADATA_SUFFIX}"), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def load_profile(profile_id):
+    """Return the ``pstats.Stats`` of a stored profile."""
+    path = profile_root() / f"{_slug(profile_id)}{STATS_SUFFIX}"
+    return pstats.Stats(str(path))
+
+
+def category(filename):
+    path = filename.replace(os.sep, "/")
+    if "/django/db/" in path:
+        return "orm"
+    if "/django/template/" in path or "/django/templatetags/" in path:
+        return "template"
+    if path.startswith(str(settings.BASE_DIR)) and "site-packages" not in path:
+        return "view"
+    return "other"
+
+
+def _categorize(raw):
+    """Map every function in ``pstats`` raw stats to a category."""
+    categories = {}
+
+    def resolve(func, seen):
+        if func in categories:
+            return categories[func]
+        filename = func[0]
+        if filename != "~":
+            result = category(filename)
+        else:
+            # Built-ins take the category of the caller they spent most time under
+            callers = raw.get(func, (0, 0, 0, 0, {}))[4]
+            candidates = [caller for caller in callers if caller not in seen]
+            if not candidates:
+                result = "other"
+            else:
+                caller = max(candidates, key=lambda c: callers[c][2])
+                result = resolve(caller, seen | {func})
+        categories[func] = result
+        return result
+
+    for func in raw:
+        resolve(func, frozenset())
+    return categories
+
+
+def _name(func):
+    filename, line, function = func
+    if filename == "~":
+        return function
+    return f"{Path(filename).name}:{line}({function})"
+
+
+def summarize(stats, limit=10, per_call=1):
+    """Split ``stats`` by category; times are divided by ``per_call``.
+
+    Returns :class:`Summary` with the total own time, the own time of each
+    category and its ``limit`` hottest functions by own time.
+    """
+    raw = stats.stats
+    categories = _categorize(raw)
+    by_category = dict.fromkeys(CATEGORIES, 0.0)
+    functions = {name: [] for name in CATEGORIES}
+    for func, (_cc, calls, tottime, cumtime, _callers) in raw.items():
+        name = categories[func]
+        by_category[name] += tottime / per_call
+        functions[name].append(
+            FunctionStat(
+                _name(func), calls // per_call, tottime / per_call, cumtime / per_call
+            )
+        )
+    hottest = {
+        name: sorted(items, key=lambda item: item.tottime, reverse=True)[:limit]
+        for name, items in functions.items()
+    }
+    return Summary(sum(by_category.values()), by_category, hottest)
+
+
+def should_profile(request):
+    if request.headers.get(settings.PROFILE_HEADER):
+        user = getattr(request, "user", None)
+        return bool(user and user.is_staff)
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class ProfilingMiddleware:
+    """Profile staff-requested or sampled requests to ``PROFILE_ROOT``.
+
+    Must come after ``AuthenticationMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+        with profiling() as profiler:
+            if profiler is None:
+                return self.get_response(request)
+            started = time.perf_counter()
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        user = request.user
+        profile_id = save_profile(
+            profiler,
+            {
+                "method": request.method,
+                "path": request.path,
+                "url_name": match.view_name if match else None,
+                "user_id": user.pk,
+                "username": user.get_username(),
+                "status": response.status_code,
+                "duration": round(elapsed, 6),
+            },
+        )
+        if profile_id and request.headers.get(settings.PROFILE_HEADER):
+            response["X-Profile-Id"] = profile_id
+        return response
@@ -0,0 +1,350 @@
+"""Log of slow database queries, aggregated by fingerprint.
+
+:class:`SlowQueryMiddleware` installs an execute wrapper on every database
+connection for the duration of a request. Queries taking longer than
+``SLOW_QUERY_THRESHOLD_MS`` are normalised into a fingerprint (literals
+and ``IN`` lists stripped) and added to an in-process ring buffer of the
+``SLOW_QUERY_LOG_SIZE`` most recently seen fingerprints, with their count,
+total and worst time, the shape of their parameters, the view, the line of
+project code and the template line that ran them, and the query plan from
+``EXPLAIN QUERY PLAN`` (taken once per fingerprint). Fast queries only pay
+for two clock reads.
+
+Recording a query only updates the buffer. Each process writes it to
+``SLOW_QUERY_ROOT/<pid>.json`` at most every ``SLOW_QUERY_FLUSH_INTERVAL``
+seconds, after a request and on exit, so :func:`read_log` can merge the
+logs of every worker for the staff page and the ``slow_queries`` command.
+Logs of processes that have exited are folded into ``retired.json`` when
+read, keeping the ``SLOW_QUERY_LOG_SIZE`` most recently seen fingerprints.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import ExitStack, nullcontext
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import locks
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .metrics import process_exited
+
+logger = logging.getLogger(__name__)
+
+RETIRED = "retired"
+
+SlowQuery = namedtuple(
+    "SlowQuery",
+    [
+        "fingerprint", "sql", "params", "count", "total_time", "max_time",
+        "view", "location", "template", "plan", "last_seen",
+    ],
+)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+_log = OrderedDict()
+_lock = threading.Lock()
+# Held while writing the log to disk, never while recording
+_write_lock = threading.Lock()
+_state = {"dirty": False, "flushed_at": 0.0}
+_explaining = threading.local()
+
+
+def normalize(sql):
+    """Strip literals and collapse ``IN`` lists so equivalent queries match."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+
+def params_shape(params, many):
+    """Describe parameters by type, e.g. ``int x3, str``."""
+    if many:
+        rows = list(params or [])
+        return f"{len(rows)} row(s) of ({params_shape(rows[0], False) if rows else ''})"
+    if isinstance(params, dict):
+        return ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items())
+    runs = []
+    for value in params or ():
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return ", ".join(name if count == 1 else f"{name} x{count}" for name, count in runs)
+
+
+def _call_site():
+    """Return ``(code location, template line)`` of the current query."""
+    base = str(settings.BASE_DIR)
+    here = os.path.dirname(__file__)
+    location = template = None
+    frame = sys._getframe(2)
+    while frame is not None and not (location and template):
+        code = frame.f_code
+        filename = code.co_filename
+        if code.co_name == "_get_response" and "/django/core/handlers/" in filename:
+            # Frames beyond the view call are middleware
+            break
+        if template is None and code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            token = getattr(node, "token", None)
+            origin = getattr(node, "origin", None)
+            if token is not None and origin is not None:
+                template = f"{origin.template_name or origin.name}:{token.lineno}"
+        elif (
+            location is None
+            and filename.startswith(base)
+            and not filename.startswith(here)
+            and "site-packages" not in filename
+        ):
+            location = (
+                f"{os.path.relpath(filename, base)}:{frame.f_lineno} in {code.co_name}"
+            )
+        frame = frame.f_back
+    return location, template
+
+
+def explain(connection, sql, params):
+    """Return the query plan of ``sql`` as a list of lines, or None."""
+    if not connection.features.supports_explaining_query_execution:
+        return None
+    # Inside a transaction a savepoint keeps a failed EXPLAIN from breaking it
+    guard = (
+        transaction.atomic(using=connection.alias)
+        if connection.in_atomic_block
+        else nullcontext()
+    )
+    _explaining.active = True
+    try:
+        with guard:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+                rows = cursor.fetchall()
+    except DatabaseError as exc:
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        _explaining.active = False
+    # SQLite returns (id, parent, notused, detail); other backends one column
+    return [" | ".join(str(column) for column in row[3:] or row) for row in rows]
+
+
+def record(sql, params, many, elapsed, connection, view=None):
+    """Add a slow query to this process's log."""
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    location, template = _call_site()
+    with _lock:
+        entry = _log.pop(key, None)
+    plan = entry["plan"] if entry else None
+    if plan is None and not many and normalized.upper().startswith(("SELECT", "WITH")):
+        plan = explain(connection, sql, params)
+    now = timezone.now().isoformat()
+    with _lock:
+        # Another thread may have recorded the same query meanwhile
+        entry = _log.pop(key, None) or entry or {
+            "fingerprint": key, "sql": normalized, "count": 0, "total_time": 0.0,
+            "max_time": 0.0,
+        }
+        entry.update(
+            params=params_shape(params, many),
+            count=entry["count"] + 1,
+            total_time=entry["total_time"] + elapsed,
+            max_time=max(entry["max_time"], elapsed),
+            view=view,
+            location=location,
+            template=template,
+            plan=plan,
+            last_seen=now,
+        )
+        _log[key] = entry
+        while len(_log) > settings.SLOW_QUERY_LOG_SIZE:
+            _log.popitem(last=False)
+        _state["dirty"] = True
+
+
+def log_root():
+    return Path(settings.SLOW_QUERY_ROOT)
+
+
+def flush(force=False):
+    """Write this process's log to disk if it changed since the last write.
+
+    Unless ``force`` is set, writes at most every ``SLOW_QUERY_FLUSH_INTERVAL``
+    seconds.
+    """
+    now = time.monotonic()
+    if not _state["dirty"]:
+        return
+    if not force and now - _state["flushed_at"] < settings.SLOW_QUERY_FLUSH_INTERVAL:
+        return
+    with _write_lock:
+        with _lock:
+            entries = list(_log.values())
+            _state["dirty"] = False
+            _state["flushed_at"] = now
+        root = log_root()
+        root.mkdir(parents=True, exist_ok=True)
+        path = root / f"{os.getpid()}.json"
+        temporary = path.with_suffix(".tmp")
+        try:
+            temporary.write_text(json.dumps(entries))
+            os.replace(temporary, path)
+        except OSError:
+            with _lock:
+                _state["dirty"] = True
+            raise
+
+
+@atexit.register
+def _flush_on_exit():
+    if settings.configured:
+        try:
+            flush(force=True)
+        except OSError:
+            pass
+
+
+def _read_entries(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(merged, entries):
+    for entry in entries:
+        current = merged.get(entry["fingerprint"])
+        if current is None:
+            merged[entry["fingerprint"]] = dict(entry)
+            continue
+        current["count"] += entry["count"]
+        current["total_time"] += entry["total_time"]
+        current["max_time"] = max(current["max_time"], entry["max_time"])
+        current["plan"] = current["plan"] or entry["plan"]
+        if entry["last_seen"] > current["last_seen"]:
+            for field in ("params", "view", "location", "template", "last_seen"):
+                current[field] = entry[field]
+
+
+def retire_exited(root):
+    """Fold the logs of exited processes into ``retired.json``."""
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / "lock", "a") as handle:
+        locks.lock(handle, locks.LOCK_EX)
+        try:
+            exited = [
+                path
+                for path in root.glob("*.json")
+                if path.stem.isdigit() and process_exited(int(path.stem))
+            ]
+            if not exited:
+                return
+            retired = root / f"{RETIRED}.json"
+            merged = {}
+            for path in [retired, *exited]:
+                _merge(merged, _read_entries(path) or [])
+            # Bounded like each process's buffer, by when queries were last seen
+            entries = sorted(merged.values(), key=lambda entry: entry["last_seen"])
+            temporary = retired.with_suffix(".tmp")
+            temporary.write_text(json.dumps(entries[-settings.SLOW_QUERY_LOG_SIZE :]))
+            os.replace(temporary, retired)
+            for path in exited:
+                path.unlink(missing_ok=True)
+        finally:
+            locks.unlock(handle)
+
+
+def read_log(limit=None):
+    """Merge the logs of every process; returns :class:`SlowQuery` by total time."""
+    flush(force=True)
+    root = log_root()
+    retire_exited(root)
+    merged = {}
+    for path in root.glob("*.json"):
+        _merge(merged, _read_entries(path) or [])
+    queries = sorted(
+        (
+            SlowQuery(**{field: entry.get(field) for field in SlowQuery._fields})
+            for entry in merged.values()
+        ),
+        key=lambda query: query.total_time,
+        reverse=True,
+    )
+    return queries[:limit] if limit else queries
+
+
+def reset_log():
+    """Forget the slow queries of this process and of every log on disk."""
+    with _lock:
+        _log.clear()
+        _state.update(dirty=False, flushed_at=0.0)
+    for path in log_root().glob("*.json"):
+        path.unlink(missing_ok=True)
+
+
+class QueryTimer:
+    """Execute wrapper recording queries slower than ``threshold`` seconds."""
+
+    def __init__(self, connection, threshold, request=None):
+        self.connection = connection
+        self.threshold = threshold
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.threshold and not getattr(_explaining, "active", False):
+            match = getattr(self.request, "resolver_match", None)
+            record(
+                sql, params, many, elapsed, self.connection,
+                view=match.view_name if match else None,
+            )
+        return result
+
+
+class SlowQueryMiddleware:
+    """Log slow queries run while handling a request.
+
+    Disabled when ``SLOW_QUERY_THRESHOLD_MS`` is None.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold is None:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(
+                        QueryTimer(connection, threshold / 1000, request)
+                    )
+                )
+            response = self.get_response(request)
+        try:
+            flush()
+        except OSError:
+            # The log is kept in memory and written by a later flush
+            logger.exception("Could not write the slow query log")
+        return response
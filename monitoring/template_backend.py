@@ -0,0 +1,34 @@
+"""A Django template backend that times template rendering for ``/metrics``."""
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from .metrics import registry
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            registry.observe(
+                "template_render_seconds",
+                time.perf_counter() - started,
+                (("template", self.origin.template_name or "<string>"),),
+            )
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose templates record their render time.
+
+    Only templates loaded through the backend (``render``, ``TemplateResponse``
+    and the like) are timed; included templates count towards their parent.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
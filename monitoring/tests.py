@@ -0,0 +1,437 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from jobs.models import Job
+from registration.throttle import record as record_throttle, reset_metrics
+from vehicles.models import ServiceRecord, Vehicle
+from .metrics import RETIRED, collect, registry
+from .profiling import list_profiles, load_profile, profiling, summarize
+from .slow_queries import normalize, params_shape, read_log, reset_log
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(PROFILE_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username="driver", password="testpass123")
+        self.staff = User.objects.create_user(
+            username="staff", password="testpass123", is_staff=True
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.staff, make="Honda", model="Fit", year=2015, current_mileage=90000
+        )
+        self.url = reverse("vehicles:vehicle_detail", args=[self.vehicle.pk])
+
+    def test_staff_header_profiles_request(self):
+        """Test that a staff request with the header is profiled to disk"""
+        self.client.login(username="staff", password="testpass123")
+
+        response = self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        self.assertEqual(response.status_code, 200)
+        [profile] = list_profiles()
+        self.assertEqual(response["X-Profile-Id"], profile["id"])
+        self.assertEqual(profile["url_name"], "vehicles:vehicle_detail")
+        self.assertEqual((profile["username"], profile["status"]), ("staff", 200))
+        summary = summarize(load_profile(profile["id"]))
+        self.assertGreater(summary.by_category["orm"], 0)
+        self.assertGreater(summary.by_category["template"], 0)
+        self.assertTrue(summary.hottest["view"])
+
+    def test_header_ignored_for_non_staff(self):
+        """Test that other users cannot trigger profiling"""
+        self.client.login(username="driver", password="testpass123")
+
+        response = self.client.get(reverse("vehicles:vehicle_list"), HTTP_X_PROFILE="1")
+
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(list_profiles(), [])
+
+    @override_settings(PROFILE_SAMPLE_RATE=0.5, PROFILE_MAX_FILES=2)
+    def test_sampling_and_pruning(self):
+        """Test that sampled requests are profiled and old profiles pruned"""
+        self.client.login(username="driver", password="testpass123")
+        url = reverse("vehicles:vehicle_list")
+
+        draws = [0.9, 0.1, 0.1, 0.1]
+        with mock.patch("monitoring.profiling.random.random", side_effect=draws):
+            for _ in range(4):
+                response = self.client.get(url)
+                self.assertNotIn("X-Profile-Id", response)
+
+        profiles = list_profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual({profile["username"] for profile in profiles}, {"driver"})
+
+    def test_one_profile_at_a_time(self):
+        """Test that a request is served unprofiled while another profile runs"""
+        self.client.login(username="staff", password="testpass123")
+
+        with profiling() as profiler:
+            self.assertIsNotNone(profiler)
+            response = self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+
+    def test_unwritable_profile_root_serves_the_request(self):
+        """Test that a profile that cannot be saved is logged, not raised"""
+        self.client.login(username="staff", password="testpass123")
+        blocker = os.path.join(self.root, "file")
+        open(blocker, "w").close()
+
+        with override_settings(PROFILE_ROOT=blocker), self.assertLogs(
+            "monitoring.profiling", "ERROR"
+        ):
+            response = self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+class ProfileViewCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="driver", password="testpass123")
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, make="Mazda", model="3", year=2019, current_mileage=40000
+        )
+        ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type="oil_change", date="2024-01-10",
+            mileage=39000, cost="45.00",
+        )
+
+    def test_prints_hottest_functions_by_category(self):
+        """Test that the command replays the view and splits its time"""
+        out = io.StringIO()
+
+        call_command(
+            "profile_view", f"/vehicles/{self.vehicle.pk}/", user="driver",
+            repeat=2, limit=3, stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn("ms per request over 2 request(s)", output)
+        for heading in ("ORM:", "TEMPLATE:", "VIEW:", "OTHER:"):
+            self.assertIn(heading, output)
+
+    def test_rejects_unknown_user_and_failing_page(self):
+        """Test that the command reports unknown users and non-200 pages"""
+        with self.assertRaisesMessage(CommandError, "Unknown user 'nobody'"):
+            call_command("profile_view", "/my-garage/", user="nobody", stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "answered 302"):
+            call_command("profile_view", "/my-garage/", stdout=io.StringIO())
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(
+            SLOW_QUERY_ROOT=self.root, SLOW_QUERY_THRESHOLD_MS=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(reset_log)
+        reset_log()
+        self.staff = User.objects.create_user(
+            username="staff", password="testpass123", is_staff=True
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.staff, make="Subaru", model="Outback", year=2017, current_mileage=70000
+        )
+        self.client.login(username="staff", password="testpass123")
+
+    def test_normalize(self):
+        """Test that literals and IN lists do not split fingerprints"""
+        self.assertEqual(
+            normalize("SELECT a FROM t WHERE b = 'x''y' AND c IN (%s, %s,%s)  AND d > 10"),
+            "SELECT a FROM t WHERE b = ? AND c IN (...) AND d > ?",
+        )
+        self.assertEqual(params_shape([1, 2, 3, "a", None], False), "int x3, str, NoneType")
+        self.assertEqual(params_shape([(1, "a"), (2, "b")], True), "2 row(s) of (int, str)")
+
+    def test_logs_view_template_line_and_plan(self):
+        """Test that slow queries are logged with their call site and plan"""
+        url = reverse("vehicles:vehicle_detail", args=[self.vehicle.pk])
+        self.client.get(url)
+        self.client.get(url)
+
+        queries = read_log()
+        detail = [query for query in queries if query.view == "vehicles:vehicle_detail"]
+        self.assertTrue(detail)
+        # Fuel statistics are cached after the first request
+        repeated = [query for query in detail if "fuelfillup" not in query.sql]
+        self.assertTrue(all(query.count >= 2 for query in repeated))
+        self.assertIn(
+            "vehicles/views.py",
+            " ".join(query.location for query in detail if query.location),
+        )
+        from_template = [query for query in detail if query.template]
+        self.assertTrue(from_template)
+        self.assertTrue(from_template[0].template.startswith("vehicles/"))
+        vehicle_query = next(
+            query for query in detail if 'FROM "vehicles_vehicle"' in query.sql
+        )
+        self.assertIn("vehicles_vehicle", " ".join(vehicle_query.plan))
+        self.assertIn("int", vehicle_query.params)
+
+    @override_settings(SLOW_QUERY_LOG_SIZE=3)
+    def test_ring_buffer_keeps_recent_fingerprints(self):
+        """Test that only the most recently seen fingerprints are kept"""
+        self.client.get(reverse("vehicles:vehicle_detail", args=[self.vehicle.pk]))
+
+        self.assertEqual(len(read_log()), 3)
+
+    @override_settings(SLOW_QUERY_FLUSH_INTERVAL=3600)
+    def test_log_is_written_on_an_interval(self):
+        """Test that requests do not rewrite the log file on every slow query"""
+        url = reverse("vehicles:vehicle_detail", args=[self.vehicle.pk])
+        self.client.get(url)
+        path = os.path.join(self.root, f"{os.getpid()}.json")
+        written = os.stat(path).st_mtime_ns
+
+        with mock.patch("monitoring.slow_queries.os.replace") as replace:
+            self.client.get(url)
+        replace.assert_not_called()
+        self.assertEqual(os.stat(path).st_mtime_ns, written)
+
+        # Reading the log writes this process's pending changes first
+        self.assertTrue(any(query.count >= 2 for query in read_log()))
+
+    def test_logs_of_exited_processes_are_retired(self):
+        """Test that dead processes' logs are folded into one, counted once"""
+        dead = os.path.join(self.root, "999999999.json")
+        entry = {
+            "fingerprint": "dead", "sql": "SELECT ?", "params": "int", "count": 4,
+            "total_time": 2.0, "max_time": 1.0, "view": None, "location": None,
+            "template": None, "plan": None, "last_seen": "2024-01-01T00:00:00",
+        }
+        with open(dead, "w") as f:
+            json.dump([entry], f)
+
+        first = {query.fingerprint: query.count for query in read_log()}
+        second = {query.fingerprint: query.count for query in read_log()}
+
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(os.path.join(self.root, "retired.json")))
+        self.assertEqual(first["dead"], 4)
+        self.assertEqual(second["dead"], 4)
+
+    def test_unwritable_log_root_serves_the_request(self):
+        """Test that a log that cannot be written is logged, not raised"""
+        blocker = os.path.join(self.root, "file")
+        open(blocker, "w").close()
+
+        with override_settings(SLOW_QUERY_ROOT=blocker), self.assertLogs(
+            "monitoring.slow_queries", "ERROR"
+        ):
+            response = self.client.get(
+                reverse("vehicles:vehicle_detail", args=[self.vehicle.pk])
+            )
+
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_disabled(self):
+        """Test that nothing is logged without a threshold"""
+        self.client.get(reverse("vehicles:vehicle_detail", args=[self.vehicle.pk]))
+
+        self.assertEqual(read_log(), [])
+
+    def test_staff_page_and_command(self):
+        """Test that the staff page and the command read the merged log"""
+        self.client.get(reverse("vehicles:vehicle_detail", args=[self.vehicle.pk]))
+
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=None):
+            response = self.client.get(reverse("monitoring:slow_queries"), {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["queries"]), 2)
+        self.assertIn("mean_time", response.json()["queries"][0])
+
+        out = io.StringIO()
+        call_command("slow_queries", limit=1, reset=True, stdout=out)
+        self.assertIn("plan:", out.getvalue())
+        self.assertIn("Slow query logs cleared.", out.getvalue())
+        self.assertEqual(read_log(), [])
+
+    def test_staff_only(self):
+        """Test that the slow query page is for staff only"""
+        User.objects.create_user(username="driver", password="testpass123")
+        self.client.login(username="driver", password="testpass123")
+
+        response = self.client.get(reverse("monitoring:slow_queries"))
+
+        self.assertEqual(response.status_code, 302)
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(
+            METRICS_ROOT=self.root, METRICS_ALLOWED_IPS=["127.0.0.1"]
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        registry.reset()
+        self.addCleanup(registry.reset)
+        reset_metrics()
+        self.addCleanup(reset_metrics)
+        self.user = User.objects.create_user(username="driver", password="testpass123")
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, make="Kia", model="Soul", year=2020, current_mileage=20000
+        )
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return response.content.decode()
+
+    def test_request_metrics(self):
+        """Test that latency, queries, sessions and templates are exported"""
+        self.client.login(username="driver", password="testpass123")
+        self.client.get(reverse("vehicles:vehicle_detail", args=[self.vehicle.pk]))
+        self.client.get("/no-such-page/")
+
+        text = self.scrape()
+
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertIn(
+            'http_request_duration_seconds_count{url_name="vehicles:vehicle_detail"} 1', text
+        )
+        self.assertIn('http_request_duration_seconds_count{url_name="unresolved"} 1', text)
+        self.assertIn(
+            'http_request_db_queries_bucket{url_name="vehicles:vehicle_detail",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn("sessions_loaded_total 1", text)
+        self.assertIn(
+            'template_render_seconds_count{template="vehicles/vehicle_detail.html"} 1', text
+        )
+
+    def test_cache_and_throttle_counters(self):
+        """Test that cache lookups, hit ratio and throttle outcomes are exported"""
+        cache.set("metrics-test", 1)
+        cache.get("metrics-test")
+        cache.get("metrics-test")
+        cache.get("metrics-missing")
+        record_throttle("allowed")
+
+        text = self.scrape()
+
+        self.assertIn('cache_requests_total{cache="default",result="hit"} 2', text)
+        self.assertIn('cache_requests_total{cache="default",result="miss"} 1', text)
+        self.assertIn('cache_hit_ratio{cache="default"} 0.666', text)
+        self.assertIn('auth_throttle_attempts_total{outcome="allowed"} 1', text)
+
+    def test_job_lag(self):
+        """Test that the lag of each job queue is exported"""
+        Job.objects.create(task="jobs.tests.record", queue="reports")
+
+        text = self.scrape()
+
+        self.assertIn('jobs_queued{queue="reports"} 1', text)
+        self.assertIn('jobs_lag_seconds{queue="reports"}', text)
+
+    def test_sums_the_files_of_every_process(self):
+        """Test that counters written by other processes are added in"""
+        registry.inc("sessions_loaded_total", amount=3)
+        with open(f"{self.root}/1.json", "w") as f:
+            f.write(
+                '{"series": [["sessions_loaded_total", [], 4], '
+                '["http_request_db_queries", [["url_name", "home"]], '
+                "[1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]]]}"
+            )
+        with open(f"{self.root}/2.json", "w") as f:
+            f.write("not json")
+
+        totals = collect()
+
+        self.assertEqual(totals[("sessions_loaded_total", ())], 7)
+        self.assertEqual(
+            totals[("http_request_db_queries", (("url_name", "home"),))][0], 1
+        )
+
+    def test_restores_file_of_exited_process_with_same_pid(self):
+        """Test that a reused pid carries on from the previous process's counters"""
+        with open(f"{self.root}/{os.getpid()}.json", "w") as f:
+            f.write('{"series": [["sessions_loaded_total", [], 5]]}')
+        registry.inc("sessions_loaded_total")
+
+        self.assertEqual(collect()[("sessions_loaded_total", ())], 6)
+        self.assertEqual(collect()[("sessions_loaded_total", ())], 6)
+
+    def test_files_of_exited_processes_are_retired_once(self):
+        """Test that exited processes' files are folded into one, counted once"""
+        with open(f"{self.root}/999999999.json", "w") as f:
+            f.write('{"series": [["sessions_loaded_total", [], 4]]}')
+        with open(f"{self.root}/{RETIRED}.json", "w") as f:
+            f.write('{"series": [["sessions_loaded_total", [], 2]]}')
+
+        self.assertEqual(collect()[("sessions_loaded_total", ())], 6)
+        self.assertEqual(collect()[("sessions_loaded_total", ())], 6)
+        self.assertFalse(os.path.exists(f"{self.root}/999999999.json"))
+
+    def test_concurrent_flushes_write_whole_files(self):
+        """Test that threads flushing at once neither collide nor leave temp files"""
+        registry.inc("sessions_loaded_total", amount=5)
+        errors = []
+
+        def flush():
+            try:
+                for _ in range(20):
+                    registry.flush(force=True)
+            except OSError as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=flush) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.root), [f"{os.getpid()}.json"])
+        with open(os.path.join(self.root, f"{os.getpid()}.json")) as f:
+            self.assertIn(["sessions_loaded_total", [], 5], json.load(f)["series"])
+
+    def test_unwritable_metrics_root_serves_the_request(self):
+        """Test that metrics that cannot be written are logged, not raised"""
+        blocker = os.path.join(self.root, "file")
+        open(blocker, "w").close()
+
+        with override_settings(METRICS_ROOT=blocker), self.assertLogs(
+            "monitoring.metrics", "ERROR"
+        ):
+            response = self.client.get(reverse("home"))
+
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN="s3cret-token")
+    def test_restricted_to_staff_allowed_ips_and_token(self):
+        """Test that only staff, allowed addresses or the token can scrape"""
+        self.client.login(username="driver", password="testpass123")
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret-token")
+        self.assertEqual(response.status_code, 200)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
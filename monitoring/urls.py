@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import slow_queries_view
+
+urlpatterns = [
+    path("slow-queries/", slow_queries_view, name="slow_queries"),
+]
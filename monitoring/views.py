@@ -0,0 +1,56 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_GET
+
+from registration.throttle import client_ip
+from .metrics import exposition
+from .slow_queries import read_log
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@staff_member_required
+@require_GET
+def slow_queries_view(request):
+    """Slow queries of every process by total time; times in milliseconds."""
+    try:
+        limit = max(1, int(request.GET.get("limit", 50)))
+    except ValueError:
+        limit = 50
+    return JsonResponse(
+        {
+            "queries": [
+                {
+                    **query._asdict(),
+                    "total_time": round(query.total_time * 1000, 3),
+                    "max_time": round(query.max_time * 1000, 3),
+                    "mean_time": round(query.total_time / query.count * 1000, 3),
+                }
+                for query in read_log(limit)
+            ]
+        }
+    )
+
+
+def _has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        return False
+    sent = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return hmac.compare_digest(sent.encode(), token.encode())
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus text exposition of the metrics of every worker process."""
+    allowed = (
+        request.user.is_staff
+        or client_ip(request) in settings.METRICS_ALLOWED_IPS
+        or _has_metrics_token(request)
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=PROMETHEUS_CONTENT_TYPE)
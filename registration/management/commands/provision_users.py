@@ -0,0 +1,68 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fleets.models import Fleet
+from registration.provisioning import BATCH_SIZE, provision_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Create driver accounts from a CSV file with username and email "
+        "columns and optional first_name, last_name, password, role and "
+        "vehicles (ids or VINs separated by ';') columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file of drivers.")
+        parser.add_argument(
+            "--fleet", type=int, help="Add every driver to this fleet id."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Processes used to hash passwords; 0 (default) uses every core.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE, help="Users per insert."
+        )
+        parser.add_argument(
+            "--encoding", default="utf-8", help="CSV file encoding."
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 0:
+            raise CommandError("--workers must not be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        fleet = None
+        if options["fleet"] is not None:
+            try:
+                fleet = Fleet.objects.get(pk=options["fleet"])
+            except Fleet.DoesNotExist:
+                raise CommandError(f"Unknown fleet {options['fleet']}.")
+
+        def progress(created, total, rate):
+            self.stdout.write(f"{created}/{total} user(s) created ({rate:.1f} users/s)")
+
+        try:
+            with open(options["path"], newline="", encoding=options["encoding"]) as f:
+                result = provision_users(
+                    csv.DictReader(f),
+                    fleet=fleet,
+                    workers=options["workers"],
+                    batch_size=options["batch_size"],
+                    progress=progress,
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        rate = result.created / result.elapsed if result.elapsed else 0.0
+        self.stdout.write(
+            f"{result.created} user(s) created, {result.assigned} vehicle(s) "
+            f"assigned, {len(result.errors)} skipped in {result.elapsed:.1f}s "
+            f"({rate:.1f} users/s)."
+        )
@@ -0,0 +1,272 @@
+"""Bulk creation of driver accounts from a CSV file.
+
+Creating accounts one at a time through the registration view pays for a
+PBKDF2 hash per driver on a single core. :func:`provision_users` validates
+the whole file up front, hashes the passwords of each batch across a pool
+of worker processes, inserts the users with ``bulk_create`` and, in the
+same transaction, adds them to a fleet and hands them their vehicles,
+along with the vehicles' insurance policies. The previous owners get a
+tombstone for each vehicle, so their sync clients drop it.
+
+Rows have ``username`` and ``email`` columns and optional ``first_name``,
+``last_name``, ``password``, ``role`` and ``vehicles`` columns, where
+``vehicles`` lists vehicle ids or VINs separated by ``;``. Supplied
+passwords must pass ``AUTH_PASSWORD_VALIDATORS`` like any other; drivers
+without a password get an unusable one and must reset it before logging in.
+"""
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from compliance.calendar import invalidate_feeds
+from fleets.models import FleetMembership
+from insurance.models import InsurancePolicy
+from sync.models import Tombstone
+from vehicles.models import Vehicle
+
+BATCH_SIZE = 500
+# Below this many passwords, starting worker processes costs more than it saves
+MIN_POOL_PASSWORDS = 16
+
+_hash_pool = None
+
+Driver = namedtuple(
+    "Driver",
+    ["username", "email", "first_name", "last_name", "password", "role", "vehicles"],
+)
+ProvisionResult = namedtuple(
+    "ProvisionResult", ["created", "assigned", "errors", "elapsed"]
+)
+
+
+class ProvisionError(ValueError):
+    pass
+
+
+def parse_driver(row):
+    """Return a :class:`Driver` from a dict row, or raise ProvisionError."""
+    username = (row.get("username") or "").strip()
+    email = (row.get("email") or "").strip()
+    if not username or not email:
+        raise ProvisionError("Each driver needs a username and an email.")
+    try:
+        User.username_validator(username)
+        validate_email(email)
+    except ValidationError as exc:
+        raise ProvisionError(" ".join(exc.messages))
+    role = (row.get("role") or FleetMembership.ROLE_DRIVER).strip().lower()
+    if role not in dict(FleetMembership.ROLE_CHOICES):
+        raise ProvisionError(f"Unknown role {role!r}.")
+    vehicles = [
+        key.strip() for key in (row.get("vehicles") or "").split(";") if key.strip()
+    ]
+    first_name = (row.get("first_name") or "").strip()[:150]
+    last_name = (row.get("last_name") or "").strip()[:150]
+    password = row.get("password") or None
+    if password is not None:
+        try:
+            validate_password(
+                password,
+                User(
+                    username=username,
+                    email=email,
+                    first_name=first_name,
+                    last_name=last_name,
+                ),
+            )
+        except ValidationError as exc:
+            raise ProvisionError(" ".join(exc.messages))
+    return Driver(
+        username=username,
+        email=email,
+        first_name=first_name,
+        last_name=last_name,
+        password=password,
+        role=role,
+        vehicles=vehicles,
+    )
+
+
+def hash_pool(workers=None):
+    """Return the shared pool, or a new one of ``workers`` processes.
+
+    The shared pool has ``PROVISION_HASH_WORKERS`` processes and is started
+    once per process. Workers are spawned and set up Django so that they use
+    the project's ``PASSWORD_HASHERS`` without inheriting the parent's
+    connections.
+    """
+    global _hash_pool
+    if workers is not None:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        )
+    if _hash_pool is None:
+        _hash_pool = hash_pool(settings.PROVISION_HASH_WORKERS)
+    return _hash_pool
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    """Hash ``passwords`` in order, across ``pool``'s ``workers`` if given.
+
+    ``None`` entries become unusable passwords.
+    """
+    if pool is None or len(passwords) < MIN_POOL_PASSWORDS:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def _validate(rows, fleet):
+    """Parse ``rows`` and resolve their vehicles.
+
+    Returns ``(drivers, vehicle_ids, errors)`` where ``drivers`` is a list of
+    ``(line, driver)`` and ``vehicle_ids`` maps each VIN or id to a pk.
+    """
+    drivers, errors, seen = [], [], set()
+    for line, row in enumerate(rows, start=1):
+        try:
+            driver = parse_driver(row)
+        except ProvisionError as exc:
+            errors.append({"line": line, "error": str(exc)})
+            continue
+        if driver.username.lower() in seen:
+            errors.append({"line": line, "error": f"Duplicate username {driver.username!r}."})
+            continue
+        seen.add(driver.username.lower())
+        drivers.append((line, driver))
+
+    existing = {
+        username.lower()
+        for username in User.objects.filter(
+            username__in=[driver.username for _line, driver in drivers]
+        ).values_list("username", flat=True)
+    }
+
+    keys = {key for _line, driver in drivers for key in driver.vehicles}
+    vehicles = Vehicle.objects.all() if fleet is None else fleet.vehicles.all()
+    vehicle_ids = {}
+    ids = {int(key) for key in keys if key.isdigit()}
+    for pk in vehicles.filter(pk__in=ids).values_list("pk", flat=True):
+        vehicle_ids[str(pk)] = pk
+    for pk, vin in vehicles.filter(vin__in=keys).values_list("pk", "vin"):
+        vehicle_ids[vin] = pk
+
+    valid, claimed = [], {}
+    for line, driver in drivers:
+        if driver.username.lower() in existing:
+            errors.append({"line": line, "error": f"User {driver.username!r} already exists."})
+            continue
+        unknown = [key for key in driver.vehicles if key not in vehicle_ids]
+        if unknown:
+            errors.append({"line": line, "error": f"Unknown vehicle {unknown[0]!r}."})
+            continue
+        taken = [key for key in driver.vehicles if claimed.get(vehicle_ids[key], line) != line]
+        if taken:
+            errors.append(
+                {"line": line, "error": f"Vehicle {taken[0]!r} is assigned to two drivers."}
+            )
+            continue
+        for key in driver.vehicles:
+            claimed[vehicle_ids[key]] = line
+        valid.append((line, driver))
+    return valid, vehicle_ids, sorted(errors, key=lambda error: error["line"])
+
+
+def _create_batch(batch, fleet, vehicle_ids, passwords):
+    """Insert one batch of drivers; returns the number of vehicles assigned."""
+    now = timezone.now()
+    users = [
+        User(
+            username=driver.username,
+            email=driver.email,
+            first_name=driver.first_name,
+            last_name=driver.last_name,
+            password=password,
+            date_joined=now,
+        )
+        for (_line, driver), password in zip(batch, passwords)
+    ]
+    assignments = {}
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        if fleet is not None:
+            FleetMembership.objects.bulk_create(
+                FleetMembership(fleet=fleet, user=user, role=driver.role)
+                for user, (_line, driver) in zip(users, batch)
+            )
+        for user, (_line, driver) in zip(users, batch):
+            for key in driver.vehicles:
+                assignments[vehicle_ids[key]] = user.pk
+        previous_owners = dict(
+            Vehicle.objects.filter(pk__in=assignments).values_list("pk", "user_id")
+        )
+        vehicles = [
+            Vehicle(pk=pk, user_id=user_id, updated_at=now)
+            for pk, user_id in assignments.items()
+        ]
+        # updated_at is set by hand since bulk_update skips auto_now
+        Vehicle.objects.bulk_update(vehicles, ["user", "updated_at"])
+        policies = list(
+            InsurancePolicy.objects.filter(vehicle_id__in=assignments).only("pk", "vehicle_id")
+        )
+        for policy in policies:
+            policy.user_id = assignments[policy.vehicle_id]
+        InsurancePolicy.objects.bulk_update(policies, ["user"])
+        Tombstone.objects.bulk_create(
+            Tombstone(user_id=user_id, model=Vehicle._meta.label_lower, object_id=pk)
+            for pk, user_id in previous_owners.items()
+        )
+    # bulk_update sends no signals, so the owners' calendar feeds are cleared here
+    invalidate_feeds(set(previous_owners.values()) | set(assignments.values()))
+    return len(assignments)
+
+
+def provision_users(
+    rows, fleet=None, workers=1, batch_size=BATCH_SIZE, progress=None, pool=None
+):
+    """Create driver accounts from dict rows (e.g. ``csv.DictReader``).
+
+    Invalid rows, usernames that are taken and unknown vehicles are
+    reported and skipped; vehicles are looked up within ``fleet`` when it
+    is given. ``workers`` greater than one hashes passwords in that many
+    processes; ``0`` uses every core. A ``pool`` of ``workers`` processes
+    that is already running may be passed instead, and is left running.
+    ``progress`` is called after every batch with
+    ``(created, total, users_per_second)``.
+    """
+    started = time.perf_counter()
+    drivers, vehicle_ids, errors = _validate(rows, fleet)
+    workers = workers or os.cpu_count() or 1
+    owned = pool is None and workers > 1 and len(drivers) >= MIN_POOL_PASSWORDS
+    if owned:
+        pool = hash_pool(workers)
+    created = assigned = 0
+    try:
+        for start in range(0, len(drivers), batch_size):
+            batch = drivers[start:start + batch_size]
+            passwords = hash_passwords(
+                [driver.password for _line, driver in batch], pool, workers
+            )
+            assigned += _create_batch(batch, fleet, vehicle_ids, passwords)
+            created += len(batch)
+            if progress is not None:
+                elapsed = time.perf_counter() - started
+                progress(created, len(drivers), created / elapsed if elapsed else 0.0)
+    finally:
+        if owned:
+            pool.shutdown()
+    return ProvisionResult(created, assigned, errors, time.perf_counter() - started)
@@ -1,3 +1,378 @@
-from django.test import TestCase
+import csv
+import io
+import statistics
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+from car_maintenance.testing import FakeClock
+from fleets.models import Fleet, FleetMembership
+from insurance.models import InsurancePolicy
+from sync.models import Tombstone
+from vehicles.models import Vehicle
+from .provisioning import provision_users
+from .throttle import (
+    Throttle, TokenBucket, reset_metrics, reset_throttles, throttle_metrics
+)
+
+
+class TokenBucketTest(TestCase):
+    def test_bucket_refills_over_time(self):
+        """Test that a bucket allows bursts then refills at its rate"""
+        bucket = TokenBucket(2, now=0)
+
+        self.assertEqual(bucket.take(2, 0.5, now=0), 0)
+        self.assertEqual(bucket.take(2, 0.5, now=0), 0)
+        self.assertAlmostEqual(bucket.take(2, 0.5, now=0), 2.0)
+        self.assertEqual(bucket.take(2, 0.5, now=2), 0)
+
+    def test_throttle_keys_are_independent_and_bounded(self):
+        """Test that keys have separate buckets and old keys are evicted"""
+        clock = FakeClock()
+        throttle = Throttle("ip", "1/min", clock=clock)
+
+        self.assertEqual(throttle.hit("10.0.0.1"), 0)
+        self.assertGreater(throttle.hit("10.0.0.1"), 0)
+        self.assertEqual(throttle.hit("10.0.0.2"), 0)
+        clock.now += 60
+        self.assertEqual(throttle.hit("10.0.0.1"), 0)
+
+        with mock.patch("registration.throttle.MAX_LOCAL_BUCKETS", 2):
+            throttle.hit("10.0.0.3")
+        self.assertEqual(list(throttle.buckets), ["10.0.0.1", "10.0.0.3"])
+
+
+@override_settings(AUTH_THROTTLE_RATES={"ip": "3/min", "username": "2/min"})
+class AuthThrottleMiddlewareTest(TestCase):
+    def setUp(self):
+        reset_metrics()
+        reset_throttles()
+        cache.clear()
+        self.login_url = reverse("login")
+
+    def attempt(self, username, ip="10.0.0.1"):
+        return self.client.post(
+            self.login_url,
+            {"username": username, "password": "wrong"},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_ip_budget_returns_429_before_hashing(self):
+        """Test that an IP over budget is rejected without hashing"""
+        for username in ("a", "b", "c"):
+            self.assertEqual(self.attempt(username).status_code, 200)
+
+        with mock.patch.object(PBKDF2PasswordHasher, "encode") as encode:
+            response = self.attempt("d")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        encode.assert_not_called()
+        self.assertEqual(self.attempt("d", ip="10.0.0.2").status_code, 200)
+
+    def test_username_budget_spans_ips(self):
+        """Test that one username is limited however many IPs try it"""
+        self.assertEqual(self.attempt("Victim", ip="10.0.0.1").status_code, 200)
+        self.assertEqual(self.attempt("victim ", ip="10.0.0.2").status_code, 200)
+
+        self.assertEqual(self.attempt("victim", ip="10.0.0.3").status_code, 429)
+        self.assertEqual(
+            throttle_metrics(), {"allowed": 2, "throttled_username": 1}
+        )
+
+    def test_registration_is_throttled_and_get_is_not(self):
+        """Test that registration POSTs share the IP budget and GETs are free"""
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.login_url).status_code, 200)
+        for number in range(3):
+            self.attempt(f"user{number}")
+
+        response = self.client.post(
+            reverse("register"), {"username": "new"}, REMOTE_ADDR="10.0.0.1"
+        )
+
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(AUTH_THROTTLE_SHARED=True)
+    def test_shared_buckets_span_processes(self):
+        """Test that cache-backed buckets are shared between processes"""
+        self.attempt("a")
+        self.attempt("b")
+        self.attempt("c")
+
+        # Dropping the in-process buckets stands in for another worker process
+        reset_throttles()
+        self.assertEqual(self.attempt("d").status_code, 429)
+
+    def test_metrics_view_is_staff_only(self):
+        """Test that throttle metrics are served to staff only"""
+        User.objects.create_user(username="staff", password="testpass123", is_staff=True)
+        self.attempt("a")
+        url = reverse("throttle_metrics")
+
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.get(username="staff"))
+        self.assertEqual(self.client.get(url).json(), {"allowed": 1})
+
+
+@override_settings(AUTH_THROTTLE_RATES={"ip": "5/min", "username": "5/min"})
+class AuthThrottleLoadTest(TransactionTestCase):
+    """Credential stuffing from one IP while a real user browses the garage."""
+
+    ATTACKERS = 4
+    ATTEMPTS_PER_ATTACKER = 50
+
+    def setUp(self):
+        reset_metrics()
+        reset_throttles()
+        self.user = User.objects.create_user(username="owner", password="testpass123")
+        for number in range(20):
+            Vehicle.objects.create(
+                user=self.user, make="Toyota", model=f"Model {number}",
+                year=2020, current_mileage=1000 * number
+            )
+        self.browser = Client()
+        self.browser.force_login(self.user)
+
+    def garage_latency(self, samples=15):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            response = self.browser.get(reverse("vehicles:vehicle_list"))
+            timings.append(time.perf_counter() - started)
+            self.assertEqual(response.status_code, 200)
+        return statistics.median(timings)
+
+    def attack(self, statuses):
+        client = Client()
+        for number in range(self.ATTEMPTS_PER_ATTACKER):
+            response = client.post(
+                reverse("login"),
+                {"username": f"stuffed{number}", "password": "hunter2"},
+                REMOTE_ADDR="203.0.113.7",
+            )
+            statuses.append(response.status_code)
+
+    def test_garage_stays_responsive_during_attack(self):
+        baseline = self.garage_latency()
+        statuses = []
+        attackers = [
+            threading.Thread(target=self.attack, args=(statuses,))
+            for _ in range(self.ATTACKERS)
+        ]
+        hashes = []
+        original_encode = PBKDF2PasswordHasher.encode
+
+        def counting_encode(hasher, *args, **kwargs):
+            hashes.append(1)
+            return original_encode(hasher, *args, **kwargs)
+
+        with mock.patch.object(PBKDF2PasswordHasher, "encode", counting_encode):
+            for attacker in attackers:
+                attacker.start()
+            under_attack = self.garage_latency()
+            for attacker in attackers:
+                attacker.join()
+
+        total = self.ATTACKERS * self.ATTEMPTS_PER_ATTACKER
+        self.assertEqual(len(statuses), total)
+        # Only the IP's burst reaches the password hasher; the rest get a 429
+        self.assertEqual(statuses.count(429), total - 5)
+        self.assertLessEqual(len(hashes), 5)
+        self.assertEqual(throttle_metrics()["throttled_ip"], total - 5)
+        # Five hashes at most compete with the garage, so it stays well under
+        # the cost of the attack it would otherwise queue behind
+        self.assertLess(under_attack, max(baseline * 10, 0.5))
+
+
+def drivers_csv(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(
+        out, fieldnames=["username", "email", "first_name", "password", "role", "vehicles"]
+    )
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+class ProvisionUsersTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="testpass123")
+        self.fleet = Fleet.objects.create(name="Acme Haulage")
+        self.truck = Vehicle.objects.create(
+            user=self.owner, fleet=self.fleet, make="Ford", model="Transit",
+            year=2021, current_mileage=1000, vin="1FTBW3XM5HKA00001"
+        )
+        self.van = Vehicle.objects.create(
+            user=self.owner, fleet=self.fleet, make="Ford", model="Transit",
+            year=2022, current_mileage=500
+        )
+
+    def test_creates_users_memberships_and_assignments(self):
+        """Test that drivers are created, joined to the fleet and given vehicles"""
+        rows = [
+            {"username": "d1", "email": "d1@example.com", "password": "s3cret-pass",
+             "vehicles": f"{self.truck.vin};{self.van.pk}"},
+            {"username": "d2", "email": "d2@example.com", "role": "dispatcher"},
+        ]
+        progress = []
+
+        result = provision_users(
+            rows, fleet=self.fleet, batch_size=1,
+            progress=lambda *args: progress.append(args)
+        )
+
+        self.assertEqual((result.created, result.assigned, result.errors), (2, 2, []))
+        d1 = User.objects.get(username="d1")
+        self.assertTrue(d1.check_password("s3cret-pass"))
+        self.assertFalse(User.objects.get(username="d2").has_usable_password())
+        self.assertEqual(
+            set(Vehicle.objects.filter(user=d1).values_list("pk", flat=True)),
+            {self.truck.pk, self.van.pk},
+        )
+        self.assertEqual(
+            FleetMembership.objects.get(user__username="d2").role, "dispatcher"
+        )
+        self.assertEqual([(done, total) for done, total, _rate in progress], [(1, 2), (2, 2)])
+
+    def test_reassigned_vehicles_move_policies_and_leave_tombstones(self):
+        """Test that the previous owner loses the vehicle and its policy"""
+        policy = InsurancePolicy.objects.create(
+            user=self.owner, vehicle=self.truck, provider="Progressive",
+            policy_number="PG-1", coverage_start="2024-01-01", coverage_end="2024-12-31",
+            premium="900.00"
+        )
+
+        provision_users(
+            [{"username": "d1", "email": "d1@example.com", "vehicles": self.truck.vin}],
+            fleet=self.fleet,
+        )
+
+        policy.refresh_from_db()
+        self.assertEqual(policy.user.username, "d1")
+        tombstone = Tombstone.objects.get(user=self.owner)
+        self.assertEqual(
+            (tombstone.model, tombstone.object_id), ("vehicles.vehicle", self.truck.pk)
+        )
+
+    def test_invalid_rows_are_skipped(self):
+        """Test that bad, duplicate and conflicting rows are reported, not created"""
+        rows = [
+            {"username": "owner", "email": "o@example.com"},
+            {"username": "new", "email": "not-an-email"},
+            {"username": "d1", "email": "d1@example.com", "vehicles": "999"},
+            {"username": "d2", "email": "d2@example.com", "vehicles": str(self.van.pk)},
+            {"username": "D2", "email": "d2b@example.com"},
+            {"username": "d3", "email": "d3@example.com", "vehicles": str(self.van.pk)},
+            {"username": "d4", "email": "d4@example.com", "role": "boss"},
+        ]
+
+        result = provision_users(rows, fleet=self.fleet)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error["line"] for error in result.errors], [1, 2, 3, 5, 6, 7])
+        self.assertEqual(Vehicle.objects.get(pk=self.van.pk).user.username, "d2")
+
+    def test_weak_passwords_are_rejected(self):
+        """Test that supplied passwords go through the password validators"""
+        rows = [
+            {"username": "d1", "email": "d1@example.com", "password": "short"},
+            {"username": "d2", "email": "d2@example.com", "password": "password123"},
+            {"username": "d3", "email": "d3@example.com", "password": "d3@example.com"},
+            {"username": "d4", "email": "d4@example.com", "password": "s3cret-pass"},
+        ]
+
+        result = provision_users(rows, fleet=self.fleet)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error["line"] for error in result.errors], [1, 2, 3])
+        self.assertIn("too short", result.errors[0]["error"])
+        self.assertFalse(User.objects.filter(username__in=["d1", "d2", "d3"]).exists())
+
+    def test_vehicles_outside_the_fleet_are_unknown(self):
+        """Test that vehicles are only looked up within the given fleet"""
+        other = Vehicle.objects.create(
+            user=self.owner, make="Kia", model="Niro", year=2020, current_mileage=1
+        )
+
+        result = provision_users(
+            [{"username": "d1", "email": "d1@example.com", "vehicles": str(other.pk)}],
+            fleet=self.fleet,
+        )
+
+        self.assertEqual(result.created, 0)
+        self.assertEqual(Vehicle.objects.get(pk=other.pk).user, self.owner)
+
+    def test_passwords_are_hashed_in_worker_processes(self):
+        """Test that a pool of processes hashes every password correctly"""
+        rows = [
+            {"username": f"driver{n}", "email": f"driver{n}@example.com",
+             "password": f"pw-{n}-long"}
+            for n in range(20)
+        ]
+
+        result = provision_users(rows, workers=2)
+
+        self.assertEqual(result.created, 20)
+        self.assertTrue(User.objects.get(username="driver7").check_password("pw-7-long"))
+        hashes = User.objects.filter(username__startswith="driver").values_list(
+            "password", flat=True
+        )
+        self.assertEqual(len(set(hashes)), 20)
+
+    def test_command_reports_progress(self):
+        """Test that the command creates drivers and reports users per second"""
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(drivers_csv([{"username": "d1", "email": "d1@example.com"}]))
+        out = io.StringIO()
+
+        call_command("provision_users", f.name, fleet=self.fleet.pk, workers=1, stdout=out)
+
+        self.assertIn("1/1 user(s) created", out.getvalue())
+        self.assertIn("users/s", out.getvalue())
+        self.assertTrue(self.fleet.members.filter(username="d1").exists())
+
+    @override_settings(PROVISION_HASH_WORKERS=0)
+    def test_endpoint_is_staff_only(self):
+        """Test that staff can provision drivers by uploading a CSV"""
+        url = reverse("provision_users")
+        upload = SimpleUploadedFile(
+            "drivers.csv",
+            drivers_csv([{"username": "d1", "email": "d1@example.com"}]).encode(),
+        )
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.post(url, {"file": upload}).status_code, 302)
+
+        User.objects.filter(pk=self.owner.pk).update(is_staff=True)
+        upload.seek(0)
+        response = self.client.post(url, {"file": upload, "fleet": self.fleet.pk})
+
+        self.assertEqual(response.json()["created"], 1)
+        self.assertIn("users_per_second", response.json())
+        self.assertTrue(self.fleet.members.filter(username="d1").exists())
+
+    @override_settings(PROVISION_HASH_WORKERS=2)
+    def test_endpoint_shares_one_hash_pool(self):
+        """Test that requests reuse one pool instead of starting their own"""
+        User.objects.filter(pk=self.owner.pk).update(is_staff=True)
+        self.client.force_login(self.owner)
+
+        with mock.patch("registration.provisioning._hash_pool", None), mock.patch(
+            "registration.provisioning.ProcessPoolExecutor"
+        ) as executor:
+            for username in ("d1", "d2"):
+                row = {"username": username, "email": f"{username}@example.com"}
+                upload = SimpleUploadedFile("drivers.csv", drivers_csv([row]).encode())
+                self.client.post(reverse("provision_users"), {"file": upload})
+
+        executor.assert_called_once()
+        self.assertEqual(User.objects.filter(username__in=["d1", "d2"]).count(), 2)
@@ -0,0 +1,171 @@
+"""Token-bucket throttling of login and registration attempts.
+
+Both views run PBKDF2 password hashing, so every attempt costs hundreds of
+milliseconds of CPU. :class:`AuthThrottleMiddleware` charges each POST to a
+bucket per client IP and one per username before the view runs, and answers
+with a bare 429 once either bucket is empty, so a credential-stuffing burst
+is turned away before any hashing starts.
+
+Buckets live in process memory by default. With ``AUTH_THROTTLE_SHARED``
+they are kept in the default cache instead, so every worker process sees
+the same budget (the read-modify-write is not atomic, which can let a few
+extra attempts through under contention but never blocks real users).
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+THROTTLED_VIEWS = {"login", "register"}
+MAX_LOCAL_BUCKETS = 50000
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+# One Throttle per (scope, rate, shared), shared by every handler in the process
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """Parse ``"<count>/<sec|min|hour>"`` into ``(capacity, tokens per second)``."""
+    count, _, period = rate.partition("/")
+    seconds = {"sec": 1, "min": 60, "hour": 3600}[period]
+    count = int(count)
+    return count, count / seconds
+
+
+def record(event):
+    with _metrics_lock:
+        _metrics[event] += 1
+
+
+def throttle_metrics():
+    """Return a snapshot of the attempt counters of this process."""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+class TokenBucket:
+    """``capacity`` tokens refilled continuously at ``rate`` per second."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, capacity, rate, now):
+        """Take one token; return 0 if allowed, else seconds until one is free."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class Throttle:
+    """A set of token buckets sharing one rate, keyed by IP or username."""
+
+    def __init__(self, scope, rate, shared=False, clock=time.monotonic):
+        self.scope = scope
+        self.capacity, self.rate = parse_rate(rate)
+        self.shared = shared
+        # Shared buckets are compared across processes, so they need wall time
+        self.clock = time.time if shared else clock
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def hit(self, key):
+        """Charge one attempt to ``key``; return seconds to wait, or 0."""
+        now = self.clock()
+        if self.shared:
+            return self._hit_shared(key, now)
+        with self.lock:
+            bucket = self.buckets.pop(key, None) or TokenBucket(self.capacity, now)
+            # Re-inserted at the end, so the least recently seen key is evicted
+            self.buckets[key] = bucket
+            if len(self.buckets) > MAX_LOCAL_BUCKETS:
+                self.buckets.popitem(last=False)
+            return bucket.take(self.capacity, self.rate, now)
+
+    def _hit_shared(self, key, now):
+        cache_key = f"auth_throttle:{self.scope}:{key}"
+        bucket = TokenBucket(self.capacity, now)
+        bucket.tokens, bucket.updated = cache.get(cache_key, (self.capacity, now))
+        wait = bucket.take(self.capacity, self.rate, now)
+        timeout = int(self.capacity / self.rate) + 1
+        cache.set(cache_key, (bucket.tokens, bucket.updated), timeout)
+        return wait
+
+
+def get_throttles():
+    """Return this process's throttles for the configured rates."""
+    shared = settings.AUTH_THROTTLE_SHARED
+    throttles = {}
+    with _throttles_lock:
+        for scope, rate in settings.AUTH_THROTTLE_RATES.items():
+            key = (scope, rate, shared)
+            if key not in _throttles:
+                _throttles[key] = Throttle(scope, rate, shared=shared)
+            throttles[scope] = _throttles[key]
+    return throttles
+
+
+def reset_throttles():
+    """Forget every in-process bucket."""
+    with _throttles_lock:
+        _throttles.clear()
+
+
+def client_ip(request):
+    # Behind a reverse proxy, configure it to set REMOTE_ADDR to the client
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def too_many_attempts(wait):
+    response = HttpResponse(
+        "Too many attempts. Please try again later.\n",
+        status=429,
+        content_type="text/plain",
+    )
+    response["Retry-After"] = str(max(1, round(wait)))
+    return response
+
+
+class AuthThrottleMiddleware:
+    """Reject login and registration POSTs over the IP or username budget."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != "POST" or request.resolver_match.url_name not in THROTTLED_VIEWS:
+            return None
+        throttles = get_throttles()
+        # The IP bucket is checked first since it needs no request body
+        if "ip" in throttles:
+            wait = throttles["ip"].hit(client_ip(request))
+            if wait:
+                record("throttled_ip")
+                return too_many_attempts(wait)
+        if "username" in throttles:
+            username = request.POST.get("username", "").strip().lower()
+            if username:
+                wait = throttles["username"].hit(username)
+                if wait:
+                    record("throttled_username")
+                    return too_many_attempts(wait)
+        record("allowed")
+        return None
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import register
+from .views import provision_users_view, register, throttle_metrics_view
 
 urlpatterns = [
     path("register/", register, name="register"),
+    path("provision/", provision_users_view, name="provision_users"),
+    path("throttle/metrics/", throttle_metrics_view, name="throttle_metrics"),
 ]
@@ -1,9 +1,20 @@
+import csv
+import io
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django import forms
-from django.shortcuts import render, redirect
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
+from django.views.decorators.http import require_GET, require_POST
+
+from fleets.models import Fleet
+from .provisioning import hash_pool, provision_users
+from .throttle import throttle_metrics
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -38,3 +49,49 @@ def register(request):
     else:
         form = CustomUserCreationForm()
     return render(request, "registration/register.html", {"form": form})
+
+
+@staff_member_required
+@require_GET
+def throttle_metrics_view(request):
+    """Counts of throttled and allowed auth attempts in this process."""
+    return JsonResponse(throttle_metrics())
+
+
+@staff_member_required
+@require_POST
+def provision_users_view(request):
+    """Create driver accounts from an uploaded CSV ``file``.
+
+    An optional ``fleet`` id adds every driver to that fleet. Responds with
+    the counts, the skipped rows and the rate in users per second.
+    """
+    upload = request.FILES.get("file")
+    if upload is None:
+        return JsonResponse({"error": "Upload a CSV file as 'file'."}, status=400)
+    fleet = None
+    if request.POST.get("fleet"):
+        fleet = get_object_or_404(Fleet, pk=request.POST["fleet"])
+    workers = settings.PROVISION_HASH_WORKERS
+    try:
+        rows = csv.DictReader(io.TextIOWrapper(upload, encoding="utf-8", newline=""))
+        # Small uploads are hashed inline; larger ones share this process's pool
+        result = provision_users(
+            rows,
+            fleet=fleet,
+            workers=workers or 1,
+            pool=hash_pool() if workers > 1 else None,
+        )
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "The file is not UTF-8 encoded."}, status=400)
+    return JsonResponse(
+        {
+            "created": result.created,
+            "assigned": result.assigned,
+            "errors": result.errors,
+            "elapsed": round(result.elapsed, 3),
+            "users_per_second": round(result.created / result.elapsed, 1)
+            if result.elapsed
+            else 0.0,
+        }
+    )
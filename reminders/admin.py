@@ -0,0 +1,5 @@
+from django.contrib import admin
+from .models import Reminder, ReminderEvent
+
+admin.site.register(Reminder)
+admin.site.register(ReminderEvent)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reminders.schedule import rebuild_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every reminder from registrations, insurance policies and "
+        "service records. Run once to seed the reminder table."
+    )
+
+    def handle(self, *args, **options):
+        count = rebuild_reminders()
+        self.stdout.write(f"{count} reminder(s) scheduled.")
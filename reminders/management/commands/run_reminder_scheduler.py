@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reminders.scheduler import ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Load pending reminders into memory and queue a send_reminder job for "
+        "each one as it falls due, following changes through the outbox."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds between checks of the change outbox.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Fire the reminders due now and exit instead of running forever.",
+        )
+
+    def handle(self, *args, **options):
+        if options["poll_interval"] <= 0:
+            raise CommandError("--poll-interval must be positive.")
+        scheduler = ReminderScheduler(poll_interval=options["poll_interval"])
+        if not options["once"]:
+            try:
+                scheduler.run()
+            except KeyboardInterrupt:
+                pass
+            return
+
+        started = time.perf_counter()
+        loaded = scheduler.load()
+        elapsed = time.perf_counter() - started
+        events, fired = scheduler.run_once()
+        self.stdout.write(
+            f"{loaded} pending reminder(s) loaded in {elapsed:.1f}s, "
+            f"{events} change(s) applied, {fired} reminder(s) fired."
+        )
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('vehicles', '0010_archivedservicerecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('registration', 'Registration'), ('policy', 'Insurance policy'), ('services', 'Vehicle services')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('registration', 'Registration expires'), ('inspection', 'Inspection due'), ('insurance', 'Insurance ends'), ('service', 'Service due')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('service_type', models.CharField(blank=True, choices=[('oil_change', 'Oil Change'), ('tire_rotation', 'Tire Rotation'), ('brake_service', 'Brake Service'), ('transmission_service', 'Transmission Service'), ('air_filter', 'Air Filter Replacement'), ('cabin_filter', 'Cabin Filter Replacement'), ('tune_up', 'Tune Up'), ('inspection', 'Inspection'), ('repair', 'Repair'), ('other', 'Other')], max_length=50)),
+                ('due_on', models.DateField()),
+                ('remind_at', models.DateTimeField()),
+                ('fired_at', models.DateTimeField(blank=True, null=True)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='vehicles.vehicle')),
+            ],
+            options={
+                'ordering': ['remind_at', 'id'],
+                'indexes': [models.Index(fields=['fired_at', 'remind_at'], name='reminders_r_fired_a_42b393_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id', 'service_type'), name='unique_reminder')],
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+from django.db import models
+from django.utils import timezone
+
+from vehicles.models import ServiceRecord, Vehicle
+
+
+class Reminder(models.Model):
+    """The next reminder for one deadline, kept in step with its source row.
+
+    ``object_id`` is the registration or policy id, or the vehicle id for
+    recurring service reminders (one per ``service_type``).
+    """
+
+    KIND_REGISTRATION = "registration"
+    KIND_INSPECTION = "inspection"
+    KIND_INSURANCE = "insurance"
+    KIND_SERVICE = "service"
+    KIND_CHOICES = [
+        (KIND_REGISTRATION, "Registration expires"),
+        (KIND_INSPECTION, "Inspection due"),
+        (KIND_INSURANCE, "Insurance ends"),
+        (KIND_SERVICE, "Service due"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    service_type = models.CharField(
+        max_length=50, choices=ServiceRecord.SERVICE_TYPE_CHOICES, blank=True
+    )
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.CASCADE, related_name="reminders"
+    )
+    due_on = models.DateField()
+    remind_at = models.DateTimeField()
+    fired_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["remind_at", "id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id", "service_type"], name="unique_reminder"
+            )
+        ]
+        indexes = [models.Index(fields=["fired_at", "remind_at"])]
+
+    def __str__(self):
+        if self.service_type:
+            label = f"{self.get_service_type_display()} due"
+        else:
+            label = self.get_kind_display()
+        return f"{label}: {self.vehicle} on {self.due_on}"
+
+
+class ReminderEvent(models.Model):
+    """Outbox row recording that a reminder's source row changed.
+
+    Written in the same transaction as the change; the scheduler reads new
+    events by id and recomputes only the reminders they name.
+    """
+
+    SOURCE_REGISTRATION = "registration"
+    SOURCE_POLICY = "policy"
+    SOURCE_SERVICES = "services"  # object_id is the vehicle id
+    SOURCE_CHOICES = [
+        (SOURCE_REGISTRATION, "Registration"),
+        (SOURCE_POLICY, "Insurance policy"),
+        (SOURCE_SERVICES, "Vehicle services"),
+    ]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.get_source_display()} {self.object_id} changed"
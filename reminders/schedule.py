@@ -0,0 +1,194 @@
+"""Keep the Reminder table in step with registrations, policies and services.
+
+Every reminder is derived from one source: a registration (expiration and
+pending inspection), an insurance policy (end of coverage) or a vehicle's
+latest service of each type in ``SERVICE_REMINDER_INTERVALS``.
+:func:`apply_changes` recomputes the reminders of the sources it is given
+and writes only the differences, so the scheduler can follow the outbox of
+:class:`ReminderEvent` rows instead of rescanning every table. Writes that
+send no signals queue their events with :func:`queue_events`.
+"""
+import datetime
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from compliance.models import CarRegistration
+from insurance.models import InsurancePolicy
+from vehicles.models import ArchivedServiceRecord, ServiceRecord, Vehicle
+from .models import Reminder, ReminderEvent
+
+CHUNK_SIZE = 500
+
+Changes = namedtuple("Changes", ["pending", "removed"])
+
+# Reminder kinds derived from each event source
+SOURCE_KINDS = {
+    ReminderEvent.SOURCE_REGISTRATION: [Reminder.KIND_REGISTRATION, Reminder.KIND_INSPECTION],
+    ReminderEvent.SOURCE_POLICY: [Reminder.KIND_INSURANCE],
+    ReminderEvent.SOURCE_SERVICES: [Reminder.KIND_SERVICE],
+}
+
+
+def remind_at(kind, due_on):
+    """When the reminder of a deadline of ``kind`` on ``due_on`` is sent."""
+    day = due_on - datetime.timedelta(days=settings.REMINDER_LEAD_DAYS.get(kind, 0))
+    return timezone.make_aware(
+        datetime.datetime.combine(day, datetime.time(settings.REMINDER_HOUR))
+    )
+
+
+def _desired(source, ids, today):
+    """Return ``{(kind, object_id, service_type): (vehicle_id, due_on)}``.
+
+    Registration and insurance deadlines already past are not reminded of;
+    an overdue service is, once, until a newer service is recorded. The
+    latest service may have been archived, so both tables are read.
+    """
+    desired = {}
+    if source == ReminderEvent.SOURCE_REGISTRATION:
+        rows = CarRegistration.objects.filter(pk__in=ids).values_list(
+            "pk", "vehicle_id", "expiration_date", "inspection_due_date",
+            "inspection_completed_date",
+        )
+        for pk, vehicle_id, expires, inspection_due, inspected in rows:
+            if expires >= today:
+                desired[(Reminder.KIND_REGISTRATION, pk, "")] = (vehicle_id, expires)
+            if inspection_due and not inspected and inspection_due >= today:
+                desired[(Reminder.KIND_INSPECTION, pk, "")] = (vehicle_id, inspection_due)
+    elif source == ReminderEvent.SOURCE_POLICY:
+        rows = InsurancePolicy.objects.filter(pk__in=ids, coverage_end__gte=today)
+        for pk, vehicle_id, ends in rows.values_list("pk", "vehicle_id", "coverage_end"):
+            desired[(Reminder.KIND_INSURANCE, pk, "")] = (vehicle_id, ends)
+    else:
+        intervals = settings.SERVICE_REMINDER_INTERVALS
+        latest = {}
+        for model in (ServiceRecord, ArchivedServiceRecord):
+            rows = (
+                model.objects.filter(vehicle_id__in=ids, service_type__in=intervals)
+                .order_by()
+                .values("vehicle_id", "service_type")
+                .annotate(last=Max("date"))
+                .values_list("vehicle_id", "service_type", "last")
+            )
+            for vehicle_id, service_type, last in rows:
+                key = (vehicle_id, service_type)
+                latest[key] = max(last, latest.get(key, last))
+        for (vehicle_id, service_type), last in latest.items():
+            due_on = last + datetime.timedelta(days=intervals[service_type])
+            desired[(Reminder.KIND_SERVICE, vehicle_id, service_type)] = (vehicle_id, due_on)
+    return desired
+
+
+def _apply_chunk(source, ids, today):
+    desired = _desired(source, ids, today)
+    existing = {
+        (kind, object_id, service_type): (pk, vehicle_id, due_on)
+        for pk, kind, object_id, service_type, vehicle_id, due_on in Reminder.objects.filter(
+            kind__in=SOURCE_KINDS[source], object_id__in=ids
+        ).values_list("pk", "kind", "object_id", "service_type", "vehicle_id", "due_on")
+    }
+    removed = [pk for key, (pk, *_rest) in existing.items() if key not in desired]
+    created, updated = [], []
+    for key, (vehicle_id, due_on) in desired.items():
+        kind, object_id, service_type = key
+        if key not in existing:
+            created.append(
+                Reminder(
+                    kind=kind,
+                    object_id=object_id,
+                    service_type=service_type,
+                    vehicle_id=vehicle_id,
+                    due_on=due_on,
+                    remind_at=remind_at(kind, due_on),
+                )
+            )
+        elif existing[key][1:] != (vehicle_id, due_on):
+            # A moved deadline is a new reminder, even if the old one fired
+            updated.append(
+                Reminder(
+                    pk=existing[key][0],
+                    vehicle_id=vehicle_id,
+                    due_on=due_on,
+                    remind_at=remind_at(kind, due_on),
+                    fired_at=None,
+                )
+            )
+    with transaction.atomic():
+        Reminder.objects.filter(pk__in=removed).delete()
+        Reminder.objects.bulk_create(created)
+        Reminder.objects.bulk_update(updated, ["vehicle", "due_on", "remind_at", "fired_at"])
+    pending = [(reminder.pk, reminder.remind_at) for reminder in created + updated]
+    return pending, removed
+
+
+def apply_changes(changes, today=None):
+    """Recompute the reminders of ``changes``, ``(source, object_id)`` pairs.
+
+    Returns :class:`Changes` listing the ``(pk, remind_at)`` of reminders
+    created or moved, which are pending again, and the pks removed.
+    """
+    today = today or timezone.localdate()
+    by_source = defaultdict(set)
+    for source, object_id in changes:
+        by_source[source].add(object_id)
+    pending, removed = [], []
+    for source, ids in by_source.items():
+        ids = sorted(ids)
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk_pending, chunk_removed = _apply_chunk(
+                source, ids[start:start + CHUNK_SIZE], today
+            )
+            pending += chunk_pending
+            removed += chunk_removed
+    return Changes(pending, removed)
+
+
+def queue_events(changes):
+    """Queue a :class:`ReminderEvent` per ``(source, object_id)`` pair.
+
+    For rows written without signals, e.g. by ``bulk_update`` or raw SQL.
+    """
+    ReminderEvent.objects.bulk_create(
+        (ReminderEvent(source=source, object_id=object_id) for source, object_id in changes),
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def queue_vehicle_events(vehicle_ids):
+    """Queue events for the services, registrations and policies of vehicles."""
+    vehicle_ids = sorted(vehicle_ids)
+    for start in range(0, len(vehicle_ids), CHUNK_SIZE):
+        chunk = vehicle_ids[start:start + CHUNK_SIZE]
+        changes = [(ReminderEvent.SOURCE_SERVICES, pk) for pk in chunk]
+        for source, model in [
+            (ReminderEvent.SOURCE_REGISTRATION, CarRegistration),
+            (ReminderEvent.SOURCE_POLICY, InsurancePolicy),
+        ]:
+            pks = model.objects.filter(vehicle_id__in=chunk).values_list("pk", flat=True)
+            changes += [(source, pk) for pk in pks]
+        queue_events(changes)
+
+
+def rebuild_reminders(today=None):
+    """Recompute every reminder from the source tables; returns the count.
+
+    Only needed to seed the table, or after rows were written without
+    signals (e.g. ``bulk_create``); the scheduler otherwise follows events.
+    """
+    sources = [
+        (ReminderEvent.SOURCE_REGISTRATION, CarRegistration.objects.all()),
+        (ReminderEvent.SOURCE_POLICY, InsurancePolicy.objects.all()),
+        (ReminderEvent.SOURCE_SERVICES, Vehicle.objects.all()),
+    ]
+    for source, queryset in sources:
+        ids = queryset.order_by().values_list("pk", flat=True).iterator(chunk_size=CHUNK_SIZE)
+        apply_changes(((source, pk) for pk in ids), today=today)
+        # Sources deleted without an event leave reminders behind
+        Reminder.objects.filter(kind__in=SOURCE_KINDS[source]).exclude(
+            object_id__in=queryset.values("pk")
+        ).delete()
+    return Reminder.objects.count()
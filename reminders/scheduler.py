@@ -0,0 +1,140 @@
+"""A long-running process that sends reminders when they fall due.
+
+The scheduler loads every pending reminder once into a min-heap ordered by
+``remind_at``, then only does two cheap things: it reads new rows from the
+:class:`ReminderEvent` outbox (by primary key, after the last one seen) to
+recompute the reminders whose source changed, and it pops reminders off the
+heap as they fall due, queueing a ``send_reminder`` job for each. Between
+the two it sleeps until the next reminder or the next poll, whichever comes
+first, so an idle scheduler costs one indexed query per poll interval.
+
+Changed reminders are pushed again rather than moved inside the heap; the
+latest ``remind_at`` of each pending reminder is kept in ``self.pending``
+and stale heap entries are skipped when popped. Run a single scheduler.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from .models import Reminder, ReminderEvent
+from .schedule import apply_changes
+from .tasks import send_reminder
+
+logger = logging.getLogger(__name__)
+
+EVENT_BATCH_SIZE = 1000
+LOAD_CHUNK_SIZE = 10000
+FIRE_CHUNK_SIZE = 500
+
+
+class ReminderScheduler:
+    def __init__(self, poll_interval=5.0, clock=time.time):
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.heap = []
+        self.pending = {}  # reminder pk -> remind_at timestamp
+        self.cursor = 0  # id of the last event applied
+        self.stop = threading.Event()
+
+    def push(self, pk, when):
+        timestamp = when.timestamp()
+        self.pending[pk] = timestamp
+        heapq.heappush(self.heap, (timestamp, pk))
+
+    def load(self):
+        """Catch up on the outbox, then load every pending reminder."""
+        last = ReminderEvent.objects.aggregate(last=Max("id"))["last"] or 0
+        while self.cursor < last:
+            if not self.poll_events(upto=last):
+                self.cursor = last
+        # Events written from here on are re-applied later, which is harmless
+        rows = (
+            Reminder.objects.filter(fired_at__isnull=True)
+            .order_by()
+            .values_list("pk", "remind_at")
+            .iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+        self.pending = {pk: when.timestamp() for pk, when in rows}
+        self.heap = [(timestamp, pk) for pk, timestamp in self.pending.items()]
+        heapq.heapify(self.heap)
+        logger.info("Loaded %s pending reminder(s)", len(self.heap))
+        return len(self.heap)
+
+    def poll_events(self, upto=None):
+        """Apply the next batch of outbox events; returns how many were read."""
+        events = ReminderEvent.objects.filter(id__gt=self.cursor)
+        if upto is not None:
+            events = events.filter(id__lte=upto)
+        batch = list(
+            events.order_by("id").values_list("id", "source", "object_id")[:EVENT_BATCH_SIZE]
+        )
+        if not batch:
+            return 0
+        changes = apply_changes((source, object_id) for _id, source, object_id in batch)
+        for pk in changes.removed:
+            self.pending.pop(pk, None)
+        for pk, when in changes.pending:
+            self.push(pk, when)
+        self.cursor = batch[-1][0]
+        ReminderEvent.objects.filter(id__lte=self.cursor).delete()
+        return len(batch)
+
+    def fire_due(self):
+        """Queue a job for every reminder now due; returns how many fired."""
+        now = self.clock()
+        candidates = []
+        while self.heap and self.heap[0][0] <= now:
+            timestamp, pk = heapq.heappop(self.heap)
+            # Skip entries superseded by a later push or removed since
+            if self.pending.get(pk) == timestamp:
+                del self.pending[pk]
+                candidates.append(pk)
+        if not candidates:
+            return 0
+        fired_at = timezone.now()
+        fired = 0
+        for start in range(0, len(candidates), FIRE_CHUNK_SIZE):
+            with transaction.atomic():
+                # Reminders deleted (e.g. with their vehicle) since loading drop out here
+                due = list(
+                    Reminder.objects.filter(
+                        pk__in=candidates[start:start + FIRE_CHUNK_SIZE],
+                        fired_at__isnull=True,
+                    ).values_list("pk", flat=True)
+                )
+                Reminder.objects.filter(pk__in=due).update(fired_at=fired_at)
+                for pk in due:
+                    enqueue(send_reminder, pk, queue="reminders")
+            fired += len(due)
+        return fired
+
+    def seconds_until_next(self):
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - self.clock())
+
+    def run_once(self):
+        """Apply waiting events and fire due reminders; returns ``(events, fired)``."""
+        events = 0
+        while True:
+            read = self.poll_events()
+            events += read
+            if read < EVENT_BATCH_SIZE:
+                break
+        return events, self.fire_due()
+
+    def run(self):
+        self.load()
+        while not self.stop.is_set():
+            close_old_connections()
+            self.run_once()
+            wait = self.seconds_until_next()
+            self.stop.wait(
+                self.poll_interval if wait is None else min(wait, self.poll_interval)
+            )
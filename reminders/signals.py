@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from compliance.models import CarRegistration
+from insurance.models import InsurancePolicy
+from vehicles.models import ServiceRecord
+from .models import ReminderEvent
+
+
+@receiver([post_save, post_delete], sender=CarRegistration)
+def registration_changed(sender, instance, **kwargs):
+    ReminderEvent.objects.create(
+        source=ReminderEvent.SOURCE_REGISTRATION, object_id=instance.pk
+    )
+
+
+@receiver([post_save, post_delete], sender=InsurancePolicy)
+def policy_changed(sender, instance, **kwargs):
+    ReminderEvent.objects.create(source=ReminderEvent.SOURCE_POLICY, object_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ServiceRecord)
+def service_changed(sender, instance, **kwargs):
+    ReminderEvent.objects.create(
+        source=ReminderEvent.SOURCE_SERVICES, object_id=instance.vehicle_id
+    )
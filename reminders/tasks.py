@@ -0,0 +1,21 @@
+from django.core.mail import send_mail
+
+from jobs.queue import task
+from .models import Reminder
+
+
+@task
+def send_reminder(reminder_id):
+    reminder = (
+        Reminder.objects.select_related("vehicle__user")
+        .filter(pk=reminder_id)
+        .first()
+    )
+    if reminder is None or not reminder.vehicle.user.email:
+        return
+    send_mail(
+        f"Reminder: {reminder}",
+        f"{reminder} for your {reminder.vehicle}.",
+        None,
+        [reminder.vehicle.user.email],
+    )
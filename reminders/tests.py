@@ -0,0 +1,208 @@
+import io
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from car_maintenance.testing import FakeClock
+from compliance.models import CarRegistration
+from insurance.models import InsurancePolicy
+from insurance.reconcile import Reconciliation, read_csv
+from jobs.models import Job
+from jobs.queue import TASKS
+from vehicles.archive import archive_service_records
+from vehicles.backup import export_account, restore_account
+from vehicles.models import ServiceRecord, Vehicle
+from .models import Reminder, ReminderEvent
+from .schedule import rebuild_reminders
+from .scheduler import ReminderScheduler
+from .tasks import send_reminder
+
+TODAY = date(2030, 1, 10)
+
+
+@override_settings(
+    REMINDER_LEAD_DAYS={"registration": 30, "inspection": 14, "insurance": 30, "service": 7},
+    REMINDER_HOUR=9,
+    SERVICE_REMINDER_INTERVALS={"oil_change": 180},
+)
+class ReminderScheduleTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser", password="testpass123", email="owner@example.com"
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, make="Toyota", model="Corolla", year=2020, current_mileage=30000
+        )
+        self.registration = CarRegistration.objects.create(
+            vehicle=self.vehicle, registration_number="ABC123", state="CA",
+            registration_date=date(2029, 3, 1), expiration_date=date(2030, 3, 1),
+            inspection_due_date=date(2030, 2, 1),
+        )
+        self.policy = InsurancePolicy.objects.create(
+            user=self.user, vehicle=self.vehicle, provider="Acme", policy_number="P-1",
+            coverage_start=date(2029, 6, 1), coverage_end=date(2030, 6, 1),
+            premium=Decimal("500.00"),
+        )
+        ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type="oil_change", date=date(2029, 8, 1),
+            mileage=28000, cost=Decimal("45.00"),
+        )
+        ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type="repair", date=date(2029, 9, 1),
+            mileage=29000, cost=Decimal("300.00"),
+        )
+        ReminderEvent.objects.all().delete()
+        rebuild_reminders(today=TODAY)
+
+    def reminder(self, kind):
+        return Reminder.objects.get(kind=kind)
+
+    def test_rebuild_derives_reminders_from_sources(self):
+        """Test that each deadline gets one reminder sent its lead time early"""
+        self.assertEqual(
+            sorted(Reminder.objects.values_list("kind", "service_type", "due_on")),
+            [
+                ("inspection", "", date(2030, 2, 1)),
+                ("insurance", "", date(2030, 6, 1)),
+                ("registration", "", date(2030, 3, 1)),
+                ("service", "oil_change", date(2030, 1, 28)),
+            ],
+        )
+        self.assertEqual(
+            timezone.localtime(self.reminder("registration").remind_at),
+            timezone.make_aware(datetime(2030, 1, 30, 9)),
+        )
+
+    def test_writes_are_followed_through_the_outbox(self):
+        """Test that saves and deletes update the heap without a rescan"""
+        scheduler = ReminderScheduler()
+        self.assertEqual(scheduler.load(), 4)
+
+        self.registration.inspection_completed_date = date(2030, 1, 5)
+        self.registration.expiration_date = date(2030, 4, 1)
+        self.registration.save()
+        self.policy.delete()
+        ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type="oil_change", date=date(2030, 1, 9),
+            mileage=30000, cost=Decimal("45.00"),
+        )
+        self.assertEqual(ReminderEvent.objects.count(), 3)
+
+        self.assertEqual(scheduler.run_once()[0], 3)
+
+        self.assertFalse(ReminderEvent.objects.exists())
+        self.assertEqual(
+            sorted(Reminder.objects.values_list("kind", "due_on")),
+            [("registration", date(2030, 4, 1)), ("service", date(2030, 7, 8))],
+        )
+        self.assertEqual(
+            sorted(scheduler.pending.values()),
+            sorted(r.remind_at.timestamp() for r in Reminder.objects.all()),
+        )
+
+    def test_archived_service_keeps_its_reminder(self):
+        """Test that archiving the latest service does not drop its reminder"""
+        scheduler = ReminderScheduler()
+        scheduler.load()
+
+        archive_service_records(before=TODAY)
+        self.assertTrue(ReminderEvent.objects.exists())
+        scheduler.run_once()
+
+        self.assertEqual(self.reminder("service").due_on, date(2030, 1, 28))
+
+    def test_writes_without_signals_queue_events(self):
+        """Test that carrier file updates and account restores reach the outbox"""
+        records = read_csv(io.StringIO(
+            "policy_number,coverage_start,coverage_end,premium\n"
+            "P-1,2029-06-01,2030-09-01,500.00\n"
+        ))
+        list(Reconciliation(records, apply=True).run())
+        ReminderScheduler().run_once()
+        self.assertEqual(self.reminder("insurance").due_on, date(2030, 9, 1))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/account.jsonl.gz"
+            export_account(self.user, path)
+            InsurancePolicy.objects.all().delete()
+            restore_account(path, User.objects.create_user(username="copy"))
+
+        ReminderScheduler().run_once()
+
+        self.assertEqual(
+            sorted(Reminder.objects.exclude(vehicle=self.vehicle).values_list("kind", flat=True)),
+            ["inspection", "insurance", "registration", "service"],
+        )
+
+    def test_only_due_reminders_fire_once(self):
+        """Test that due reminders queue one job each and are marked fired"""
+        clock = FakeClock.on(TODAY)
+        scheduler = ReminderScheduler(clock=clock)
+        scheduler.load()
+        clock.advance_to(self.reminder("service").remind_at)
+
+        self.assertEqual(scheduler.run_once(), (0, 2))
+
+        jobs = Job.objects.filter(queue="reminders")
+        self.assertEqual(
+            sorted(job.args[0] for job in jobs),
+            sorted([self.reminder("inspection").pk, self.reminder("service").pk]),
+        )
+        self.assertEqual(jobs[0].task, send_reminder.task_name)
+        self.assertIsNotNone(self.reminder("service").fired_at)
+        self.assertEqual(scheduler.run_once(), (0, 0))
+        self.assertEqual(scheduler.seconds_until_next(), 9 * 86400)
+
+        # A restarted scheduler does not send them again
+        restarted = ReminderScheduler(clock=clock)
+        self.assertEqual(restarted.load(), 2)
+        self.assertEqual(restarted.fire_due(), 0)
+
+    def test_moved_deadline_fires_again(self):
+        """Test that a fired reminder is re-armed when its deadline moves"""
+        clock = FakeClock.on(TODAY)
+        scheduler = ReminderScheduler(clock=clock)
+        scheduler.load()
+        clock.advance_to(self.reminder("registration").remind_at)
+        scheduler.run_once()
+
+        self.registration.expiration_date = date(2030, 3, 15)
+        self.registration.save()
+        scheduler.poll_events()
+
+        self.assertIsNone(self.reminder("registration").fired_at)
+        clock.advance_to(self.reminder("registration").remind_at)
+        self.assertEqual(scheduler.fire_due(), 1)
+
+    def test_deleted_vehicle_does_not_fire(self):
+        """Test that reminders removed with their vehicle are skipped"""
+        clock = FakeClock.on(TODAY)
+        scheduler = ReminderScheduler(clock=clock)
+        scheduler.load()
+        Vehicle.objects.all().delete()
+        clock.now += 365 * 86400
+
+        self.assertEqual(scheduler.fire_due(), 0)
+
+    def test_send_reminder_emails_the_owner(self):
+        """Test that the job emails the vehicle's owner"""
+        TASKS[send_reminder.task_name](self.reminder("insurance").pk)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["owner@example.com"])
+        self.assertIn("Insurance ends", mail.outbox[0].subject)
+
+    def test_command_once(self):
+        """Test that the command loads, applies changes and fires once"""
+        self.policy.delete()
+        out = io.StringIO()
+
+        call_command("run_reminder_scheduler", once=True, stdout=out)
+
+        self.assertIn("3 pending reminder(s) loaded", out.getvalue())
@@ -0,0 +1,178 @@
+"""Delta sync of a user's vehicles, service records and registrations.
+
+Every change is keyed by ``(timestamp, stream, pk)`` where the timestamp is
+the row's ``updated_at`` (or a tombstone's ``deleted_at``). The streams are
+merged in key order, so a single cursor holding the last key a client has
+seen is monotonic across all of them and survives ties on the timestamp.
+
+Timestamps are taken when a row is saved, not when its transaction
+commits, so a slow transaction can commit a change keyed behind a cursor
+that a client already holds. The cursor of a client's last page is
+therefore marked for a rescan: the next pull starts ``SYNC_SAFETY_WINDOW``
+seconds behind it and re-sends those changes, which clients apply
+idempotently. Continuation pages of a pull resume exactly where the
+previous page ended, so a pull always makes progress.
+
+Archived service records are a stream of their own, keyed by
+``archived_at``: a new device receives the full history, and existing
+clients see each record again, with its ``archived_at``, when it is
+archived.
+"""
+import base64
+import datetime
+import heapq
+import json
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from compliance.models import CarRegistration
+from vehicles.models import ArchivedServiceRecord, ServiceRecord, Vehicle
+from .models import Tombstone
+
+Stream = namedtuple("Stream", ["type", "model", "queryset", "timestamp", "fields"])
+Change = namedtuple("Change", ["key", "type", "id", "data", "deleted"])
+ChangePage = namedtuple("ChangePage", ["changes", "cursor", "has_more"])
+
+STREAMS = [
+    Stream(
+        "vehicle",
+        Vehicle,
+        lambda user: Vehicle.objects.filter(user=user),
+        "updated_at",
+        [
+            "id", "make", "model", "year", "current_mileage", "vin", "condition",
+            "nickname", "updated_at",
+        ],
+    ),
+    Stream(
+        "service_record",
+        ServiceRecord,
+        lambda user: ServiceRecord.objects.filter(vehicle__user=user),
+        "updated_at",
+        [
+            "id", "vehicle_id", "service_type", "date", "mileage", "cost", "notes",
+            "updated_at",
+        ],
+    ),
+    Stream(
+        "service_record",
+        ArchivedServiceRecord,
+        lambda user: ArchivedServiceRecord.objects.filter(vehicle__user=user),
+        "archived_at",
+        [
+            "id", "vehicle_id", "service_type", "date", "mileage", "cost", "notes",
+            "updated_at", "archived_at",
+        ],
+    ),
+    Stream(
+        "registration",
+        CarRegistration,
+        lambda user: CarRegistration.objects.filter(vehicle__user=user),
+        "updated_at",
+        [
+            "id", "vehicle_id", "registration_number", "state", "registration_date",
+            "expiration_date", "inspection_due_date", "inspection_completed_date",
+            "notes", "updated_at",
+        ],
+    ),
+    Stream(
+        "tombstone",
+        Tombstone,
+        lambda user: Tombstone.objects.filter(user=user),
+        "deleted_at",
+        ["id", "model", "object_id", "deleted_at"],
+    ),
+]
+TOMBSTONE_RANK = len(STREAMS) - 1
+TYPE_BY_MODEL = {
+    stream.model._meta.label_lower: stream.type for stream in STREAMS[:TOMBSTONE_RANK]
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key, rescan=True):
+    timestamp, rank, pk = key
+    raw = json.dumps(
+        [timestamp.isoformat(), rank, pk, int(rescan)], separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return ``(key, rescan)``; cursors without the rescan flag rescan."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, rank, pk, *rescan = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not (isinstance(rank, int) and isinstance(pk, int)) or len(rescan) > 1:
+        raise InvalidCursor(cursor)
+    return (timestamp, rank, pk), bool(rescan[0]) if rescan else True
+
+
+def _after(stream, rank, key):
+    """Filter selecting the rows of ``stream`` whose key sorts after ``key``."""
+    timestamp, cursor_rank, cursor_pk = key
+    condition = Q(**{f"{stream.timestamp}__gt": timestamp})
+    if rank > cursor_rank:
+        condition |= Q(**{stream.timestamp: timestamp})
+    elif rank == cursor_rank:
+        condition |= Q(**{stream.timestamp: timestamp, "pk__gt": cursor_pk})
+    return condition
+
+
+def _stream_changes(stream, rank, user, key, limit):
+    queryset = stream.queryset(user)
+    if key is not None:
+        queryset = queryset.filter(_after(stream, rank, key))
+    rows = queryset.order_by(stream.timestamp, "pk").values(*stream.fields)[:limit]
+    for row in rows:
+        change_key = (row[stream.timestamp], rank, row["id"])
+        if rank == TOMBSTONE_RANK:
+            change_type = TYPE_BY_MODEL.get(row["model"], row["model"])
+            yield Change(change_key, change_type, row["object_id"], None, True)
+        else:
+            yield Change(change_key, stream.type, row["id"], row, False)
+
+
+def changes_since(user, cursor=None, limit=500):
+    """Return up to ``limit`` changes after ``cursor`` in key order.
+
+    Without a cursor the user's full data set is returned (paged) and
+    tombstones are skipped, since a fresh client has nothing to delete.
+    A cursor marked for a rescan starts ``SYNC_SAFETY_WINDOW`` seconds
+    early, so changes committed late behind it are picked up.
+    """
+    key = start = None
+    if cursor:
+        key, rescan = decode_cursor(cursor)
+        start = key
+        if rescan and settings.SYNC_SAFETY_WINDOW:
+            window = datetime.timedelta(seconds=settings.SYNC_SAFETY_WINDOW)
+            start = (key[0] - window, -1, 0)
+    streams = [
+        _stream_changes(stream, rank, user, start, limit + 1)
+        for rank, stream in enumerate(STREAMS)
+        if key is not None or rank != TOMBSTONE_RANK
+    ]
+    changes = list(islice(heapq.merge(*streams, key=lambda c: c.key), limit + 1))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        last = changes[-1].key
+        if not has_more and key is not None:
+            # A rescan that found nothing new must not move the cursor back
+            last = max(last, key)
+        cursor = encode_cursor(last, rescan=not has_more)
+    elif key is not None:
+        cursor = encode_cursor(key)
+    return ChangePage(changes, cursor, has_more)
@@ -0,0 +1,19 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class Tombstone(models.Model):
+    """Record of a deleted row so sync clients can remove their local copy."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tombstones")
+    model = models.CharField(max_length=50)  # app_label.model_name
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["deleted_at", "id"]
+        indexes = [models.Index(fields=["user", "deleted_at", "id"])]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at}"
@@ -0,0 +1,211 @@
+import json
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from datetime import date, timedelta
+from compliance.models import CarRegistration
+from vehicles.archive import archive_service_records
+from vehicles.models import ServiceRecord, Vehicle
+from .changes import changes_since
+from .models import Tombstone
+
+
+@override_settings(SYNC_SAFETY_WINDOW=0)
+class SyncChangesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.record = ServiceRecord.objects.create(
+            vehicle=self.vehicle,
+            service_type='oil_change',
+            date=date(2024, 1, 15),
+            mileage=24000,
+            cost='49.99'
+        )
+        self.registration = CarRegistration.objects.create(
+            vehicle=self.vehicle,
+            registration_number='ABC123',
+            state='NC',
+            registration_date=date(2024, 1, 1),
+            expiration_date=date(2025, 1, 1)
+        )
+        Vehicle.objects.create(
+            user=self.other_user,
+            make='Honda',
+            model='Civic',
+            year=2019,
+            current_mileage=30000
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def get_changes(self, **params):
+        response = self.client.get(reverse('sync:changes'), params)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in response.content.decode().splitlines()]
+        return lines[:-1], lines[-1]
+
+    def test_initial_sync_returns_only_users_rows(self):
+        """Test that a sync without a cursor returns all of the user's rows"""
+        records, footer = self.get_changes()
+
+        self.assertEqual(
+            sorted((r['type'], r['id']) for r in records),
+            sorted([
+                ('vehicle', self.vehicle.id),
+                ('service_record', self.record.id),
+                ('registration', self.registration.id),
+            ])
+        )
+        self.assertFalse(footer['has_more'])
+        self.assertIsNotNone(footer['cursor'])
+
+    def test_cursor_returns_only_later_changes(self):
+        """Test that only rows changed after the cursor are returned"""
+        _, footer = self.get_changes()
+
+        self.record.cost = '59.99'
+        self.record.save()
+        records, next_footer = self.get_changes(cursor=footer['cursor'])
+
+        self.assertEqual([(r['type'], r['id']) for r in records], [('service_record', self.record.id)])
+        self.assertEqual(records[0]['data']['cost'], '59.99')
+
+        records, _ = self.get_changes(cursor=next_footer['cursor'])
+        self.assertEqual(records, [])
+
+    def test_paging_with_shared_timestamps(self):
+        """Test that paging one row at a time never skips rows with equal timestamps"""
+        stamp = self.vehicle.updated_at
+        Vehicle.objects.filter(user=self.user).update(updated_at=stamp)
+        ServiceRecord.objects.update(updated_at=stamp)
+        CarRegistration.objects.update(updated_at=stamp)
+
+        seen = []
+        cursor = None
+        while True:
+            page = changes_since(self.user, cursor, limit=1)
+            seen.extend((c.type, c.id) for c in page.changes)
+            cursor = page.cursor
+            if not page.has_more:
+                break
+
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(len(set(seen)), 3)
+
+    def test_delete_views_write_tombstones(self):
+        """Test that deletes are synced through tombstones"""
+        _, footer = self.get_changes()
+
+        self.client.post(reverse('vehicles:service_delete', kwargs={'pk': self.record.pk}))
+        self.client.post(reverse('compliance:registration_delete', kwargs={'pk': self.registration.pk}))
+        records, _ = self.get_changes(cursor=footer['cursor'])
+
+        self.assertEqual(Tombstone.objects.count(), 2)
+        self.assertEqual(
+            records,
+            [
+                {'type': 'service_record', 'id': self.record.id, 'deleted': True},
+                {'type': 'registration', 'id': self.registration.id, 'deleted': True},
+            ]
+        )
+
+    def test_vehicle_delete_writes_tombstone(self):
+        """Test that deleting a vehicle records a tombstone for it"""
+        self.client.post(reverse('vehicles:vehicle_delete', kwargs={'pk': self.vehicle.pk}))
+
+        tombstone = Tombstone.objects.get()
+        self.assertEqual((tombstone.model, tombstone.object_id), ('vehicles.vehicle', self.vehicle.pk))
+
+    def test_invalid_cursor_rejected(self):
+        """Test that a malformed cursor returns 400"""
+        response = self.client.get(reverse('sync:changes'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SyncSafetyWindowTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.record = ServiceRecord.objects.create(
+            vehicle=self.vehicle,
+            service_type='oil_change',
+            date=date(2024, 1, 15),
+            mileage=24000,
+            cost='49.99'
+        )
+
+    def sync_all(self, cursor=None, limit=500):
+        seen = []
+        while True:
+            page = changes_since(self.user, cursor, limit=limit)
+            seen.extend((c.type, c.id) for c in page.changes)
+            cursor = page.cursor
+            if not page.has_more:
+                return seen, cursor
+
+    def test_late_commit_behind_cursor_is_synced(self):
+        """Test that a change stamped before the client's cursor is still delivered"""
+        _, cursor = self.sync_all()
+
+        # Saved before the client pulled, committed after it
+        late = ServiceRecord.objects.create(
+            vehicle=self.vehicle,
+            service_type='tire_rotation',
+            date=date(2024, 2, 1),
+            mileage=25000,
+            cost='20.00'
+        )
+        ServiceRecord.objects.filter(pk=late.pk).update(
+            updated_at=self.vehicle.updated_at - timedelta(seconds=30)
+        )
+        seen, _ = self.sync_all(cursor)
+
+        self.assertIn(('service_record', late.pk), seen)
+
+    def test_rescan_pages_make_progress(self):
+        """Test that paging one change at a time through the window terminates"""
+        _, cursor = self.sync_all()
+
+        seen, cursor = self.sync_all(cursor, limit=1)
+        again, _ = self.sync_all(cursor, limit=1)
+
+        self.assertEqual(sorted(seen), sorted(again))
+        self.assertEqual(len(seen), 2)
+
+    def test_archived_records_are_synced(self):
+        """Test that archived records reach new devices and are re-sent to existing ones"""
+        _, cursor = self.sync_all()
+
+        archive_service_records(before=date(2025, 1, 1))
+        page = changes_since(self.user, cursor)
+        fresh, _ = self.sync_all()
+
+        change = next(
+            c for c in page.changes if (c.type, c.id) == ('service_record', self.record.pk)
+        )
+        self.assertFalse(change.deleted)
+        self.assertIsNotNone(change.data['archived_at'])
+        self.assertIn(('service_record', self.record.pk), fresh)
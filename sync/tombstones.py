@@ -0,0 +1,8 @@
+from .models import Tombstone
+
+
+def record_deletion(user, instance):
+    """Write a tombstone for ``instance``; call it in the deleting transaction."""
+    return Tombstone.objects.create(
+        user=user, model=instance._meta.label_lower, object_id=instance.pk
+    )
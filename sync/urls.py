@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import changes
+
+urlpatterns = [
+    path("changes/", changes, name="changes"),
+]
@@ -0,0 +1,58 @@
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.decorators.http import require_GET
+
+from .changes import InvalidCursor, changes_since
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON lines are always available
+    msgpack = None
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+def _records(page):
+    for change in page.changes:
+        if change.deleted:
+            yield {"type": change.type, "id": change.id, "deleted": True}
+        else:
+            yield {"type": change.type, "id": change.id, "data": change.data}
+    yield {"cursor": page.cursor, "has_more": page.has_more}
+
+
+@login_required
+@require_GET
+def changes(request):
+    """Return the user's changes since ``cursor`` as JSON lines or msgpack.
+
+    The last record of every response carries the ``cursor`` to send with
+    the next request and whether ``has_more`` changes are waiting.
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer.")
+    try:
+        page = changes_since(request.user, request.GET.get("cursor"), limit)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid sync cursor.")
+
+    if request.GET.get("format") == "msgpack":
+        if msgpack is None:
+            return HttpResponse("msgpack is not installed.", status=406)
+        # Round-trip through JSON so dates and decimals get the same encoding
+        records = json.loads(json.dumps(list(_records(page)), cls=DjangoJSONEncoder))
+        return HttpResponse(
+            msgpack.packb(records), content_type="application/x-msgpack"
+        )
+
+    body = "".join(
+        json.dumps(record, cls=DjangoJSONEncoder, separators=(",", ":")) + "\n"
+        for record in _records(page)
+    )
+    return HttpResponse(body, content_type="application/x-ndjson")
@@ -1,5 +1,14 @@
 from django.contrib import admin
-from .models import Vehicle, ServiceRecord
+from .models import (
+    Vehicle, ServiceRecord, OdometerReading, FuelFillUp, MaintenanceForecast,
+    ServiceAttachment, ArchivedServiceRecord, ServiceCostStats,
+)
 
 admin.site.register(Vehicle)
 admin.site.register(ServiceRecord)
+admin.site.register(OdometerReading)
+admin.site.register(FuelFillUp)
+admin.site.register(MaintenanceForecast)
+admin.site.register(ServiceAttachment)
+admin.site.register(ArchivedServiceRecord)
+admin.site.register(ServiceCostStats)
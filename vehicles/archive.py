@@ -0,0 +1,106 @@
+"""Hot/cold storage of service records.
+
+Nearly every read of service history is about the last couple of years, so
+records dated before a cutoff are moved from :class:`ServiceRecord` into
+:class:`ArchivedServiceRecord`. The hot table and its indexes then only
+grow with recent activity. Each chunk is copied with a single
+``INSERT ... SELECT`` and deleted in the same short transaction, so the
+database never holds a long write lock and a record is never in both
+tables or in neither.
+
+History views read the hot table alone unless the user asks for the whole
+history, in which case :func:`service_history` merges in the archive.
+Records with attachments stay hot, since their files hang off the record.
+"""
+import heapq
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedServiceRecord, ServiceRecord
+
+# Kept under SQLite's limit of 999 parameters per statement
+CHUNK_SIZE = 500
+# Copied from the hot table; archived_at is stamped with the archiving time
+COLUMNS = [
+    "id", "vehicle_id", "service_type", "date", "mileage", "cost", "notes",
+    "created_at", "updated_at",
+]
+
+
+def archive_cutoff(as_of=None):
+    """Records dated before this day are archived."""
+    as_of = as_of or timezone.localdate()
+    return as_of - timedelta(days=settings.SERVICE_RECORD_ARCHIVE_AFTER_DAYS)
+
+
+def archivable(before):
+    return ServiceRecord.objects.filter(date__lt=before, attachments__isnull=True)
+
+
+def move_to_archive(pks, archived_at):
+    """Copy the service records ``pks`` into the archive and delete them.
+
+    Call it inside a transaction, so that a record is never in both tables
+    or in neither.
+    """
+    ops = connection.ops
+    names = ", ".join(ops.quote_name(column) for column in COLUMNS)
+    hot = ops.quote_name(ServiceRecord._meta.db_table)
+    cold = ops.quote_name(ArchivedServiceRecord._meta.db_table)
+    archived_at = ArchivedServiceRecord._meta.get_field("archived_at").get_db_prep_save(
+        archived_at, connection
+    )
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {cold} ({names}, {ops.quote_name('archived_at')}) "
+            f"SELECT {names}, %s FROM {hot} WHERE {ops.quote_name('id')} IN ({placeholders})",
+            [archived_at, *pks],
+        )
+    ServiceRecord.objects.filter(pk__in=pks).delete()
+
+
+def archive_service_records(before=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Move service records dated before ``before`` to the archive in chunks.
+
+    ``before`` defaults to :func:`archive_cutoff`. ``progress`` is called
+    after every chunk with the number of records moved so far. Returns the
+    number of records moved.
+    """
+    before = before or archive_cutoff()
+    archived_at = timezone.now()
+    moved = last_pk = 0
+    while True:
+        with transaction.atomic():
+            # Keyset paging, so records kept hot are not scanned again
+            pks = list(
+                archivable(before)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size]
+            )
+            if not pks:
+                break
+            move_to_archive(pks, archived_at)
+        moved += len(pks)
+        last_pk = pks[-1]
+        if progress is not None:
+            progress(moved)
+    return moved
+
+
+def service_history(vehicle, show_all=False):
+    """Service records of ``vehicle``, newest first.
+
+    Only the hot table is read unless ``show_all`` is set; archived records
+    are then merged in, each marked with ``is_archived``.
+    """
+    hot = ServiceRecord.objects.filter(vehicle=vehicle).order_by("-date", "-mileage")
+    if not show_all:
+        return hot
+    cold = vehicle.archived_service_records.order_by("-date", "-mileage")
+    return list(heapq.merge(hot, cold, key=attrgetter("date", "mileage"), reverse=True))
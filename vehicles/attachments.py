@@ -0,0 +1,200 @@
+"""Content-addressed storage for service record attachments.
+
+Uploads are streamed chunk by chunk into a temporary file next to the store
+while their SHA-256 is computed, so a file is never held in memory and never
+copied twice: once complete it is renamed to ``blobs/<aa>/<sha256>``, or
+discarded if that blob already exists. Thumbnails are rendered from the blob
+by a pool of worker processes, outside the request.
+
+Storing a blob and committing the attachment that refers to it, and
+checking a blob for references and removing it, each run under
+:func:`store_lock`, a file lock shared by every process. Otherwise a
+concurrent delete could remove a blob between an upload finding it already
+stored and its attachment row being committed.
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from .models import ServiceAttachment
+
+THUMBNAIL_SIZE = (320, 320)
+
+_thumbnail_pool = None
+
+
+def attachment_root():
+    return Path(settings.ATTACHMENT_ROOT)
+
+
+def blob_path(sha256):
+    return attachment_root() / "blobs" / sha256[:2] / sha256
+
+
+def thumbnail_path(sha256):
+    return attachment_root() / "thumbnails" / sha256[:2] / f"{sha256}.png"
+
+
+@contextmanager
+def store_lock():
+    """Hold the store's exclusive lock, across threads and processes."""
+    root = attachment_root()
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / "lock", "a") as handle:
+        locks.lock(handle, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(handle)
+
+
+class StoredUpload:
+    """An uploaded file that has been hashed into a temporary file."""
+
+    def __init__(self, name, content_type, size, sha256, temp_path):
+        self.name = name
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+        self.temp_path = temp_path
+
+    def store(self):
+        """Move the upload into the store; return False if it was a duplicate.
+
+        Call it under :func:`store_lock`, together with saving the
+        attachment that refers to the blob.
+        """
+        target = blob_path(self.sha256)
+        if target.exists():
+            self.close()
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.temp_path, target)
+        self.temp_path = None
+        return True
+
+    def close(self):
+        if self.temp_path is not None:
+            Path(self.temp_path).unlink(missing_ok=True)
+            self.temp_path = None
+
+
+class ContentAddressedUploadHandler(FileUploadHandler):
+    """Stream uploaded files to disk while hashing them.
+
+    Files larger than ``ATTACHMENT_MAX_UPLOAD_SIZE`` are skipped as soon as
+    the limit is crossed and reported in ``rejected``.
+    """
+
+    chunk_size = 256 * 2**10
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejected = []
+        self.uploads = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        directory = attachment_root() / "tmp"
+        directory.mkdir(parents=True, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.ATTACHMENT_MAX_UPLOAD_SIZE:
+            self.rejected.append(self.file_name)
+            self._discard()
+            raise SkipFile()
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.file.close()
+        upload = StoredUpload(
+            self.file_name,
+            self.content_type or "application/octet-stream",
+            file_size,
+            self.digest.hexdigest(),
+            self.file.name,
+        )
+        self.uploads.append(upload)
+        return upload
+
+    def close(self):
+        """Remove the temporary files of uploads that were not stored."""
+        for upload in self.uploads:
+            upload.close()
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def _discard(self):
+        # The parser closes ``self.file`` itself once parsing ends
+        if hasattr(self, "file"):
+            self.file.close()
+            Path(self.file.name).unlink(missing_ok=True)
+
+
+def make_thumbnail(source, target, size=THUMBNAIL_SIZE):
+    """Render a PNG thumbnail of an image; runs in a worker process.
+
+    Returns False when Pillow is not installed or the file is not an image
+    it can read.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_suffix(".part")
+    try:
+        with Image.open(source) as image:
+            image.thumbnail(size)
+            image.save(partial, format="PNG")
+    except OSError:
+        partial.unlink(missing_ok=True)
+        return False
+    os.replace(partial, target)
+    return True
+
+
+def thumbnail_pool():
+    global _thumbnail_pool
+    if _thumbnail_pool is None:
+        _thumbnail_pool = ProcessPoolExecutor(
+            max_workers=settings.ATTACHMENT_THUMBNAIL_WORKERS,
+            initializer=django.setup,
+        )
+    return _thumbnail_pool
+
+
+def schedule_thumbnail(attachment):
+    """Queue a thumbnail for an image attachment unless one already exists."""
+    if not attachment.is_image or thumbnail_path(attachment.sha256).exists():
+        return None
+    args = (str(blob_path(attachment.sha256)), str(thumbnail_path(attachment.sha256)))
+    if not settings.ATTACHMENT_THUMBNAIL_WORKERS:
+        return make_thumbnail(*args)
+    return thumbnail_pool().submit(make_thumbnail, *args)
+
+
+def remove_unreferenced(sha256):
+    """Delete a blob and its thumbnail once no attachment refers to them."""
+    with store_lock():
+        if ServiceAttachment.objects.filter(sha256=sha256).exists():
+            return False
+        blob_path(sha256).unlink(missing_ok=True)
+        thumbnail_path(sha256).unlink(missing_ok=True)
+    return True
@@ -0,0 +1,307 @@
+"""Account backups as gzip-compressed JSON lines.
+
+An archive starts with a header line naming the format and the account,
+then holds one section per table in dependency order: a line naming the
+model and its columns, followed by one JSON array per row. A trailer line
+with the row counts marks the archive as complete, so a truncated file is
+rejected instead of half restored.
+
+Both directions stream: rows are read with a server-side iterator and
+written line by line, and restored in batches with ``executemany``, so
+memory stays flat whatever the size of the account. The only state kept
+while restoring is the mapping from archived to new vehicle ids, used to
+repoint the child rows. Archived service records are inserted as service
+records and then moved to the archive, so that their ids come from the
+service record sequence like those of every other archived record. Fleet
+membership is specific to an instance and is not part of the archive.
+"""
+import gzip
+import json
+from collections import namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils import timezone
+
+from compliance.calendar import invalidate_feed
+from compliance.models import CarRegistration
+from insurance.models import InsurancePolicy
+from reminders.schedule import queue_vehicle_events
+from .archive import move_to_archive
+from .duplicates import backfill_fingerprints
+from .models import (
+    ArchivedServiceRecord, FuelFillUp, OdometerReading, ServiceRecord, Vehicle
+)
+
+FORMAT = "car-maintenance-account"
+VERSION = 1
+EXPORT_CHUNK_SIZE = 2000
+RESTORE_BATCH_SIZE = 5000
+# JSON already holds the database value of text, number and boolean columns;
+# only these types are converted back from their archived string form
+CONVERTED_TYPES = {"DateField", "DateTimeField", "DecimalField", "DurationField", "JSONField"}
+# How each restored column gets its value
+COPY, CONVERT, VEHICLE, FIXED = "copy", "convert", "vehicle", "fixed"
+
+Section = namedtuple("Section", ["model", "user_filter", "excluded"])
+
+# Vehicles come first: every other table points at them
+SECTIONS = [
+    Section(Vehicle, "user", {"user", "fleet"}),
+    # Fingerprints hash the vehicle id and are recomputed after the restore
+    Section(ServiceRecord, "vehicle__user", {"fingerprint"}),
+    Section(ArchivedServiceRecord, "vehicle__user", set()),
+    Section(CarRegistration, "vehicle__user", set()),
+    Section(InsurancePolicy, "vehicle__user", {"user"}),
+    Section(FuelFillUp, "vehicle__user", set()),
+    Section(OdometerReading, "vehicle__user", set()),
+]
+
+
+class BackupError(ValueError):
+    pass
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _columns(section):
+    """The archived columns of ``section``, primary key first."""
+    return [
+        field.attname
+        for field in section.model._meta.concrete_fields
+        if field.name not in section.excluded
+    ]
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(",", ":"))
+
+
+def export_account(user, path):
+    """Write ``user``'s vehicles and their history to the archive at ``path``.
+
+    Returns ``{model label: rows written}``.
+    """
+    counts = {}
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        out.write(
+            _dumps(
+                {
+                    "format": FORMAT,
+                    "version": VERSION,
+                    "username": user.get_username(),
+                    "exported_at": timezone.now(),
+                }
+            )
+            + "\n"
+        )
+        for section in SECTIONS:
+            columns = _columns(section)
+            label = _label(section.model)
+            out.write(_dumps({"model": label, "columns": columns}) + "\n")
+            rows = (
+                section.model._base_manager.filter(**{section.user_filter: user})
+                .order_by("pk")
+                .values_list(*columns)
+                .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            )
+            count = 0
+            for row in rows:
+                out.write(_dumps(row) + "\n")
+                count += 1
+            counts[label] = count
+        out.write(_dumps({"end": counts}) + "\n")
+    return counts
+
+
+def read_header(path):
+    """Return the header of the archive at ``path``."""
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return _parse_header(archive.readline())
+
+
+def _parse_header(line):
+    try:
+        header = json.loads(line)
+    except ValueError:
+        raise BackupError("Not an account archive.")
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise BackupError("Not an account archive.")
+    if header.get("version") != VERSION:
+        raise BackupError(f"Unsupported archive version {header.get('version')!r}.")
+    return header
+
+
+class _Table:
+    """Converts archived rows of one model into database parameters.
+
+    Primary keys are not restored; vehicle ids are remapped, owners are
+    set to the restoring user and ``updated_at`` to the restore time.
+    Columns missing from the archive take their field's default.
+    """
+
+    def __init__(self, model, columns, user, now):
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        unknown = set(columns) - set(fields)
+        if unknown:
+            raise BackupError(f"Unknown {_label(model)} column {sorted(unknown)[0]!r}.")
+        if not columns or columns[0] != model._meta.pk.attname:
+            raise BackupError(f"The {_label(model)} section must start with its id.")
+        self.model = model
+        self.fields = [field for field in fields.values() if not field.primary_key]
+        self.positions = {name: index for index, name in enumerate(columns)}
+        # Looked up once: the connection proxy costs a thread-local access
+        self.db = db = connections[DEFAULT_DB_ALIAS]
+        self.fixed = {"user_id": user.pk}
+        if "updated_at" in fields:
+            self.fixed["updated_at"] = fields["updated_at"].get_db_prep_save(now, db)
+        table = db.ops.quote_name(model._meta.db_table)
+        names = ", ".join(db.ops.quote_name(f.column) for f in self.fields)
+        placeholders = ", ".join(["%s"] * len(self.fields))
+        self.sql = f"INSERT INTO {table} ({names}) VALUES ({placeholders})"
+        self.plan = []
+        for field in self.fields:
+            position = self.positions.get(field.attname)
+            if field.attname in self.fixed:
+                self.plan.append((FIXED, self.fixed[field.attname], None))
+            elif position is None:
+                default = field.get_db_prep_save(field.get_default(), db)
+                self.plan.append((FIXED, default, None))
+            elif field.attname == "vehicle_id":
+                self.plan.append((VEHICLE, position, None))
+            elif field.get_internal_type() in CONVERTED_TYPES:
+                self.plan.append((CONVERT, position, field))
+            else:
+                self.plan.append((COPY, position, None))
+
+    def value(self, field, row):
+        position = self.positions.get(field.attname)
+        value = field.get_default() if position is None else row[position]
+        return None if value is None else field.to_python(value)
+
+    def params(self, rows, vehicle_ids):
+        """Return the ``executemany`` parameters of ``rows``."""
+        params = []
+        for row in rows:
+            values = []
+            for step, arg, field in self.plan:
+                if step is COPY:
+                    values.append(row[arg])
+                elif step is FIXED:
+                    values.append(arg)
+                elif step is VEHICLE:
+                    try:
+                        values.append(vehicle_ids[row[arg]])
+                    except KeyError:
+                        raise BackupError(
+                            f"A {_label(self.model)} row has an unknown vehicle."
+                        )
+                else:
+                    # get_db_prep_save parses the archived string with to_python
+                    values.append(field.get_db_prep_save(row[arg], self.db))
+            params.append(values)
+        return params
+
+
+def _insert_vehicles(table, rows, user, now, vehicle_ids):
+    """Insert vehicles with ``bulk_create`` to learn their new primary keys."""
+    vehicles = []
+    for row in rows:
+        vehicle = Vehicle(user=user)
+        for field in table.fields:
+            if field.attname in table.positions and field.attname != "user_id":
+                setattr(vehicle, field.attname, table.value(field, row))
+        vehicles.append(vehicle)
+    created_at = [vehicle.created_at for vehicle in vehicles]
+    Vehicle.objects.bulk_create(vehicles)
+    # bulk_create stamps created_at; bulk_update writes the archived value back
+    for vehicle, value in zip(vehicles, created_at):
+        vehicle.created_at = value or now
+        vehicle.updated_at = now
+    Vehicle.objects.bulk_update(vehicles, ["created_at", "updated_at"])
+    for row, vehicle in zip(rows, vehicles):
+        vehicle_ids[row[0]] = vehicle.pk
+
+
+def _insert_archived(table, rows, now, vehicle_ids):
+    """Insert archived service records through the hot table.
+
+    Inserting them straight into the archive would draw their ids from the
+    archive's own sequence, which later archive runs collide with.
+    """
+    records = []
+    for row in rows:
+        record = ServiceRecord()
+        for field in table.fields:
+            if field.attname in table.positions and field.attname != "archived_at":
+                setattr(record, field.attname, table.value(field, row))
+        try:
+            record.vehicle_id = vehicle_ids[record.vehicle_id]
+        except KeyError:
+            raise BackupError(f"A {_label(table.model)} row has an unknown vehicle.")
+        records.append(record)
+    created_at = [record.created_at for record in records]
+    ServiceRecord.objects.bulk_create(records)
+    # bulk_create stamps created_at; bulk_update writes the archived value back
+    for record, value in zip(records, created_at):
+        record.created_at = value or now
+        record.updated_at = now
+    ServiceRecord.objects.bulk_update(records, ["created_at", "updated_at"])
+    move_to_archive([record.pk for record in records], now)
+
+
+def restore_account(path, user, batch_size=RESTORE_BATCH_SIZE):
+    """Restore the archive at ``path`` into ``user``'s account.
+
+    Rows get new primary keys and are inserted in batches inside a single
+    transaction, so a failure (e.g. a policy number that already exists)
+    leaves the account untouched. Restored rows are stamped as updated now
+    so that sync clients pick them up. Returns ``{model label: rows}``.
+    """
+    models = {_label(section.model): section.model for section in SECTIONS}
+    now = timezone.now()
+    counts, vehicle_ids = {}, {}
+    table, batch, trailer = None, [], None
+
+    def flush():
+        if not batch:
+            return
+        if table.model is Vehicle:
+            _insert_vehicles(table, batch, user, now, vehicle_ids)
+        elif table.model is ArchivedServiceRecord:
+            _insert_archived(table, batch, now, vehicle_ids)
+        else:
+            with connection.cursor() as cursor:
+                cursor.executemany(table.sql, table.params(batch, vehicle_ids))
+        counts[_label(table.model)] += len(batch)
+        batch.clear()
+
+    with gzip.open(path, "rt", encoding="utf-8") as archive, transaction.atomic():
+        _parse_header(archive.readline())
+        for line in archive:
+            item = json.loads(line)
+            if isinstance(item, list):
+                if table is None:
+                    raise BackupError("Row found before any section.")
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+                continue
+            flush()
+            if "end" in item:
+                trailer = item["end"]
+                break
+            label = item.get("model")
+            if label not in models:
+                raise BackupError(f"Unknown section {label!r}.")
+            table = _Table(models[label], item.get("columns") or [], user, now)
+            counts[label] = 0
+        if trailer != counts:
+            raise BackupError("The archive is truncated or its row counts do not match.")
+        backfill_fingerprints()
+        # Rows restored with executemany send no signals
+        queue_vehicle_events(vehicle_ids.values())
+    invalidate_feed(user.pk)
+    return counts
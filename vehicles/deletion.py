@@ -0,0 +1,58 @@
+"""Delete a vehicle and its history in bounded chunks.
+
+The cascade collector loads every dependent row into memory and deletes
+them all in one transaction, which for a vehicle with tens of thousands of
+records spikes memory and holds the SQLite write lock for seconds. Here each
+kind of dependent row is deleted ``CHUNK_SIZE`` rows at a time, each chunk in
+its own short transaction, so other writers get the lock in between. Chunks
+are deleted through the ORM, so delete signals (cache invalidation, blob
+cleanup) still fire for every row.
+"""
+from django.core.exceptions import PermissionDenied
+from django.db import models, transaction
+
+from sync.tombstones import record_deletion
+from .models import Vehicle
+
+CHUNK_SIZE = 500
+
+
+def dependent_querysets(vehicle):
+    """Querysets of the rows that would be cascade-deleted with ``vehicle``."""
+    return [
+        relation.related_model._base_manager.filter(**{relation.field.name: vehicle})
+        for relation in Vehicle._meta.related_objects
+        if relation.on_delete is models.CASCADE
+    ]
+
+
+def delete_in_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Delete ``queryset`` ``chunk_size`` rows per transaction; return the count."""
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            queryset.model._base_manager.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def delete_vehicle(vehicle, user, chunk_size=CHUNK_SIZE):
+    """Delete ``vehicle``, owned by ``user``, and its history in chunks.
+
+    The tombstone for sync clients is written in the same transaction as the
+    vehicle row itself, so it only exists once the vehicle is really gone.
+    Returns the number of dependent rows deleted.
+    """
+    if vehicle.user_id != user.pk:
+        raise PermissionDenied("Only the owner can delete this vehicle.")
+    deleted = sum(
+        delete_in_chunks(queryset, chunk_size)
+        for queryset in dependent_querysets(vehicle)
+    )
+    with transaction.atomic():
+        record_deletion(user, vehicle)
+        # Anything added while the chunks were deleted cascades here
+        vehicle.delete()
+    return deleted
@@ -0,0 +1,133 @@
+"""Detect and merge duplicate service records.
+
+Imports and double entry leave records of the same vehicle and service type
+with the same date and mileage and almost the same cost. Every record
+stores a short hash of those values, bucketed (see
+``ServiceRecord.fingerprint_of``), in an indexed column, so a new record is
+checked with one indexed lookup of its own and the neighbouring buckets'
+fingerprints, and existing duplicates are found with one ``GROUP BY`` over
+the index instead of comparing records pairwise.
+
+The batch merge groups records by exact fingerprint, so a pair that
+straddles a bucket boundary is only caught when it is entered, not by
+:func:`merge_duplicates`. Merging keeps the oldest record of each group:
+the duplicates' attachments move to it, their notes are appended to its
+notes, and they are then deleted, with a tombstone each for sync clients.
+"""
+from collections import namedtuple
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count
+
+from sync.models import Tombstone
+from .models import ServiceAttachment, ServiceRecord
+
+CHUNK_SIZE = 500
+
+MergeResult = namedtuple("MergeResult", ["groups", "removed"])
+
+
+def find_duplicates(vehicle_id, service_type, date, mileage, cost, exclude_pk=None):
+    """Existing records that the given values would duplicate, oldest first."""
+    records = ServiceRecord.objects.filter(
+        fingerprint__in=ServiceRecord.nearby_fingerprints(
+            vehicle_id, service_type, date, mileage, cost
+        )
+    )
+    if exclude_pk is not None:
+        records = records.exclude(pk=exclude_pk)
+    return records.order_by("pk")
+
+
+def backfill_fingerprints(chunk_size=CHUNK_SIZE):
+    """Fingerprint records saved before fingerprints existed or written in bulk.
+
+    Returns the number of records updated.
+    """
+    updated = 0
+    while True:
+        records = list(
+            ServiceRecord.objects.filter(fingerprint="")
+            .order_by("pk")
+            .only("vehicle_id", "service_type", "date", "mileage", "cost")[:chunk_size]
+        )
+        if not records:
+            return updated
+        for record in records:
+            record.fingerprint = ServiceRecord.fingerprint_of(
+                record.vehicle_id, record.service_type, record.date, record.mileage, record.cost
+            )
+        # Not a user-visible change, so updated_at is left alone
+        ServiceRecord.objects.bulk_update(records, ["fingerprint"])
+        updated += len(records)
+
+
+def _merge_group(keeper, duplicates, tombstones):
+    existing = set(keeper.attachments.values_list("sha256", flat=True))
+    ServiceAttachment.objects.filter(service_record__in=duplicates).exclude(
+        sha256__in=existing
+    ).update(service_record=keeper)
+    notes = [keeper.notes] if keeper.notes else []
+    for record in duplicates:
+        if record.notes and record.notes not in notes:
+            notes.append(record.notes)
+        tombstones.append(
+            Tombstone(
+                user_id=keeper.vehicle.user_id,
+                model=ServiceRecord._meta.label_lower,
+                object_id=record.pk,
+            )
+        )
+    if "\n\n".join(notes) != (keeper.notes or ""):
+        keeper.notes = "\n\n".join(notes)
+        keeper.save(update_fields=["notes", "updated_at"])
+    # Deleted through the ORM so that delete signals fire
+    ServiceRecord.objects.filter(pk__in=[record.pk for record in duplicates]).delete()
+
+
+def merge_duplicates(chunk_size=CHUNK_SIZE, dry_run=False, progress=None):
+    """Merge every group of records sharing a fingerprint.
+
+    Groups are read ``chunk_size`` fingerprints at a time and each chunk is
+    merged in its own transaction. With ``dry_run`` nothing is changed.
+    ``progress`` is called after every chunk with the groups seen so far.
+    Returns :class:`MergeResult`.
+    """
+    fingerprints = list(
+        ServiceRecord.objects.exclude(fingerprint="")
+        .order_by()
+        .values("fingerprint")
+        .annotate(records=Count("id"))
+        .filter(records__gt=1)
+        .values_list("fingerprint", flat=True)
+    )
+    groups = removed = 0
+    for start in range(0, len(fingerprints), chunk_size):
+        with transaction.atomic():
+            records = (
+                ServiceRecord.objects.filter(
+                    fingerprint__in=fingerprints[start:start + chunk_size]
+                )
+                .select_related("vehicle")
+                .order_by("fingerprint", "pk")
+            )
+            tombstones = []
+            for _fingerprint, group in groupby(records, key=lambda record: record.fingerprint):
+                keeper, *duplicates = group
+                # Guard against hash collisions between different records
+                duplicates = [
+                    record for record in duplicates
+                    if record.vehicle_id == keeper.vehicle_id
+                    and record.service_type == keeper.service_type
+                ]
+                if not duplicates:
+                    continue
+                groups += 1
+                removed += len(duplicates)
+                if not dry_run:
+                    _merge_group(keeper, duplicates, tombstones)
+            Tombstone.objects.bulk_create(tombstones)
+        if progress is not None:
+            progress(groups)
+    return MergeResult(groups, removed)
@@ -0,0 +1,298 @@
+"""12-month maintenance cost forecasts for every vehicle at once.
+
+The model is fitted from grouped queries (cost per vehicle and service type,
+cost per service type and calendar month, each over live and archived
+service records, and mileage rates) and has:
+
+* a monthly cost rate per vehicle and service type from its own history,
+  shrunk towards a population prior for vehicles with little history;
+* a prior scaled by the vehicle's condition, age and mileage rate;
+* a linear age trend, so costs grow as the vehicle ages over the horizon;
+* a damped seasonal index per service type and calendar month.
+
+Because the prior and seasonal terms are shared, the projection factors into
+a population part computed once per month and a sparse per-vehicle part, so
+the cost per vehicle is proportional to the service types it actually has.
+Vehicles are projected in chunks that can be spread over worker processes.
+"""
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from .models import ArchivedServiceRecord, MaintenanceForecast, ServiceRecord, Vehicle
+from .odometer import estimate_mileage_rates
+
+HORIZON = 12
+SHRINK_MONTHS = 12
+MIN_FACTOR, MAX_FACTOR = 0.5, 2.0
+CHUNK_SIZE = 5000
+
+# Per-vehicle inputs, one list per column and one entry per vehicle
+Columns = namedtuple(
+    "Columns", ["vehicle_ids", "ages", "conditions", "miles_per_day", "months", "rates"]
+)
+Params = namedtuple(
+    "Params",
+    [
+        "start_month",
+        "prior",
+        "seasonal",
+        "condition",
+        "age_slope",
+        "mean_age",
+        "mean_rate",
+        "mean_miles_per_day",
+    ],
+)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def months_between(start, end):
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def _clamp(value):
+    return min(MAX_FACTOR, max(MIN_FACTOR, value))
+
+
+def load_columns(as_of):
+    """Load the per-vehicle model inputs as columns."""
+    history = defaultdict(dict)
+    first_service = {}
+    for model in (ServiceRecord, ArchivedServiceRecord):
+        rows = (
+            model.objects.filter(date__lte=as_of)
+            .order_by()
+            .values("vehicle_id", "service_type")
+            .annotate(total=Sum("cost"), first=Min("date"))
+            .values_list("vehicle_id", "service_type", "total", "first")
+        )
+        for vehicle_id, service_type, total, first in rows:
+            totals = history[vehicle_id]
+            totals[service_type] = totals.get(service_type, 0.0) + float(total)
+            first_service[vehicle_id] = min(first, first_service.get(vehicle_id, first))
+
+    mileage_rates = estimate_mileage_rates()
+    columns = Columns([], [], [], [], [], [])
+    for pk, year, condition in Vehicle.objects.order_by("pk").values_list(
+        "pk", "year", "condition"
+    ):
+        months = 0
+        if pk in first_service:
+            months = months_between(first_service[pk], as_of)
+        rate = mileage_rates.get(pk)
+        columns.vehicle_ids.append(pk)
+        columns.ages.append(max(0, as_of.year - year))
+        columns.conditions.append(condition)
+        columns.miles_per_day.append(rate.miles_per_day if rate else None)
+        columns.months.append(months)
+        columns.rates.append(
+            {t: total / months for t, total in history.get(pk, {}).items()}
+        )
+    return columns
+
+
+def fit(columns, as_of):
+    """Fit the population parameters shared by every vehicle."""
+    seasonal_totals = defaultdict(lambda: [0.0] * 12)
+    # Grouping on the raw date avoids extracting the month row by row in the
+    # database; the few thousand distinct days are folded into months here.
+    for model in (ServiceRecord, ArchivedServiceRecord):
+        rows = (
+            model.objects.filter(date__lte=as_of)
+            .order_by()
+            .values("service_type", "date")
+            .annotate(total=Sum("cost"))
+            .values_list("service_type", "date", "total")
+        )
+        for service_type, day, total in rows:
+            seasonal_totals[service_type][day.month - 1] += float(total)
+    seasonal = {}
+    for service_type, totals in seasonal_totals.items():
+        mean = sum(totals) / 12
+        # Damped halfway towards 1 so a sparse month does not dominate
+        seasonal[service_type] = [
+            (1 + total / mean) / 2 if mean else 1.0 for total in totals
+        ]
+
+    observed = [i for i, months in enumerate(columns.months) if months]
+    total_months = sum(columns.months[i] for i in observed)
+    prior = defaultdict(float)
+    condition_cost = defaultdict(float)
+    condition_months = defaultdict(int)
+    n = sum_x = sum_y = sum_xx = sum_xy = 0.0
+    for i in observed:
+        months = columns.months[i]
+        vehicle_rate = 0.0
+        for service_type, rate in columns.rates[i].items():
+            prior[service_type] += rate * months / total_months
+            vehicle_rate += rate
+        condition_cost[columns.conditions[i]] += vehicle_rate * months
+        condition_months[columns.conditions[i]] += months
+        age = columns.ages[i]
+        n += 1
+        sum_x += age
+        sum_y += vehicle_rate
+        sum_xx += age * age
+        sum_xy += age * vehicle_rate
+
+    mean_rate = sum_y / n if n else 0.0
+    mean_age = sum_x / n if n else 0.0
+    denominator = n * sum_xx - sum_x * sum_x
+    age_slope = (n * sum_xy - sum_x * sum_y) / denominator if denominator else 0.0
+    overall = sum(prior.values())
+    condition = {
+        key: _clamp(condition_cost[key] / condition_months[key] / overall)
+        for key in condition_months
+        if overall
+    }
+    known = [mpd for mpd in columns.miles_per_day if mpd and mpd > 0]
+    return Params(
+        start_month=add_months(month_start(as_of), 1),
+        prior=dict(prior),
+        seasonal=seasonal,
+        condition=condition,
+        age_slope=age_slope,
+        mean_age=mean_age,
+        mean_rate=mean_rate,
+        mean_miles_per_day=sum(known) / len(known) if known else None,
+    )
+
+
+def project(columns, params):
+    """Return one list of ``HORIZON`` monthly costs per vehicle in ``columns``."""
+    calendar = [
+        add_months(params.start_month, k).month - 1 for k in range(HORIZON)
+    ]
+    horizon = range(HORIZON)
+    flat = [1.0] * 12
+    seasonal = {
+        service_type: [index[month] for month in calendar]
+        for service_type, index in params.seasonal.items()
+    }
+    flat_horizon = [1.0] * HORIZON
+    # Prior cost for every month, before the per-vehicle factors
+    prior_by_month = [
+        sum(
+            rate * params.seasonal.get(service_type, flat)[month]
+            for service_type, rate in params.prior.items()
+        )
+        for month in calendar
+    ]
+    relative_slope = params.age_slope / params.mean_rate if params.mean_rate else 0.0
+
+    # Age only takes a handful of values, so the age trend is tabulated once
+    aged_prior, age_growth = {}, {}
+    for age in set(columns.ages):
+        base = _clamp(1 + relative_slope * (age - params.mean_age))
+        aged = [
+            _clamp(1 + relative_slope * (age + (k + 1) / 12 - params.mean_age))
+            for k in horizon
+        ]
+        aged_prior[age] = [prior * factor for prior, factor in zip(prior_by_month, aged)]
+        age_growth[age] = [factor / base for factor in aged]
+
+    forecasts = []
+    for age, condition, miles_per_day, months, rates in zip(
+        columns.ages,
+        columns.conditions,
+        columns.miles_per_day,
+        columns.months,
+        columns.rates,
+    ):
+        scale = params.condition.get(condition, 1.0)
+        if miles_per_day and params.mean_miles_per_day:
+            scale *= _clamp(miles_per_day / params.mean_miles_per_day)
+        if not months:
+            forecasts.append([round(scale * cost, 2) for cost in aged_prior[age]])
+            continue
+        weight = months / (months + SHRINK_MONTHS)
+        own = [0.0] * HORIZON
+        for service_type, rate in rates.items():
+            index = seasonal.get(service_type, flat_horizon)
+            own = [total + rate * factor for total, factor in zip(own, index)]
+        prior_weight = (1 - weight) * scale
+        forecasts.append(
+            [
+                round(weight * cost * growth + prior_weight * prior, 2)
+                for cost, growth, prior in zip(own, age_growth[age], aged_prior[age])
+            ]
+        )
+    return forecasts
+
+
+def _project_chunk(args):
+    return project(*args)
+
+
+def _chunks(columns, size):
+    for start in range(0, len(columns.vehicle_ids), size):
+        yield Columns(*(column[start : start + size] for column in columns))
+
+
+def refresh_forecasts(as_of=None, workers=1, chunk_size=CHUNK_SIZE):
+    """Rebuild the forecast table for every vehicle and return the row count.
+
+    ``workers`` greater than one projects the vehicle chunks in that many
+    processes; ``0`` uses every core.
+    """
+    as_of = as_of or timezone.localdate()
+    columns = load_columns(as_of)
+    params = fit(columns, as_of)
+    workers = workers or os.cpu_count() or 1
+    tasks = [(chunk, params) for chunk in _chunks(columns, chunk_size)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            results = list(pool.map(_project_chunk, tasks))
+    else:
+        results = [_project_chunk(task) for task in tasks]
+
+    generated_at = timezone.now()
+    forecasts = [
+        MaintenanceForecast(
+            vehicle_id=vehicle_id,
+            start_month=params.start_month,
+            monthly_costs=costs,
+            total_cost=Decimal(f"{sum(costs):.2f}"),
+            generated_at=generated_at,
+        )
+        for vehicle_id, costs in zip(
+            columns.vehicle_ids, (costs for chunk in results for costs in chunk)
+        )
+    ]
+    # The table is rewritten wholesale in one transaction
+    with transaction.atomic():
+        MaintenanceForecast.objects.all().delete()
+        MaintenanceForecast.objects.bulk_create(forecasts, batch_size=chunk_size)
+    return len(forecasts)
+
+
+def fleet_forecast(fleet):
+    """Sum the stored forecasts of a fleet's vehicles month by month."""
+    rows = MaintenanceForecast.objects.filter(vehicle__fleet=fleet).values_list(
+        "start_month", "monthly_costs"
+    )
+    start_month, monthly = None, [0.0] * HORIZON
+    for start_month, costs in rows:
+        monthly = [total + cost for total, cost in zip(monthly, costs)]
+    if start_month is None:
+        return None
+    return {
+        "start_month": start_month,
+        "monthly_costs": [round(total, 2) for total in monthly],
+        "total_cost": round(sum(monthly), 2),
+    }
@@ -1,5 +1,6 @@
 from django import forms
-from .models import Vehicle, ServiceRecord
+from .models import Vehicle, ServiceRecord, FuelFillUp
+from .duplicates import find_duplicates
 
 
 class VehicleForm(forms.ModelForm):
@@ -17,6 +18,10 @@ class VehicleForm(forms.ModelForm):
 
 
 class ServiceRecordForm(forms.ModelForm):
+    allow_duplicate = forms.BooleanField(
+        required=False, label="Save anyway, this is not a duplicate"
+    )
+
     class Meta:
         model = ServiceRecord
         fields = [
@@ -38,3 +43,45 @@ class ServiceRecordForm(forms.ModelForm):
         if user:
             # Limit vehicle choices to current user's vehicles
             self.fields['vehicle'].queryset = Vehicle.objects.filter(user=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        values = [
+            cleaned_data.get(name)
+            for name in ("vehicle", "service_type", "date", "mileage", "cost")
+        ]
+        # Only new records are checked; edits are deliberate
+        if self.instance.pk or None in values or cleaned_data.get("allow_duplicate"):
+            return cleaned_data
+        vehicle, *rest = values
+        duplicate = find_duplicates(vehicle.pk, *rest).first()
+        if duplicate:
+            raise forms.ValidationError(
+                f"This looks like a duplicate of the {duplicate.get_service_type_display()} "
+                f"recorded on {duplicate.date:%b %d, %Y} at {duplicate.mileage} miles "
+                f"for ${duplicate.cost}. Tick \"Save anyway\" if it is not."
+            )
+        return cleaned_data
+
+
+class FuelFillUpForm(forms.ModelForm):
+    class Meta:
+        model = FuelFillUp
+        fields = [
+            "vehicle",
+            "date",
+            "odometer",
+            "gallons",
+            "total_cost",
+            "full_tank",
+        ]
+        widgets = {
+            "date": forms.DateInput(attrs={"type": "date"}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if user:
+            # Limit vehicle choices to current user's vehicles
+            self.fields['vehicle'].queryset = Vehicle.objects.filter(user=user)
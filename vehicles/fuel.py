@@ -0,0 +1,197 @@
+"""Fuel economy statistics computed over a vehicle's whole fill-up history.
+
+The history is loaded as columns (one query), and MPG, rolling averages and
+cost per mile are derived from prefix sums over those columns, so every
+statistic is a single pass regardless of how many fill-ups there are.
+Results are cached under a key holding the count, highest id and latest
+``updated_at`` of the vehicle's fill-ups, read with one indexed aggregate,
+so any insert, delete or edit changes the key whichever process or bulk
+path made it; superseded entries simply expire.
+"""
+import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import accumulate
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import FuelFillUp, Vehicle
+
+ROLLING_WINDOW = 5
+CACHE_TIMEOUT = 60 * 60 * 24
+IMPORT_BATCH_SIZE = 5000
+TRUE_VALUES = {"1", "true", "yes", "y", "full"}
+
+
+class FillUpError(ValueError):
+    pass
+
+
+def fuel_stats_cache_key(vehicle_id):
+    state = FuelFillUp.objects.filter(vehicle_id=vehicle_id).aggregate(
+        count=Count("pk"), last=Max("pk"), updated=Max("updated_at")
+    )
+    updated = state["updated"].timestamp() if state["updated"] else 0
+    return f"vehicles:fuel_stats:{vehicle_id}:{state['count']}:{state['last']}:{updated}"
+
+
+def get_fuel_stats(vehicle_id):
+    """Return cached fuel statistics for a vehicle, computing them on a miss."""
+    key = fuel_stats_cache_key(vehicle_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_fuel_stats(load_columns(vehicle_id))
+        cache.set(key, stats, CACHE_TIMEOUT)
+    return stats
+
+
+def load_columns(vehicle_id):
+    rows = (
+        FuelFillUp.objects.filter(vehicle_id=vehicle_id)
+        .order_by("date", "odometer")
+        .values_list("date", "odometer", "gallons", "total_cost", "full_tank")
+    )
+    columns = list(zip(*rows)) or [(), (), (), (), ()]
+    dates, odometers, gallons, costs, full = columns
+    return {
+        "dates": list(dates),
+        "odometers": list(odometers),
+        "gallons": [float(value) for value in gallons],
+        "costs": [float(value) for value in costs],
+        "full": list(full),
+    }
+
+
+def compute_fuel_stats(columns, window=ROLLING_WINDOW):
+    """Compute MPG per full-tank interval, rolling MPG and cost per mile.
+
+    A tank interval runs from one full fill-up to the next; the fuel used is
+    every fill-up after the first full one up to and including the second,
+    so partial fill-ups in between are accounted for.
+    """
+    odometers, gallons, costs = (
+        columns["odometers"],
+        columns["gallons"],
+        columns["costs"],
+    )
+    full_index = [i for i, full in enumerate(columns["full"]) if full]
+    stats = {
+        "fill_ups": len(odometers),
+        "total_gallons": round(sum(gallons), 3),
+        "total_cost": round(sum(costs), 2),
+        "intervals": [],
+        "average_mpg": None,
+        "cost_per_mile": None,
+    }
+    if len(full_index) < 2:
+        return stats
+
+    cumulative_gallons = [0.0, *accumulate(gallons)]
+    cumulative_costs = [0.0, *accumulate(costs)]
+    starts, ends = full_index[:-1], full_index[1:]
+    miles = [odometers[end] - odometers[start] for start, end in zip(starts, ends)]
+    used = [
+        cumulative_gallons[end + 1] - cumulative_gallons[start + 1]
+        for start, end in zip(starts, ends)
+    ]
+    mpg = [m / g if g else None for m, g in zip(miles, used)]
+
+    # Rolling MPG is distance-weighted: window miles over window gallons
+    cumulative_miles = [0, *accumulate(miles)]
+    cumulative_used = [0.0, *accumulate(used)]
+    rolling = []
+    for i in range(len(miles)):
+        lo = max(0, i + 1 - window)
+        window_gallons = cumulative_used[i + 1] - cumulative_used[lo]
+        window_miles = cumulative_miles[i + 1] - cumulative_miles[lo]
+        rolling.append(window_miles / window_gallons if window_gallons else None)
+
+    stats["intervals"] = [
+        {
+            "date": columns["dates"][end],
+            "miles": distance,
+            "gallons": round(fuel, 3),
+            "mpg": round(value, 2) if value is not None else None,
+            "rolling_mpg": round(average, 2) if average is not None else None,
+        }
+        for end, distance, fuel, value, average in zip(ends, miles, used, mpg, rolling)
+    ]
+    total_miles = cumulative_miles[-1]
+    total_used = cumulative_used[-1]
+    if total_used:
+        stats["average_mpg"] = round(total_miles / total_used, 2)
+    if total_miles:
+        tracked_cost = cumulative_costs[full_index[-1] + 1] - cumulative_costs[
+            full_index[0] + 1
+        ]
+        stats["cost_per_mile"] = round(tracked_cost / total_miles, 3)
+    return stats
+
+
+def parse_fill_up(row):
+    """Return ``(vehicle, date, odometer, gallons, total_cost, full_tank)``.
+
+    ``vehicle`` is kept as given (a primary key or a VIN) and resolved by
+    :func:`import_fill_ups` for the whole batch at once.
+    """
+    try:
+        vehicle = str(row["vehicle"]).strip()
+        date = datetime.date.fromisoformat(str(row["date"]).strip())
+        odometer = int(row["odometer"])
+        gallons = Decimal(str(row["gallons"]))
+        total_cost = Decimal(str(row["total_cost"]))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise FillUpError(
+            "Each fill-up needs vehicle, date, odometer, gallons and total_cost."
+        )
+    if odometer < 0 or gallons <= 0 or total_cost < 0:
+        raise FillUpError("odometer, gallons and total_cost must be positive.")
+    full_tank = str(row.get("full_tank") or "true").strip().lower() in TRUE_VALUES
+    return vehicle, date, odometer, gallons, total_cost, full_tank
+
+
+def import_fill_ups(rows, user=None):
+    """Bulk insert fill-ups from dict rows (e.g. ``csv.DictReader``).
+
+    Vehicles are looked up by primary key or VIN in one query, limited to
+    ``user``'s vehicles when given. Nothing needs invalidating although
+    ``bulk_create`` sends no signals: cached statistics are keyed by each
+    vehicle's fill-up count, latest id and latest ``updated_at``, so the new
+    rows change the key. Returns ``(created, errors)``.
+    """
+    parsed, errors = [], []
+    for line, row in enumerate(rows, start=1):
+        try:
+            parsed.append((line, parse_fill_up(row)))
+        except FillUpError as exc:
+            errors.append({"line": line, "error": str(exc)})
+
+    keys = {values[0] for _line, values in parsed}
+    vehicles = Vehicle.objects.all() if user is None else Vehicle.objects.filter(user=user)
+    lookup = {}
+    ids = {int(key) for key in keys if key.isdigit()}
+    for pk in vehicles.filter(pk__in=ids).values_list("pk", flat=True):
+        lookup[str(pk)] = pk
+    for pk, vin in vehicles.filter(vin__in=keys).values_list("pk", "vin"):
+        lookup[vin] = pk
+
+    objects = []
+    for line, (vehicle, date, odometer, gallons, total_cost, full_tank) in parsed:
+        if vehicle not in lookup:
+            errors.append({"line": line, "error": f"Unknown vehicle {vehicle!r}."})
+            continue
+        objects.append(
+            FuelFillUp(
+                vehicle_id=lookup[vehicle],
+                date=date,
+                odometer=odometer,
+                gallons=gallons,
+                total_cost=total_cost,
+                full_tank=full_tank,
+            )
+        )
+
+    with transaction.atomic():
+        FuelFillUp.objects.bulk_create(objects, batch_size=IMPORT_BATCH_SIZE)
+    return len(objects), errors
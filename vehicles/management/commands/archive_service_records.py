@@ -0,0 +1,46 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.archive import CHUNK_SIZE, archive_cutoff, archive_service_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Move service records older than SERVICE_RECORD_ARCHIVE_AFTER_DAYS (or "
+        "--before) from the service record table to the archive table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before", help="Archive records dated before this day (YYYY-MM-DD)."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Records moved per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        if options["before"]:
+            try:
+                before = datetime.date.fromisoformat(options["before"])
+            except ValueError:
+                raise CommandError("--before must be a date in YYYY-MM-DD format.")
+        else:
+            before = archive_cutoff()
+
+        started = time.perf_counter()
+        moved = archive_service_records(
+            before,
+            chunk_size=options["chunk_size"],
+            progress=lambda moved: self.stdout.write(f"{moved} record(s) archived"),
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{moved} service record(s) dated before {before} archived in {elapsed:.1f}s."
+        )
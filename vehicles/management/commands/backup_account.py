@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.backup import export_account
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a user's vehicles, service records (archived ones included), "
+        "registrations, insurance policies, fill-ups and odometer readings to "
+        "a gzip JSON-lines archive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="Account to back up.")
+        parser.add_argument("path", help="Archive to write, e.g. account.jsonl.gz.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown user {options['username']!r}.")
+        try:
+            counts = export_account(user, options["path"])
+        except OSError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            f"{sum(counts.values())} row(s) written to {options['path']}: "
+            + ", ".join(f"{count} {label}" for label, count in counts.items())
+        )
@@ -0,0 +1,40 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.fuel import import_fill_ups
+
+
+class Command(BaseCommand):
+    help = (
+        "Import fuel fill-ups from a CSV file with vehicle (id or VIN), date, "
+        "odometer, gallons, total_cost and optional full_tank columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import.")
+        parser.add_argument(
+            "--user", help="Only accept vehicles owned by this username."
+        )
+        parser.add_argument(
+            "--encoding", default="utf-8", help="CSV file encoding."
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']!r}.")
+
+        try:
+            with open(options["path"], newline="", encoding=options["encoding"]) as f:
+                created, errors = import_fill_ups(csv.DictReader(f), user=user)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(f"{created} fill-up(s) imported, {len(errors)} skipped.")
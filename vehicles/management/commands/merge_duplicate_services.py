@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.duplicates import CHUNK_SIZE, backfill_fingerprints, merge_duplicates
+
+
+class Command(BaseCommand):
+    help = (
+        "Find service records that duplicate each other (same vehicle, type and "
+        "nearly the same date, mileage and cost) and merge each group into its "
+        "oldest record."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the duplicates without merging them.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Duplicate groups merged per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        started = time.perf_counter()
+        fingerprinted = backfill_fingerprints(chunk_size=options["chunk_size"])
+        if fingerprinted:
+            self.stdout.write(f"{fingerprinted} service record(s) fingerprinted")
+        result = merge_duplicates(
+            chunk_size=options["chunk_size"],
+            dry_run=options["dry_run"],
+            progress=lambda groups: self.stdout.write(f"{groups} group(s) processed"),
+        )
+        elapsed = time.perf_counter() - started
+        verb = "would be removed" if options["dry_run"] else "removed"
+        self.stdout.write(
+            f"{result.groups} duplicate group(s) found, {result.removed} record(s) "
+            f"{verb} in {elapsed:.1f}s."
+        )
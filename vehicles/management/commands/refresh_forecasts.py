@@ -0,0 +1,46 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.forecast import refresh_forecasts
+
+
+class Command(BaseCommand):
+    help = "Rebuild the 12-month maintenance cost forecast for every vehicle."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--as-of",
+            help="Fit on service history up to this date (YYYY-MM-DD); the "
+            "forecast starts the following month.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes used to project forecasts; 0 uses every core.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Vehicles projected and inserted per batch.",
+        )
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options["as_of"]:
+            try:
+                as_of = datetime.date.fromisoformat(options["as_of"])
+            except ValueError:
+                raise CommandError("--as-of must be a date in YYYY-MM-DD format.")
+        if options["workers"] < 0:
+            raise CommandError("--workers must not be negative.")
+
+        started = time.perf_counter()
+        count = refresh_forecasts(
+            as_of=as_of, workers=options["workers"], chunk_size=options["chunk_size"]
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{count} forecast(s) refreshed in {elapsed:.2f}s.")
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.service_stats import CHUNK_SIZE, rebuild_service_stats, refresh_service_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new service records into the typical cost statistics, or rebuild "
+        "them from every service record with --rebuild."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute every group, picking up edited and deleted records.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Records folded in per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        started = time.perf_counter()
+        if options["rebuild"]:
+            groups = rebuild_service_stats()
+            summary = f"Rebuilt {groups} service cost group(s)"
+        else:
+            processed = refresh_service_stats(chunk_size=options["chunk_size"])
+            summary = f"{processed} new service record(s) folded in"
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{summary} in {elapsed:.1f}s.")
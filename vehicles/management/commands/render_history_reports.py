@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.models import Vehicle
+from vehicles.reports import render_reports
+
+
+class Command(BaseCommand):
+    help = (
+        "Render history reports for every vehicle, or one fleet or owner, "
+        "skipping vehicles whose current report already exists."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fleet", type=int, help="Only vehicles in this fleet id.")
+        parser.add_argument("--user", help="Only vehicles owned by this username.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Processes used to render reports; 0 (default) uses every core.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 0:
+            raise CommandError("--workers must not be negative.")
+        vehicles = Vehicle.objects.all()
+        if options["fleet"] is not None:
+            vehicles = vehicles.filter(fleet_id=options["fleet"])
+        if options["user"]:
+            vehicles = vehicles.filter(user__username=options["user"])
+
+        started = time.perf_counter()
+        rendered, up_to_date = render_reports(
+            list(vehicles.values_list("pk", flat=True)), workers=options["workers"]
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{rendered} report(s) rendered, {up_to_date} already up to date "
+            f"in {elapsed:.2f}s."
+        )
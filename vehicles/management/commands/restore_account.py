@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from vehicles.backup import RESTORE_BATCH_SIZE, BackupError, read_header, restore_account
+
+
+class Command(BaseCommand):
+    help = (
+        "Restore an archive written by backup_account into an account, "
+        "giving every row a new id. Nothing is restored if any row fails."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Archive to restore.")
+        parser.add_argument(
+            "--user",
+            help="Account to restore into; defaults to the archived username.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RESTORE_BATCH_SIZE,
+            help="Rows per insert.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        try:
+            username = options["user"] or read_header(options["path"])["username"]
+        except (OSError, EOFError, BackupError) as exc:
+            raise CommandError(str(exc))
+        try:
+            user = get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown user {username!r}.")
+
+        started = time.perf_counter()
+        try:
+            counts = restore_account(options["path"], user, options["batch_size"])
+        except (OSError, EOFError, ValueError, IntegrityError) as exc:
+            raise CommandError(f"Nothing restored: {exc}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{sum(counts.values())} row(s) restored into {username!r} in "
+            f"{elapsed:.1f}s: "
+            + ", ".join(f"{count} {label}" for label, count in counts.items())
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_servicerecord'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerecord',
+            index=models.Index(fields=['vehicle', 'date'], name='vehicles_se_vehicle_327e19_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleets', '0001_initial'),
+        ('vehicles', '0003_servicerecord_vehicle_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='fleet',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vehicles', to='fleets.fleet'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['fleet', 'make', 'id'], name='vehicles_ve_fleet_i_d0b759_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['fleet', 'model', 'id'], name='vehicles_ve_fleet_i_4436bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['fleet', 'year', 'id'], name='vehicles_ve_fleet_i_856bee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['fleet', 'condition', 'id'], name='vehicles_ve_fleet_i_532676_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['fleet', 'current_mileage', 'id'], name='vehicles_ve_fleet_i_677b9a_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleets', '0001_initial'),
+        ('vehicles', '0004_vehicle_fleet'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerecord',
+            index=models.Index(fields=['updated_at', 'id'], name='vehicles_se_updated_b330a5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='vehicles_ve_user_id_e047cc_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0005_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OdometerReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('mileage', models.PositiveIntegerField()),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='odometer_readings', to='vehicles.vehicle')),
+            ],
+            options={
+                'ordering': ['vehicle', 'recorded_at'],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'recorded_at'), name='unique_odometer_reading')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0006_odometerreading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FuelFillUp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('odometer', models.PositiveIntegerField()),
+                ('gallons', models.DecimalField(decimal_places=3, max_digits=7)),
+                ('total_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('full_tank', models.BooleanField(default=True, help_text='Uncheck for a partial fill-up.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fuel_fill_ups', to='vehicles.vehicle')),
+            ],
+            options={
+                'ordering': ['-date', '-odometer'],
+                'indexes': [models.Index(fields=['vehicle', 'date', 'odometer'], name='vehicles_fu_vehicle_ef50b8_idx')],
+            },
+        ),
+    ]
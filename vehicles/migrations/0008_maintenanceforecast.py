@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0007_fuelfillup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_month', models.DateField()),
+                ('monthly_costs', models.JSONField(help_text='Expected cost for each of the 12 months from start_month.')),
+                ('total_cost', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('generated_at', models.DateTimeField()),
+                ('vehicle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='maintenance_forecast', to='vehicles.vehicle')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0008_maintenanceforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceAttachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('original_name', models.CharField(max_length=255)),
+                ('content_type', models.CharField(max_length=100)),
+                ('size', models.PositiveBigIntegerField()),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('service_record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='vehicles.servicerecord')),
+            ],
+            options={
+                'ordering': ['-uploaded_at'],
+                'constraints': [models.UniqueConstraint(fields=('service_record', 'sha256'), name='unique_attachment_per_record')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0009_serviceattachment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedServiceRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(choices=[('oil_change', 'Oil Change'), ('tire_rotation', 'Tire Rotation'), ('brake_service', 'Brake Service'), ('transmission_service', 'Transmission Service'), ('air_filter', 'Air Filter Replacement'), ('cabin_filter', 'Cabin Filter Replacement'), ('tune_up', 'Tune Up'), ('inspection', 'Inspection'), ('repair', 'Repair'), ('other', 'Other')], max_length=50)),
+                ('date', models.DateField()),
+                ('mileage', models.PositiveIntegerField()),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_service_records', to='vehicles.vehicle')),
+            ],
+            options={
+                'ordering': ['-date', '-mileage'],
+                'indexes': [models.Index(fields=['vehicle', 'date'], name='vehicles_ar_vehicle_681ac9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0010_archivedservicerecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceStatsCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_record_id', models.BigIntegerField(default=0)),
+                ('rebuilt_at', models.DateTimeField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ServiceCostStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('make', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=50)),
+                ('year', models.PositiveIntegerField()),
+                ('service_type', models.CharField(choices=[('oil_change', 'Oil Change'), ('tire_rotation', 'Tire Rotation'), ('brake_service', 'Brake Service'), ('transmission_service', 'Transmission Service'), ('air_filter', 'Air Filter Replacement'), ('cabin_filter', 'Cabin Filter Replacement'), ('tune_up', 'Tune Up'), ('inspection', 'Inspection'), ('repair', 'Repair'), ('other', 'Other')], max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('cost_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost_histogram', models.JSONField(default=dict)),
+                ('interval_count', models.PositiveIntegerField(default=0)),
+                ('interval_days_sum', models.PositiveBigIntegerField(default=0)),
+                ('median_cost', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('p90_cost', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('make', 'model', 'year', 'service_type'), name='unique_service_cost_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0011_servicecoststats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerecord',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0012_servicerecord_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedservicerecord',
+            index=models.Index(fields=['archived_at', 'id'], name='vehicles_ar_archive_d9581f_idx'),
+        ),
+    ]
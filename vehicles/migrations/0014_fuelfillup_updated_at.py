@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0013_archived_sync_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fuelfillup',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0014_fuelfillup_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecoststats',
+            name='owner_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='servicecoststats',
+            name='owner_ids',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,3 +1,7 @@
+import hashlib
+import itertools
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -11,6 +15,13 @@ class Vehicle(models.Model):
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="vehicles")
+    fleet = models.ForeignKey(
+        "fleets.Fleet",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="vehicles",
+    )
     make = models.CharField(max_length=50)
     model = models.CharField(max_length=50)
     year = models.PositiveIntegerField()
@@ -25,6 +36,14 @@ class Vehicle(models.Model):
 
     class Meta:
         ordering = ["-year", "make", "model"]
+        indexes = [
+            models.Index(fields=["fleet", "make", "id"]),
+            models.Index(fields=["fleet", "model", "id"]),
+            models.Index(fields=["fleet", "year", "id"]),
+            models.Index(fields=["fleet", "condition", "id"]),
+            models.Index(fields=["fleet", "current_mileage", "id"]),
+            models.Index(fields=["user", "updated_at", "id"]),
+        ]
 
     def __str__(self):
         return (
@@ -52,11 +71,258 @@ class ServiceRecord(models.Model):
     mileage = models.PositiveIntegerField()
     cost = models.DecimalField(max_digits=10, decimal_places=2)
     notes = models.TextField(blank=True, null=True)
+    # Hash of the vehicle, type and bucketed date, mileage and cost; see fingerprint()
+    fingerprint = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-date", "-mileage"]
+        indexes = [
+            models.Index(fields=["vehicle", "date"]),
+            models.Index(fields=["updated_at", "id"]),
+        ]
+
+    is_archived = False
+
+    # Records of the same vehicle and type whose date, mileage and cost fall
+    # in the same buckets are duplicates
+    DUPLICATE_DATE_DAYS = 3
+    DUPLICATE_MILEAGE = 100
+    DUPLICATE_COST = Decimal("5")
 
     def __str__(self):
         return f"{self.vehicle} - {self.get_service_type_display()} on {self.date}"
+
+    @classmethod
+    def _buckets(cls, date, mileage, cost):
+        return (
+            date.toordinal() // cls.DUPLICATE_DATE_DAYS,
+            mileage // cls.DUPLICATE_MILEAGE,
+            int(Decimal(cost) // cls.DUPLICATE_COST),
+        )
+
+    @staticmethod
+    def _hash(vehicle_id, service_type, buckets):
+        key = ":".join(str(part) for part in (vehicle_id, service_type, *buckets))
+        return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+    @classmethod
+    def fingerprint_of(cls, vehicle_id, service_type, date, mileage, cost):
+        return cls._hash(vehicle_id, service_type, cls._buckets(date, mileage, cost))
+
+    @classmethod
+    def nearby_fingerprints(cls, vehicle_id, service_type, date, mileage, cost):
+        """Fingerprints of this bucket and its neighbours.
+
+        Values either side of a bucket boundary hash differently, so a new
+        record is checked against the adjacent buckets too: 27 index probes,
+        whatever the size of the table.
+        """
+        buckets = cls._buckets(date, mileage, cost)
+        return [
+            cls._hash(vehicle_id, service_type, [b + o for b, o in zip(buckets, offsets)])
+            for offsets in itertools.product((-1, 0, 1), repeat=3)
+        ]
+
+    def save(self, *args, **kwargs):
+        for name in ("date", "mileage", "cost"):
+            field = self._meta.get_field(name)
+            setattr(self, name, field.to_python(getattr(self, name)))
+        self.fingerprint = self.fingerprint_of(
+            self.vehicle_id, self.service_type, self.date, self.mileage, self.cost
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "fingerprint"}
+        super().save(*args, **kwargs)
+
+
+class OdometerReading(models.Model):
+    """A single timestamped odometer value, e.g. pushed by a telematics device."""
+
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.CASCADE, related_name="odometer_readings"
+    )
+    recorded_at = models.DateTimeField()
+    mileage = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["vehicle", "recorded_at"]
+        constraints = [
+            # Doubles as the (vehicle, recorded_at) index and drops re-sent readings
+            models.UniqueConstraint(
+                fields=["vehicle", "recorded_at"], name="unique_odometer_reading"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle} - {self.mileage} at {self.recorded_at}"
+
+
+class FuelFillUp(models.Model):
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.CASCADE, related_name="fuel_fill_ups"
+    )
+    date = models.DateField()
+    odometer = models.PositiveIntegerField()
+    gallons = models.DecimalField(max_digits=7, decimal_places=3)
+    total_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    full_tank = models.BooleanField(
+        default=True, help_text="Uncheck for a partial fill-up."
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-date", "-odometer"]
+        indexes = [models.Index(fields=["vehicle", "date", "odometer"])]
+
+    def __str__(self):
+        return f"{self.vehicle} - {self.gallons} gal on {self.date}"
+
+
+class MaintenanceForecast(models.Model):
+    vehicle = models.OneToOneField(
+        Vehicle, on_delete=models.CASCADE, related_name="maintenance_forecast"
+    )
+    start_month = models.DateField()
+    monthly_costs = models.JSONField(
+        help_text="Expected cost for each of the 12 months from start_month."
+    )
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2)
+    generated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.vehicle} - {self.total_cost} from {self.start_month}"
+
+    def months(self):
+        """Return ``(month, cost)`` pairs for the forecast horizon."""
+        from .forecast import add_months
+
+        return [
+            (add_months(self.start_month, offset), cost)
+            for offset, cost in enumerate(self.monthly_costs)
+        ]
+
+
+class ServiceAttachment(models.Model):
+    service_record = models.ForeignKey(
+        ServiceRecord, on_delete=models.CASCADE, related_name="attachments"
+    )
+    sha256 = models.CharField(max_length=64, db_index=True)
+    original_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-uploaded_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["service_record", "sha256"],
+                name="unique_attachment_per_record",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.service_record} - {self.original_name}"
+
+    @property
+    def is_image(self):
+        return self.content_type.startswith("image/")
+
+
+class ArchivedServiceRecord(models.Model):
+    """A service record moved out of the hot table by ``archive_service_records``.
+
+    Rows keep the id they had as a :class:`ServiceRecord` and are read-only.
+    """
+
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.CASCADE, related_name="archived_service_records"
+    )
+    service_type = models.CharField(
+        max_length=50, choices=ServiceRecord.SERVICE_TYPE_CHOICES
+    )
+    date = models.DateField()
+    mileage = models.PositiveIntegerField()
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        ordering = ["-date", "-mileage"]
+        indexes = [
+            models.Index(fields=["vehicle", "date"]),
+            models.Index(fields=["archived_at", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle} - {self.get_service_type_display()} on {self.date} (archived)"
+
+
+class ServiceCostStats(models.Model):
+    """Service cost and interval statistics for one make/model/year/type.
+
+    Maintained by ``vehicles.service_stats``; ``make`` and ``model`` are
+    stored lower-cased so spelling variants share a row.
+    """
+
+    make = models.CharField(max_length=50)
+    model = models.CharField(max_length=50)
+    year = models.PositiveIntegerField()
+    service_type = models.CharField(
+        max_length=50, choices=ServiceRecord.SERVICE_TYPE_CHOICES
+    )
+    count = models.PositiveIntegerField(default=0)
+    # Distinct owners of the group's records, kept only up to
+    # SERVICE_STATS_MIN_OWNERS since that is all the threshold needs
+    owner_ids = models.JSONField(default=list)
+    owner_count = models.PositiveIntegerField(default=0)
+    cost_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost_histogram = models.JSONField(default=dict)
+    interval_count = models.PositiveIntegerField(default=0)
+    interval_days_sum = models.PositiveBigIntegerField(default=0)
+    median_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    p90_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["make", "model", "year", "service_type"],
+                name="unique_service_cost_stats",
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.year} {self.make} {self.model} - "
+            f"{self.get_service_type_display()} ({self.count})"
+        )
+
+    @property
+    def mean_cost(self):
+        return self.cost_sum / self.count if self.count else None
+
+    @property
+    def mean_interval_days(self):
+        if not self.interval_count:
+            return None
+        return round(self.interval_days_sum / self.interval_count)
+
+
+class ServiceStatsCursor(models.Model):
+    """Id of the last service record folded into :class:`ServiceCostStats`."""
+
+    last_record_id = models.BigIntegerField(default=0)
+    rebuilt_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Service stats up to record {self.last_record_id}"
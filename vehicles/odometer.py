@@ -0,0 +1,172 @@
+"""Odometer time series: bulk ingest, daily/weekly rollups and mileage rates."""
+import datetime
+from collections import namedtuple
+from functools import reduce
+from itertools import groupby
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import OdometerReading, Vehicle
+
+INGEST_BATCH_SIZE = 5000
+
+Rollup = namedtuple("Rollup", ["vehicle_id", "period", "min", "max", "readings"])
+MileageRate = namedtuple("MileageRate", ["vehicle_id", "miles_per_day", "days"])
+IngestResult = namedtuple("IngestResult", ["received", "accepted", "errors"])
+
+PERIODS = {
+    "day": TruncDate("recorded_at"),
+    "week": TruncWeek("recorded_at"),
+}
+
+
+class ReadingError(ValueError):
+    pass
+
+
+def parse_reading(item):
+    """Return ``(vehicle_id, recorded_at, mileage)`` from an ingest payload item."""
+    try:
+        vehicle_id = int(item["vehicle"])
+        mileage = int(item["mileage"])
+        recorded_at = parse_datetime(str(item["recorded_at"]))
+    except (KeyError, TypeError, ValueError):
+        raise ReadingError("Each reading needs vehicle, recorded_at and mileage.")
+    if recorded_at is None:
+        raise ReadingError(f"Invalid recorded_at {item['recorded_at']!r}.")
+    if mileage < 0:
+        raise ReadingError("mileage must not be negative.")
+    if timezone.is_naive(recorded_at):
+        recorded_at = timezone.make_aware(recorded_at, datetime.timezone.utc)
+    return vehicle_id, recorded_at, mileage
+
+
+def ingest_readings(user, items):
+    """Store readings for vehicles owned by ``user``.
+
+    Ownership is checked with one query for the whole payload, readings are
+    inserted with ``bulk_create`` (already-stored timestamps are skipped) and
+    each vehicle's ``current_mileage`` is raised to its newest value.
+    Returns :class:`IngestResult`, where ``received`` counts the valid
+    readings of owned vehicles and ``accepted`` the rows actually stored.
+    """
+    readings, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            readings.append(parse_reading(item))
+        except ReadingError as exc:
+            errors.append({"index": index, "error": str(exc)})
+
+    owned = set(
+        Vehicle.objects.filter(
+            user=user, pk__in={vehicle_id for vehicle_id, _, _ in readings}
+        ).values_list("pk", flat=True)
+    )
+    objects = []
+    latest = {}
+    spans = {}
+    for vehicle_id, recorded_at, mileage in readings:
+        if vehicle_id not in owned:
+            errors.append({"vehicle": vehicle_id, "error": "Unknown vehicle."})
+            continue
+        objects.append(
+            OdometerReading(
+                vehicle_id=vehicle_id, recorded_at=recorded_at, mileage=mileage
+            )
+        )
+        latest[vehicle_id] = max(latest.get(vehicle_id, 0), mileage)
+        first, last = spans.get(vehicle_id, (recorded_at, recorded_at))
+        spans[vehicle_id] = (min(first, recorded_at), max(last, recorded_at))
+
+    keys = {(reading.vehicle_id, reading.recorded_at) for reading in objects}
+    with transaction.atomic():
+        # ignore_conflicts hides which rows were skipped, so the stored keys
+        # are looked up first, only within each vehicle's span of the payload
+        accepted = 0
+        if objects:
+            stored = OdometerReading.objects.filter(
+                reduce(
+                    or_,
+                    (
+                        Q(vehicle_id=vehicle_id, recorded_at__range=span)
+                        for vehicle_id, span in spans.items()
+                    ),
+                )
+            ).values_list("vehicle_id", "recorded_at")
+            accepted = len(keys - set(stored))
+        OdometerReading.objects.bulk_create(
+            objects, batch_size=INGEST_BATCH_SIZE, ignore_conflicts=True
+        )
+        now = timezone.now()
+        for vehicle_id, mileage in latest.items():
+            # update() skips auto_now, and sync clients page by updated_at
+            Vehicle.objects.filter(
+                pk=vehicle_id, current_mileage__lt=mileage
+            ).update(current_mileage=mileage, updated_at=now)
+    return IngestResult(len(objects), accepted, errors)
+
+
+def rollups(readings, period="day"):
+    """Downsample ``readings`` to one row per vehicle and day or week."""
+    return [
+        Rollup(*row)
+        for row in readings.annotate(period=PERIODS[period])
+        .order_by()
+        .values("vehicle_id", "period")
+        .annotate(low=Min("mileage"), high=Max("mileage"), readings=Count("pk"))
+        .order_by("vehicle_id", "period")
+        .values_list("vehicle_id", "period", "low", "high", "readings")
+    ]
+
+
+def estimate_mileage_rates(readings=None):
+    """Fit miles per day for every vehicle in ``readings`` by least squares.
+
+    The fit runs over daily maximums, which the database computes in one
+    grouped query, so the work in Python is proportional to vehicle-days
+    rather than raw readings. Vehicles with fewer than two days of data are
+    skipped.
+    """
+    if readings is None:
+        readings = OdometerReading.objects.all()
+    daily = (
+        readings.annotate(day=TruncDate("recorded_at"))
+        .order_by()
+        .values("vehicle_id", "day")
+        .annotate(high=Max("mileage"))
+        .order_by("vehicle_id", "day")
+        .values_list("vehicle_id", "day", "high")
+        .iterator(chunk_size=INGEST_BATCH_SIZE)
+    )
+    rates = {}
+    for vehicle_id, points in groupby(daily, key=lambda row: row[0]):
+        rate = _least_squares_slope(points)
+        if rate is not None:
+            rates[vehicle_id] = MileageRate(vehicle_id, *rate)
+    return rates
+
+
+def _least_squares_slope(points):
+    n = sum_x = sum_y = sum_xx = sum_xy = 0
+    origin = None
+    first_day = last_day = None
+    for _vehicle_id, day, mileage in points:
+        if origin is None:
+            origin, first_day = day.toordinal(), day
+        x = day.toordinal() - origin  # keeps the sums small and well conditioned
+        n += 1
+        sum_x += x
+        sum_y += mileage
+        sum_xx += x * x
+        sum_xy += x * mileage
+        last_day = day
+    denominator = n * sum_xx - sum_x * sum_x
+    if n < 2 or denominator == 0:
+        return None
+    slope = (n * sum_xy - sum_x * sum_y) / denominator
+    return slope, (last_day - first_day).days
@@ -0,0 +1,220 @@
+"""Vehicle history reports rendered outside the web request.
+
+A report covers a vehicle's service records, registrations and insurance
+policies. Each one is stored under ``REPORT_ROOT/<vehicle>/<version>.html``,
+where the version is a hash of everything the report shows, so a vehicle
+whose data has not changed is never rendered twice and a stale report is
+never served. Rendering runs in a pool of worker processes; PDF copies are
+written as well when WeasyPrint is installed.
+"""
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from compliance.models import CarRegistration
+from insurance.models import InsurancePolicy
+from .archive import service_history
+from .models import ArchivedServiceRecord, ServiceRecord, Vehicle
+
+# Bump when the report template changes so existing reports are re-rendered
+TEMPLATE_VERSION = "1"
+FORMATS = {"html": "text/html", "pdf": "application/pdf"}
+# Partial files older than this were left by a worker that died mid-write
+PARTIAL_MAX_AGE = 3600
+
+_report_pool = None
+
+
+def pdf_available():
+    try:
+        import weasyprint  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def report_path(vehicle_id, version, fmt="html"):
+    return Path(settings.REPORT_ROOT) / str(vehicle_id) / f"{version}.{fmt}"
+
+
+def data_versions(vehicle_ids):
+    """Return ``{vehicle_id: version}`` using one query per table.
+
+    Service records and registrations are fingerprinted by primary key and
+    ``updated_at``; insurance policies have no timestamp, so their reported
+    fields are hashed directly. Archived service records never change, so
+    their count and latest ``archived_at`` stand in for them without reading
+    the archive's rows.
+    """
+    rows = defaultdict(list)
+    vehicles = Vehicle.objects.filter(pk__in=vehicle_ids).values_list("pk", "updated_at")
+    for pk, updated_at in vehicles:
+        rows[pk].append(("vehicle", updated_at.isoformat()))
+    sources = [
+        (
+            ServiceRecord.objects.values_list("vehicle_id", "pk", "updated_at").order_by("pk"),
+            "service",
+        ),
+        (
+            ArchivedServiceRecord.objects.order_by("vehicle_id")
+            .values("vehicle_id")
+            .annotate(count=Count("pk"), last=Max("archived_at"))
+            .values_list("vehicle_id", "count", "last"),
+            "archived",
+        ),
+        (
+            CarRegistration.objects.values_list("vehicle_id", "pk", "updated_at").order_by("pk"),
+            "registration",
+        ),
+        (
+            InsurancePolicy.objects.values_list(
+                "vehicle_id", "pk", "provider", "policy_number", "coverage_start",
+                "coverage_end", "premium",
+            ).order_by("pk"),
+            "policy",
+        ),
+    ]
+    for queryset, label in sources:
+        for vehicle_id, *values in queryset.filter(vehicle_id__in=list(rows)):
+            rows[vehicle_id].append((label, *map(str, values)))
+    return {
+        vehicle_id: hashlib.sha256(
+            repr((TEMPLATE_VERSION, fingerprint)).encode()
+        ).hexdigest()[:32]
+        for vehicle_id, fingerprint in rows.items()
+    }
+
+
+def report_version(vehicle):
+    return data_versions([vehicle.pk]).get(vehicle.pk)
+
+
+def is_ready(vehicle_id, version):
+    return version is not None and report_path(vehicle_id, version).exists()
+
+
+def render_report(vehicle_id):
+    """Render and store the current report of one vehicle; returns its version.
+
+    Runs in a worker process. Nothing is rendered if the report for the
+    current data version already exists.
+    """
+    version = data_versions([vehicle_id]).get(vehicle_id)
+    if version is None or is_ready(vehicle_id, version):
+        return version
+    vehicle = Vehicle.objects.select_related("user").get(pk=vehicle_id)
+    html = render_to_string(
+        "vehicles/history_report.html",
+        {
+            "vehicle": vehicle,
+            # The report covers the whole history, archive included, oldest first
+            "service_records": service_history(vehicle, show_all=True)[::-1],
+            "car_registrations": vehicle.car_registrations.order_by("registration_date"),
+            "insurance_policies": vehicle.insurance_policies.order_by("coverage_start"),
+            "generated_at": timezone.now(),
+            "version": version,
+        },
+    )
+    target = report_path(vehicle_id, version)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if pdf_available():
+        import weasyprint
+
+        _write_atomic(target.with_suffix(".pdf"), weasyprint.HTML(string=html).write_pdf())
+    # The HTML file is written last since its presence marks the report ready
+    _write_atomic(target, html.encode())
+    _remove_stale(target.parent, version)
+    return version
+
+
+def _write_atomic(path, content):
+    # Named per process, so that workers rendering the same version at
+    # once never write into or rename each other's file
+    partial = path.with_name(f"{path.name}.{os.getpid()}.part")
+    partial.write_bytes(content)
+    os.replace(partial, path)
+
+
+def _remove_stale(directory, version):
+    """Delete finished reports of other versions and abandoned partial files.
+
+    Partial files are written by other workers that may still be running,
+    so they are only removed once older than ``PARTIAL_MAX_AGE``.
+    """
+    expired = time.time() - PARTIAL_MAX_AGE
+    for path in directory.iterdir():
+        try:
+            if path.suffix == ".part":
+                if path.stat().st_mtime < expired:
+                    path.unlink()
+            elif path.name.split(".")[0] != version:
+                path.unlink()
+        except FileNotFoundError:
+            # Renamed or removed by another worker meanwhile
+            continue
+
+
+def report_pool(workers=None):
+    """Return the shared pool, or a new one when ``workers`` is given.
+
+    Workers are spawned rather than forked so that none of them inherits the
+    parent's database connections.
+    """
+    global _report_pool
+    if workers is not None:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        )
+    if _report_pool is None:
+        _report_pool = report_pool(settings.REPORT_WORKERS)
+    return _report_pool
+
+
+def request_report(vehicle):
+    """Queue a report for ``vehicle`` unless the current one exists.
+
+    Returns ``(version, ready)``.
+    """
+    version = report_version(vehicle)
+    if is_ready(vehicle.pk, version):
+        return version, True
+    if not settings.REPORT_WORKERS:
+        render_report(vehicle.pk)
+        return version, True
+    report_pool().submit(render_report, vehicle.pk)
+    return version, False
+
+
+def render_reports(vehicle_ids, workers=1):
+    """Render every out-of-date report in ``vehicle_ids``.
+
+    ``workers`` greater than one spreads the work over that many processes;
+    ``0`` uses every core. Returns ``(rendered, up_to_date)``.
+    """
+    versions = data_versions(vehicle_ids)
+    pending = [
+        vehicle_id
+        for vehicle_id, version in versions.items()
+        if not is_ready(vehicle_id, version)
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(pending) > 1:
+        with report_pool(workers) as pool:
+            chunksize = max(1, len(pending) // (workers * 4))
+            list(pool.map(render_report, pending, chunksize=chunksize))
+    else:
+        for vehicle_id in pending:
+            render_report(vehicle_id)
+    return len(pending), len(versions) - len(pending)
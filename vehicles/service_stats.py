@@ -0,0 +1,252 @@
+"""Typical service costs and intervals per make, model, year and service type.
+
+Aggregating every matching record across all users on a page view is far
+too slow, so the figures are kept in :class:`ServiceCostStats`, one row per
+group, and read with a single lookup on its unique index.
+
+Costs are summarised by a count, a sum and a sparse histogram with
+logarithmic buckets, all of which can be added to. New service records are
+folded in incrementally by :func:`refresh_service_stats`, which follows
+record ids from a stored cursor; the median and 90th percentile are read
+off the histogram, to within half a bucket (about 2.5%). Edits, deletions
+and vehicles changing make, model or year are only picked up by the
+periodic :func:`rebuild_service_stats`. Both read the archive as well, and
+agree on intervals: a service's interval runs from the latest earlier
+date, so services recorded on the same day do not count as 0-day intervals.
+
+A group is only shown once its records come from ``SERVICE_STATS_MIN_OWNERS``
+different owners; a large count from a single fleet owner would otherwise
+reveal that owner's costs.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import itemgetter, or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ArchivedServiceRecord, ServiceCostStats, ServiceRecord, ServiceStatsCursor
+
+CHUNK_SIZE = 2000
+# Histogram bucket i >= 1 holds costs in [GROWTH ** (i - 1), GROWTH ** i)
+GROWTH = 1.05
+CENTS = Decimal("0.01")
+# Rows fetched per lookup query, four parameters each
+KEYS_PER_QUERY = 200
+RECORD_FIELDS = [
+    "vehicle__make", "vehicle__model", "vehicle__year", "service_type", "vehicle__user_id",
+    "cost", "date",
+]
+
+
+def stats_key(make, model, year, service_type):
+    return (make.strip().lower(), model.strip().lower(), year, service_type)
+
+
+def bucket(cost):
+    if cost < 1:
+        return 0
+    return 1 + int(math.log(cost) / math.log(GROWTH))
+
+
+def percentile(histogram, count, fraction):
+    """Estimate the ``fraction`` percentile cost from a bucket histogram."""
+    if not count:
+        return None
+    rank = fraction * count
+    seen = 0
+    for index in sorted(histogram, key=int):
+        seen += histogram[index]
+        if seen >= rank:
+            index = int(index)
+            middle = 0.5 if index == 0 else GROWTH ** (index - 0.5)
+            return Decimal(middle).quantize(CENTS)
+    return None
+
+
+class Accumulator:
+    """Additive summary of the costs and intervals of one group."""
+
+    def __init__(self):
+        self.count = 0
+        self.owners = set()
+        self.cost_sum = Decimal(0)
+        self.histogram = Counter()
+        self.interval_count = 0
+        self.interval_days_sum = 0
+
+    def add(self, cost, owner_id, interval_days=None):
+        self.count += 1
+        self.owners.add(owner_id)
+        self.cost_sum += cost
+        self.histogram[str(bucket(cost))] += 1
+        if interval_days is not None:
+            self.interval_count += 1
+            self.interval_days_sum += interval_days
+
+    def merge_into(self, stats):
+        """Add this summary to ``stats`` and refresh its percentiles."""
+        histogram = Counter(stats.cost_histogram or {})
+        histogram.update(self.histogram)
+        owners = sorted(set(stats.owner_ids) | self.owners)
+        stats.count += self.count
+        stats.owner_ids = owners[:settings.SERVICE_STATS_MIN_OWNERS]
+        stats.owner_count = len(stats.owner_ids)
+        stats.cost_sum += self.cost_sum
+        stats.cost_histogram = dict(histogram)
+        stats.interval_count += self.interval_count
+        stats.interval_days_sum += self.interval_days_sum
+        stats.median_cost = percentile(histogram, stats.count, 0.5)
+        stats.p90_cost = percentile(histogram, stats.count, 0.9)
+        stats.updated_at = timezone.now()
+        return stats
+
+
+def _save(accumulators, replace=False):
+    """Merge ``{key: Accumulator}`` into the table (or replace its rows)."""
+    keys = list(accumulators)
+    existing = {}
+    if not replace:
+        for start in range(0, len(keys), KEYS_PER_QUERY):
+            condition = reduce(
+                or_,
+                (
+                    Q(make=make, model=model, year=year, service_type=service_type)
+                    for make, model, year, service_type in keys[start:start + KEYS_PER_QUERY]
+                ),
+            )
+            for stats in ServiceCostStats.objects.filter(condition):
+                existing[stats_key(stats.make, stats.model, stats.year, stats.service_type)] = stats
+    created, updated = [], []
+    for key, accumulator in accumulators.items():
+        if key in existing:
+            updated.append(accumulator.merge_into(existing[key]))
+        else:
+            make, model, year, service_type = key
+            created.append(
+                accumulator.merge_into(
+                    ServiceCostStats(make=make, model=model, year=year, service_type=service_type)
+                )
+            )
+    ServiceCostStats.objects.bulk_create(created, batch_size=500)
+    ServiceCostStats.objects.bulk_update(
+        updated,
+        [
+            "count", "owner_ids", "owner_count", "cost_sum", "cost_histogram",
+            "interval_count", "interval_days_sum", "median_cost", "p90_cost", "updated_at",
+        ],
+        batch_size=500,
+    )
+    return len(created) + len(updated)
+
+
+def refresh_service_stats(chunk_size=CHUNK_SIZE):
+    """Fold service records added since the last run into the statistics.
+
+    Each record's interval is the time since the previous service of the
+    same type on the same vehicle, hot or archived. Returns the number of
+    records folded in.
+    """
+    hot, cold = (
+        Subquery(
+            model.objects.filter(
+                vehicle_id=OuterRef("vehicle_id"),
+                service_type=OuterRef("service_type"),
+                date__lt=OuterRef("date"),
+            )
+            .order_by("-date")
+            .values("date")[:1]
+        )
+        for model in (ServiceRecord, ArchivedServiceRecord)
+    )
+    # Greatest is NULL if either side is, so each falls back to the other
+    previous = Greatest(Coalesce(hot, cold), Coalesce(cold, hot))
+    processed = 0
+    while True:
+        with transaction.atomic():
+            cursor, _created = ServiceStatsCursor.objects.select_for_update().get_or_create(pk=1)
+            rows = list(
+                ServiceRecord.objects.filter(pk__gt=cursor.last_record_id)
+                .order_by("pk")
+                .annotate(previous_date=previous)
+                .values_list("pk", *RECORD_FIELDS, "previous_date")[:chunk_size]
+            )
+            if not rows:
+                break
+            accumulators = defaultdict(Accumulator)
+            for _pk, make, model, year, service_type, owner_id, cost, date, previous_date in rows:
+                interval = (date - previous_date).days if previous_date else None
+                accumulators[stats_key(make, model, year, service_type)].add(
+                    cost, owner_id, interval
+                )
+            _save(accumulators)
+            cursor.last_record_id = rows[-1][0]
+            cursor.save()
+        processed += len(rows)
+    return processed
+
+
+def _ordered_records(queryset):
+    return (
+        queryset.order_by("vehicle_id", "service_type", "date")
+        .values_list("vehicle_id", *RECORD_FIELDS)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def rebuild_service_stats():
+    """Recompute every group from the hot and archived service records.
+
+    Returns the number of groups.
+    """
+    with transaction.atomic():
+        last_id = ServiceRecord.objects.order_by("-pk").values_list("pk", flat=True).first()
+        # Records of each vehicle and type arrive in date order from both tables
+        records = heapq.merge(
+            _ordered_records(ServiceRecord.objects.filter(pk__lte=last_id or 0)),
+            _ordered_records(ArchivedServiceRecord.objects.all()),
+            key=itemgetter(0, 4, 7),
+        )
+        accumulators = defaultdict(Accumulator)
+        group = last = earlier = None
+        for vehicle_id, make, model, year, service_type, owner_id, cost, date in records:
+            if group != (vehicle_id, service_type):
+                group, earlier = (vehicle_id, service_type), None
+            elif date != last:
+                earlier = last
+            last = date
+            interval = (date - earlier).days if earlier else None
+            accumulators[stats_key(make, model, year, service_type)].add(
+                cost, owner_id, interval
+            )
+        ServiceCostStats.objects.all().delete()
+        count = _save(accumulators, replace=True)
+        ServiceStatsCursor.objects.update_or_create(
+            pk=1, defaults={"last_record_id": last_id or 0, "rebuilt_at": timezone.now()}
+        )
+    return count
+
+
+def stats_for_vehicle(vehicle):
+    """Return ``{service_type: ServiceCostStats}`` for ``vehicle``'s group.
+
+    One lookup on the unique index; groups with records from fewer than
+    ``SERVICE_STATS_MIN_OWNERS`` owners are left out so that no single
+    owner's costs can be read back.
+    """
+    make, model, year, _type = stats_key(vehicle.make, vehicle.model, vehicle.year, "")
+    return {
+        stats.service_type: stats
+        for stats in ServiceCostStats.objects.filter(
+            make=make,
+            model=model,
+            year=year,
+            owner_count__gte=settings.SERVICE_STATS_MIN_OWNERS,
+        )
+    }
@@ -0,0 +1,11 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .attachments import remove_unreferenced
+from .models import ServiceAttachment
+
+
+@receiver(post_delete, sender=ServiceAttachment)
+def service_attachment_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: remove_unreferenced(instance.sha256))
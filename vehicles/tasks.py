@@ -0,0 +1,31 @@
+from jobs.queue import task
+
+from .archive import archive_service_records
+from .forecast import refresh_forecasts
+from .reports import render_report
+from .service_stats import rebuild_service_stats, refresh_service_stats
+
+
+@task
+def render_history_report(vehicle_id):
+    render_report(vehicle_id)
+
+
+@task
+def refresh_maintenance_forecasts():
+    refresh_forecasts()
+
+
+@task
+def archive_old_service_records():
+    archive_service_records()
+
+
+@task
+def refresh_service_cost_stats():
+    refresh_service_stats()
+
+
+@task
+def rebuild_service_cost_stats():
+    rebuild_service_stats()
@@ -1,10 +1,45 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Vehicle, ServiceRecord
+from .models import (
+    Vehicle, ServiceRecord, OdometerReading, FuelFillUp, MaintenanceForecast,
+    ServiceAttachment, ArchivedServiceRecord, ServiceCostStats
+)
+from .archive import archive_service_records, service_history
+from .duplicates import find_duplicates, merge_duplicates
+from .service_stats import (
+    percentile, rebuild_service_stats, refresh_service_stats, stats_for_vehicle
+)
+from .attachments import blob_path
+from .reports import render_reports, report_version
+from .deletion import delete_vehicle
+from .backup import BackupError, export_account, restore_account
+from sync.models import Tombstone
+from .forecast import fleet_forecast, refresh_forecasts
+from .odometer import estimate_mileage_rates, rollups
+from .fuel import get_fuel_stats, import_fill_ups
 from .forms import VehicleForm, ServiceRecordForm
-from datetime import date
+from .views import annotate_garage_summary, attachment_upload
+from compliance.models import CarRegistration
+from insurance.models import InsurancePolicy
+from fleets.models import Fleet
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
 from decimal import Decimal
+from unittest import mock
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 
 
 class VehicleListTemplateTest(TestCase):
@@ -573,3 +608,1338 @@ class ServiceRecordViewTest(TestCase):
         self.assertEqual(len(messages), 1)
         self.assertEqual(str(messages[0]), 'Service record deleted successfully.')
         self.assertEqual(messages[0].tags, 'success')
+
+
+class VehicleListSummaryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.other_vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Honda',
+            model='Civic',
+            year=2019,
+            current_mileage=30000
+        )
+        today = date.today()
+        for day, cost in [(date(2023, 1, 10), '49.99'), (date(2024, 3, 5), '350.01')]:
+            ServiceRecord.objects.create(
+                vehicle=self.vehicle,
+                service_type='oil_change',
+                date=day,
+                mileage=20000,
+                cost=cost
+            )
+        CarRegistration.objects.create(
+            vehicle=self.vehicle,
+            registration_number='ABC123',
+            state='NC',
+            registration_date=today - timedelta(days=10),
+            expiration_date=today + timedelta(days=355)
+        )
+        InsurancePolicy.objects.create(
+            user=self.user,
+            vehicle=self.vehicle,
+            provider='State Farm',
+            policy_number='SF123',
+            coverage_start=today - timedelta(days=10),
+            coverage_end=today + timedelta(days=355),
+            premium='1200.00'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_garage_summary_annotations(self):
+        """Test that each vehicle is annotated with its garage summary"""
+        vehicles = {
+            v.pk: v for v in annotate_garage_summary(Vehicle.objects.filter(user=self.user))
+        }
+
+        summary = vehicles[self.vehicle.pk]
+        self.assertEqual(summary.last_service_date, date(2024, 3, 5))
+        self.assertEqual(summary.lifetime_cost, Decimal('400.00'))
+        self.assertEqual(summary.next_registration_expiry, date.today() + timedelta(days=355))
+        self.assertTrue(summary.has_active_insurance)
+
+        empty = vehicles[self.other_vehicle.pk]
+        self.assertIsNone(empty.last_service_date)
+        self.assertIsNone(empty.lifetime_cost)
+        self.assertFalse(empty.has_active_insurance)
+
+    def test_garage_summary_includes_archived_services(self):
+        """Test that archived service records still count towards the summary"""
+        for before in (date(2024, 1, 1), date(2025, 1, 1)):
+            archive_service_records(before=before)
+
+            summary = annotate_garage_summary(Vehicle.objects.filter(user=self.user)).get(
+                pk=self.vehicle.pk
+            )
+            self.assertEqual(summary.last_service_date, date(2024, 3, 5))
+            self.assertEqual(summary.lifetime_cost, Decimal('400.00'))
+
+    def test_garage_renders_from_single_vehicle_query(self):
+        """Test that the whole enriched garage is loaded in one SQL statement"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('vehicles:vehicle_list'))
+
+        self.assertContains(response, 'Lifetime cost: $400.00')
+        self.assertContains(response, 'Insured')
+        garage_queries = [
+            q['sql'] for q in queries.captured_queries
+            if 'FROM "vehicles_vehicle"' in q['sql']
+        ]
+        self.assertEqual(len(garage_queries), 1)
+
+
+class OdometerTimeSeriesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.other_vehicle = Vehicle.objects.create(
+            user=self.other_user,
+            make='Honda',
+            model='Civic',
+            year=2019,
+            current_mileage=30000
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def ingest(self, readings):
+        return self.client.post(
+            reverse('vehicles:odometer_ingest'),
+            data=json.dumps(readings),
+            content_type='application/json'
+        )
+
+    def test_ingest_stores_readings_and_updates_mileage(self):
+        """Test that ingest stores owned readings and raises current mileage"""
+        response = self.ingest([
+            {'vehicle': self.vehicle.id, 'recorded_at': '2024-01-01T08:00:00Z', 'mileage': 25100},
+            {'vehicle': self.vehicle.id, 'recorded_at': '2024-01-01T09:00:00Z', 'mileage': 25150},
+            {'vehicle': self.other_vehicle.id, 'recorded_at': '2024-01-01T09:00:00Z', 'mileage': 1},
+            {'vehicle': self.vehicle.id, 'mileage': 1},
+        ])
+
+        data = response.json()
+        self.assertEqual(data['received'], 2)
+        self.assertEqual(data['accepted'], 2)
+        self.assertEqual(len(data['errors']), 2)
+        self.assertEqual(self.vehicle.odometer_readings.count(), 2)
+        self.assertEqual(self.other_vehicle.odometer_readings.count(), 0)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.current_mileage, 25150)
+
+    def test_ingest_ignores_resent_readings(self):
+        """Test that re-sending the same timestamp does not duplicate readings"""
+        reading = {'vehicle': self.vehicle.id, 'recorded_at': '2024-01-01T08:00:00Z', 'mileage': 25100}
+        self.ingest([reading])
+        data = self.ingest([reading]).json()
+        self.assertEqual(self.vehicle.odometer_readings.count(), 1)
+        self.assertEqual((data['received'], data['accepted']), (1, 0))
+
+    def test_ingest_counts_conflicts_within_the_payload_span(self):
+        """Test that accepted rows are counted without reading the whole history"""
+        OdometerReading.objects.bulk_create(
+            OdometerReading(
+                vehicle=self.vehicle, mileage=day,
+                recorded_at=datetime(2023, 1, 1, tzinfo=dt_timezone.utc) + timedelta(days=day)
+            )
+            for day in range(300)
+        )
+        reading = {'vehicle': self.vehicle.id, 'recorded_at': '2024-06-01T08:00:00Z', 'mileage': 26000}
+        self.ingest([reading])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.ingest([
+                reading,
+                {**reading, 'recorded_at': '2024-06-02T08:00:00+02:00'},
+                {**reading, 'recorded_at': '2024-06-02T06:00:00Z'},
+            ]).json()
+
+        self.assertEqual((data['received'], data['accepted']), (3, 1))
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT COUNT(')
+        ])
+
+    def test_ingest_mileage_change_reaches_sync(self):
+        """Test that raising current mileage bumps updated_at for delta sync"""
+        before = self.vehicle.updated_at
+        self.ingest([
+            {'vehicle': self.vehicle.id, 'recorded_at': '2024-01-01T08:00:00Z', 'mileage': 25100},
+        ])
+        self.vehicle.refresh_from_db()
+        self.assertGreater(self.vehicle.updated_at, before)
+
+    def test_daily_rollups_and_mileage_rate(self):
+        """Test that readings downsample per day and fit a miles-per-day rate"""
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        OdometerReading.objects.bulk_create([
+            OdometerReading(
+                vehicle=self.vehicle,
+                recorded_at=start + timedelta(days=day, hours=hour),
+                mileage=25000 + 40 * day + hour
+            )
+            for day in range(10)
+            for hour in (8, 12, 18)
+        ])
+
+        response = self.client.get(
+            reverse('vehicles:odometer_series', kwargs={'pk': self.vehicle.pk})
+        )
+
+        data = response.json()
+        self.assertEqual(len(data['points']), 10)
+        self.assertEqual(data['points'][0], {
+            'period': '2024-01-01', 'min': 25008, 'max': 25018, 'readings': 3
+        })
+        self.assertAlmostEqual(data['miles_per_day'], 40.0)
+
+        weekly = rollups(self.vehicle.odometer_readings.all(), 'week')
+        self.assertEqual(sum(row.readings for row in weekly), 30)
+
+    def test_fleet_mileage_rates_per_vehicle(self):
+        """Test that one fit call estimates a rate for every vehicle"""
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        for vehicle, per_day in ((self.vehicle, 30), (self.other_vehicle, 55)):
+            OdometerReading.objects.bulk_create([
+                OdometerReading(
+                    vehicle=vehicle,
+                    recorded_at=start + timedelta(days=day),
+                    mileage=1000 + per_day * day
+                )
+                for day in range(5)
+            ])
+
+        with self.assertNumQueries(1):
+            rates = estimate_mileage_rates()
+
+        self.assertAlmostEqual(rates[self.vehicle.id].miles_per_day, 30.0)
+        self.assertAlmostEqual(rates[self.other_vehicle.id].miles_per_day, 55.0)
+        self.assertEqual(rates[self.vehicle.id].days, 4)
+
+
+class FuelLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000,
+            vin='1HGCM82633A004352'
+        )
+        self.other_vehicle = Vehicle.objects.create(
+            user=self.other_user,
+            make='Honda',
+            model='Civic',
+            year=2019,
+            current_mileage=30000
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def add_fill_up(self, day, odometer, gallons, cost, full_tank=True):
+        return FuelFillUp.objects.create(
+            vehicle=self.vehicle,
+            date=date(2024, 1, day),
+            odometer=odometer,
+            gallons=Decimal(gallons),
+            total_cost=Decimal(cost),
+            full_tank=full_tank
+        )
+
+    def test_mpg_counts_partial_fill_ups(self):
+        """Test that a partial fill-up's gallons go into the next full tank"""
+        self.add_fill_up(1, 10000, '10', '30.00')
+        self.add_fill_up(5, 10200, '4', '12.00', full_tank=False)
+        self.add_fill_up(9, 10300, '6', '18.00')
+        self.add_fill_up(15, 10600, '12', '36.00')
+
+        stats = get_fuel_stats(self.vehicle.id)
+
+        self.assertEqual(stats['fill_ups'], 4)
+        self.assertEqual([i['mpg'] for i in stats['intervals']], [30.0, 25.0])
+        self.assertEqual([i['rolling_mpg'] for i in stats['intervals']], [30.0, 27.27])
+        self.assertEqual(stats['average_mpg'], 27.27)
+        # $66 spent between the first and last full tank over 600 miles
+        self.assertEqual(stats['cost_per_mile'], 0.11)
+
+    def test_stats_cached_until_fill_up_added(self):
+        """Test that stats are cached and invalidated by a new fill-up"""
+        self.add_fill_up(1, 10000, '10', '30.00')
+        self.add_fill_up(9, 10300, '10', '30.00')
+        get_fuel_stats(self.vehicle.id)
+
+        # Only the aggregate that keys the cache runs on a hit
+        with self.assertNumQueries(1):
+            get_fuel_stats(self.vehicle.id)
+
+        response = self.client.post(reverse('vehicles:fuel_add'), {
+            'vehicle': self.vehicle.id,
+            'date': '2024-01-20',
+            'odometer': 10700,
+            'gallons': '10',
+            'total_cost': '30.00',
+            'full_tank': 'on',
+        })
+
+        self.assertRedirects(response, reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+        stats = get_fuel_stats(self.vehicle.id)
+        self.assertEqual(stats['fill_ups'], 3)
+        self.assertEqual(stats['average_mpg'], 35.0)
+
+    def test_stats_follow_writes_that_skip_signals(self):
+        """Test that an update without signals, as from another process, refreshes stats"""
+        self.add_fill_up(1, 10000, '10', '30.00')
+        fill_up = self.add_fill_up(9, 10300, '10', '30.00')
+        self.assertEqual(get_fuel_stats(self.vehicle.id)['average_mpg'], 30.0)
+
+        FuelFillUp.objects.filter(pk=fill_up.pk).update(
+            gallons=Decimal('12'), updated_at=fill_up.updated_at + timedelta(seconds=1)
+        )
+
+        self.assertEqual(get_fuel_stats(self.vehicle.id)['average_mpg'], 25.0)
+
+    def test_invalid_fill_up_reopens_modal_with_errors(self):
+        """Test that form errors are kept in the session and shown in the modal"""
+        response = self.client.post(reverse('vehicles:fuel_add'), {
+            'vehicle': self.vehicle.id,
+            'date': '2024-01-20',
+            'odometer': 10700,
+            'total_cost': '30.00',
+        })
+
+        self.assertRedirects(
+            response, reverse('vehicles:vehicle_detail', args=[self.vehicle.id]),
+            fetch_redirect_response=False
+        )
+        response = self.client.get(response.url)
+        self.assertContains(response, 'This field is required.')
+        self.assertContains(response, "getElementById('addFuelModal')")
+
+    def test_invalid_fill_up_with_non_numeric_vehicle(self):
+        """Test that a non-numeric vehicle value redirects instead of failing"""
+        response = self.client.post(reverse('vehicles:fuel_add'), {
+            'vehicle': 'abc',
+            'date': '2024-01-20',
+        })
+
+        self.assertRedirects(response, reverse('vehicles:vehicle_list'))
+
+    def test_cannot_add_fill_up_to_other_users_vehicle(self):
+        """Test that fill-ups are limited to the user's own vehicles"""
+        self.client.post(reverse('vehicles:fuel_add'), {
+            'vehicle': self.other_vehicle.id,
+            'date': '2024-01-20',
+            'odometer': 31000,
+            'gallons': '10',
+            'total_cost': '30.00',
+        })
+
+        self.assertFalse(FuelFillUp.objects.exists())
+
+    def test_detail_page_shows_fuel_log(self):
+        """Test that the detail page shows fuel statistics"""
+        self.add_fill_up(1, 10000, '10', '30.00')
+        self.add_fill_up(9, 10300, '10', '30.00')
+
+        response = self.client.get(reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+
+        self.assertContains(response, 'Fuel Log')
+        self.assertContains(response, 'Average MPG:</strong> 30.0')
+        self.assertContains(response, 'id="addFuelModal"')
+
+    def test_import_resolves_vehicles_and_invalidates_cache(self):
+        """Test that bulk import matches ids and VINs and refreshes stats"""
+        self.assertEqual(get_fuel_stats(self.vehicle.id)['fill_ups'], 0)
+
+        created, errors = import_fill_ups([
+            {'vehicle': str(self.vehicle.id), 'date': '2024-01-01', 'odometer': '10000',
+             'gallons': '10', 'total_cost': '30', 'full_tank': 'yes'},
+            {'vehicle': self.vehicle.vin, 'date': '2024-01-08', 'odometer': '10250',
+             'gallons': '10', 'total_cost': '30', 'full_tank': ''},
+            {'vehicle': str(self.other_vehicle.id), 'date': '2024-01-08', 'odometer': '31000',
+             'gallons': '10', 'total_cost': '30'},
+            {'vehicle': str(self.vehicle.id), 'date': 'soon', 'odometer': '1',
+             'gallons': '1', 'total_cost': '1'},
+        ], user=self.user)
+
+        self.assertEqual(created, 2)
+        self.assertEqual([e['line'] for e in errors], [4, 3])
+        self.assertEqual(get_fuel_stats(self.vehicle.id)['average_mpg'], 25.0)
+
+
+class MaintenanceForecastTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.fleet = Fleet.objects.create(name='Acme Logistics')
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            fleet=self.fleet,
+            make='Toyota',
+            model='Camry',
+            year=2015,
+            current_mileage=90000,
+            condition='fair'
+        )
+        self.new_vehicle = Vehicle.objects.create(
+            user=self.user,
+            fleet=self.fleet,
+            make='Honda',
+            model='Civic',
+            year=2024,
+            current_mileage=1000
+        )
+        # Brake work every January, an oil change every quarter
+        for year in (2022, 2023, 2024):
+            ServiceRecord.objects.create(
+                vehicle=self.vehicle, service_type='brake_service',
+                date=date(year, 1, 15), mileage=50000, cost=Decimal('600.00')
+            )
+            for month in (2, 5, 8, 11):
+                ServiceRecord.objects.create(
+                    vehicle=self.vehicle, service_type='oil_change',
+                    date=date(year, month, 10), mileage=50000, cost=Decimal('60.00')
+                )
+        self.as_of = date(2024, 11, 30)
+
+    def test_refresh_forecasts_every_vehicle(self):
+        """Test that every vehicle gets a 12-month forecast with seasonality"""
+        self.assertEqual(refresh_forecasts(as_of=self.as_of), 2)
+
+        forecast = self.vehicle.maintenance_forecast
+        self.assertEqual(forecast.start_month, date(2024, 12, 1))
+        self.assertEqual(len(forecast.monthly_costs), 12)
+        self.assertAlmostEqual(
+            float(forecast.total_cost), sum(forecast.monthly_costs), places=1
+        )
+        by_month = dict(forecast.months())
+        # January carries the brake work, so it is the most expensive month
+        self.assertEqual(max(by_month, key=by_month.get), date(2025, 1, 1))
+        # A vehicle without history falls back to the seasonal population prior
+        prior = dict(self.new_vehicle.maintenance_forecast.months())
+        self.assertGreater(self.new_vehicle.maintenance_forecast.total_cost, 0)
+        self.assertEqual(max(prior, key=prior.get), date(2025, 1, 1))
+
+    def test_archived_history_feeds_the_forecast(self):
+        """Test that archiving service records does not change the forecast"""
+        refresh_forecasts(as_of=self.as_of)
+        before = self.vehicle.maintenance_forecast.monthly_costs
+
+        archive_service_records(before=date(2024, 1, 1))
+        refresh_forecasts(as_of=self.as_of)
+
+        self.assertEqual(
+            MaintenanceForecast.objects.get(vehicle=self.vehicle).monthly_costs, before
+        )
+
+    def test_refresh_replaces_previous_forecasts(self):
+        """Test that a refresh rewrites the table instead of appending"""
+        refresh_forecasts(as_of=self.as_of)
+        refresh_forecasts(as_of=date(2024, 12, 31))
+
+        self.assertEqual(MaintenanceForecast.objects.count(), 2)
+        self.assertEqual(
+            set(MaintenanceForecast.objects.values_list('start_month', flat=True)),
+            {date(2025, 1, 1)}
+        )
+
+    def test_worker_processes_match_single_process(self):
+        """Test that projecting in worker processes gives the same result"""
+        refresh_forecasts(as_of=self.as_of)
+        single = dict(MaintenanceForecast.objects.values_list('vehicle_id', 'monthly_costs'))
+
+        refresh_forecasts(as_of=self.as_of, workers=2, chunk_size=1)
+        parallel = dict(MaintenanceForecast.objects.values_list('vehicle_id', 'monthly_costs'))
+
+        self.assertEqual(single, parallel)
+
+    def test_fleet_forecast_sums_vehicles(self):
+        """Test that the fleet forecast adds up its vehicles month by month"""
+        self.assertIsNone(fleet_forecast(self.fleet))
+        refresh_forecasts(as_of=self.as_of)
+
+        forecast = fleet_forecast(self.fleet)
+
+        vehicle_costs = [
+            self.vehicle.maintenance_forecast.monthly_costs,
+            self.new_vehicle.maintenance_forecast.monthly_costs,
+        ]
+        self.assertEqual(
+            forecast['monthly_costs'],
+            [round(a + b, 2) for a, b in zip(*vehicle_costs)]
+        )
+
+    def test_detail_page_shows_forecast(self):
+        """Test that the detail page shows the stored forecast"""
+        self.client.login(username='testuser', password='testpass123')
+        refresh_forecasts(as_of=self.as_of)
+        forecast = MaintenanceForecast.objects.get(vehicle=self.vehicle)
+
+        response = self.client.get(reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+
+        self.assertContains(response, 'Maintenance Forecast')
+        self.assertContains(response, f'${forecast.total_cost:.2f}')
+        self.assertContains(response, 'Jan 25')
+
+
+class ServiceAttachmentTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(
+            ATTACHMENT_ROOT=self.root, ATTACHMENT_THUMBNAIL_WORKERS=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.record = ServiceRecord.objects.create(
+            vehicle=self.vehicle,
+            service_type='oil_change',
+            date=date(2024, 1, 15),
+            mileage=25000,
+            cost=Decimal('45.99')
+        )
+        self.second_record = ServiceRecord.objects.create(
+            vehicle=self.vehicle,
+            service_type='brake_service',
+            date=date(2024, 3, 1),
+            mileage=26000,
+            cost=Decimal('300.00')
+        )
+        self.client.login(username='testuser', password='testpass123')
+        # Larger than one upload chunk so the handler sees several
+        self.content = b'%PDF-1.4 invoice ' * 40000
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def upload(self, record, *files):
+        return self.client.post(
+            reverse('vehicles:attachment_upload', args=[record.id]),
+            {'files': [SimpleUploadedFile(name, content, 'application/pdf')
+                       for name, content in files]}
+        )
+
+    def test_upload_is_stored_by_content_hash(self):
+        """Test that an upload is streamed into the store under its SHA-256"""
+        response = self.upload(self.record, ('invoice.pdf', self.content))
+
+        self.assertRedirects(response, reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+        attachment = self.record.attachments.get()
+        self.assertEqual(attachment.sha256, self.sha256)
+        self.assertEqual(attachment.size, len(self.content))
+        self.assertEqual(blob_path(self.sha256).read_bytes(), self.content)
+        self.assertEqual(list((blob_path(self.sha256).parents[2] / 'tmp').iterdir()), [])
+
+    def test_reupload_dedupes_blob_and_row(self):
+        """Test that the same content is stored once however often it is uploaded"""
+        self.upload(self.record, ('invoice.pdf', self.content))
+        self.upload(self.record, ('copy.pdf', self.content))
+        self.upload(self.second_record, ('invoice.pdf', self.content))
+
+        self.assertEqual(ServiceAttachment.objects.count(), 2)
+        self.assertEqual(len(list(blob_path(self.sha256).parent.iterdir())), 1)
+
+    def test_oversized_upload_is_rejected(self):
+        """Test that a file over the limit is dropped while streaming"""
+        with override_settings(ATTACHMENT_MAX_UPLOAD_SIZE=1024):
+            self.upload(self.record, ('invoice.pdf', self.content))
+
+        self.assertFalse(ServiceAttachment.objects.exists())
+        self.assertFalse(blob_path(self.sha256).exists())
+
+    def test_list_and_download_are_owner_only(self):
+        """Test that attachments are listed and served to their owner only"""
+        self.upload(self.record, ('invoice.pdf', self.content))
+        attachment = self.record.attachments.get()
+
+        response = self.client.get(reverse('vehicles:attachment_list', args=[self.record.id]))
+        self.assertContains(response, 'invoice.pdf')
+        response = self.client.get(reverse('vehicles:attachment_download', args=[attachment.id]))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        self.client.login(username='otheruser', password='testpass123')
+        response = self.client.get(reverse('vehicles:attachment_list', args=[self.record.id]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('vehicles:attachment_download', args=[attachment.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_detail_page_loads_attachments_lazily(self):
+        """Test that the detail page links the list instead of rendering it"""
+        self.upload(self.record, ('invoice.pdf', self.content))
+
+        response = self.client.get(reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+
+        self.assertContains(
+            response, reverse('vehicles:attachment_list', args=[self.record.id])
+        )
+        self.assertNotContains(response, 'invoice.pdf')
+
+    def test_blob_removed_with_last_attachment(self):
+        """Test that a blob is deleted once nothing refers to it"""
+        self.upload(self.record, ('invoice.pdf', self.content))
+        self.upload(self.second_record, ('invoice.pdf', self.content))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record.delete()
+        self.assertTrue(blob_path(self.sha256).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second_record.delete()
+        self.assertFalse(blob_path(self.sha256).exists())
+
+
+    def test_reupload_during_pending_cleanup_keeps_blob(self):
+        """Test that a blob re-attached before a pending cleanup runs is kept"""
+        self.upload(self.record, ('invoice.pdf', self.content))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.record.attachments.get().delete()
+        self.upload(self.second_record, ('invoice.pdf', self.content))
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(blob_path(self.sha256).exists())
+        self.assertEqual(self.second_record.attachments.count(), 1)
+
+    def test_failed_upload_leaves_no_temporary_files(self):
+        """Test that files not yet stored are removed when saving raises"""
+        request = RequestFactory().post(
+            reverse('vehicles:attachment_upload', args=[self.record.id]),
+            {'files': [
+                SimpleUploadedFile('invoice.pdf', self.content, 'application/pdf'),
+                SimpleUploadedFile('receipt.pdf', b'receipt', 'application/pdf'),
+            ]}
+        )
+        request.user = self.user
+        request._dont_enforce_csrf_checks = True
+
+        with mock.patch.object(
+            ServiceAttachment.objects, 'get_or_create', side_effect=IntegrityError
+        ):
+            with self.assertRaises(IntegrityError):
+                attachment_upload(request, pk=self.record.id)
+
+        self.assertEqual(list((Path(self.root) / 'tmp').iterdir()), [])
+
+
+class VehicleHistoryReportTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(REPORT_ROOT=self.root, REPORT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.fleet = Fleet.objects.create(name='Acme Logistics')
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            fleet=self.fleet,
+            make='Toyota',
+            model='Camry',
+            year=2020,
+            current_mileage=25000
+        )
+        self.record = ServiceRecord.objects.create(
+            vehicle=self.vehicle,
+            service_type='oil_change',
+            date=date(2024, 1, 15),
+            mileage=25000,
+            cost=Decimal('45.99'),
+            notes='Synthetic 5W-30'
+        )
+        InsurancePolicy.objects.create(
+            user=self.user,
+            vehicle=self.vehicle,
+            provider='State Farm',
+            policy_number='SF-1',
+            coverage_start=date(2024, 1, 1),
+            coverage_end=date(2024, 12, 31),
+            premium=Decimal('1200.00')
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def generate(self):
+        return self.client.post(
+            reverse('vehicles:vehicle_report_generate', args=[self.vehicle.id])
+        )
+
+    def download(self):
+        return self.client.get(
+            reverse('vehicles:vehicle_report_download', args=[self.vehicle.id])
+        )
+
+    def test_generate_then_download(self):
+        """Test that a generated report can be downloaded from the detail page"""
+        self.assertEqual(self.download().status_code, 404)
+
+        response = self.generate()
+
+        self.assertRedirects(response, reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+        response = self.client.get(reverse('vehicles:vehicle_detail', args=[self.vehicle.id]))
+        self.assertContains(response, reverse('vehicles:vehicle_report_download', args=[self.vehicle.id]))
+        content = b''.join(self.download().streaming_content).decode()
+        self.assertIn('Synthetic 5W-30', content)
+        self.assertIn('SF-1', content)
+
+    def test_unchanged_vehicle_is_not_rendered_again(self):
+        """Test that the data version hash prevents re-rendering"""
+        self.generate()
+
+        with mock.patch('vehicles.reports.render_to_string') as render:
+            self.generate()
+            self.assertEqual(render_reports([self.vehicle.id]), (0, 1))
+
+        render.assert_not_called()
+
+    def test_data_change_invalidates_report(self):
+        """Test that editing any reported row changes the version"""
+        self.generate()
+        version = report_version(self.vehicle)
+
+        self.record.cost = Decimal('55.00')
+        self.record.save()
+        self.assertNotEqual(report_version(self.vehicle), version)
+        self.assertEqual(self.download().status_code, 404)
+
+        updated = report_version(self.vehicle)
+        InsurancePolicy.objects.filter(vehicle=self.vehicle).update(premium=Decimal('900.00'))
+        self.assertNotEqual(report_version(self.vehicle), updated)
+
+    def test_render_keeps_partial_files_of_other_workers(self):
+        """Test that only finished reports and abandoned partial files are removed"""
+        directory = Path(self.root) / str(self.vehicle.id)
+        directory.mkdir()
+        old_report = directory / 'old.html'
+        in_flight = directory / 'newer.html.123.part'
+        abandoned = directory / 'older.html.456.part'
+        for path in (old_report, in_flight, abandoned):
+            path.write_text('report')
+        expired = datetime.now().timestamp() - 2 * 3600
+        os.utime(abandoned, (expired, expired))
+
+        render_reports([self.vehicle.id])
+
+        remaining = {path.name for path in directory.iterdir()}
+        self.assertIn(f'{report_version(self.vehicle)}.html', remaining)
+        self.assertIn(in_flight.name, remaining)
+        self.assertNotIn(old_report.name, remaining)
+        self.assertNotIn(abandoned.name, remaining)
+
+    def test_fleet_batch_renders_missing_reports(self):
+        """Test that the batch command renders only out-of-date reports"""
+        Vehicle.objects.create(
+            user=self.user, fleet=self.fleet, make='Honda', model='Civic',
+            year=2019, current_mileage=30000
+        )
+        Vehicle.objects.create(
+            user=self.user, make='Ford', model='F-150', year=2018, current_mileage=80000
+        )
+        self.generate()
+
+        out = io.StringIO()
+        call_command('render_history_reports', fleet=self.fleet.id, workers=1, stdout=out)
+
+        self.assertIn('1 report(s) rendered, 1 already up to date', out.getvalue())
+
+
+class ChunkedVehicleDeletionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.vehicle = Vehicle.objects.create(
+            user=self.user,
+            make='Freightliner',
+            model='Cascadia',
+            year=2018,
+            current_mileage=400000
+        )
+        ServiceRecord.objects.bulk_create([
+            ServiceRecord(
+                vehicle=self.vehicle, service_type='oil_change',
+                date=date(2020, 1, 1) + timedelta(days=day), mileage=day, cost=Decimal('10.00')
+            )
+            for day in range(25)
+        ])
+        FuelFillUp.objects.bulk_create([
+            FuelFillUp(
+                vehicle=self.vehicle, date=date(2020, 1, 1) + timedelta(days=day),
+                odometer=day * 100, gallons=Decimal('50'), total_cost=Decimal('200')
+            )
+            for day in range(7)
+        ])
+        CarRegistration.objects.create(
+            vehicle=self.vehicle,
+            registration_number='TRK1',
+            state='NC',
+            registration_date=date(2024, 1, 1),
+            expiration_date=date(2025, 1, 1)
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_children_deleted_in_bounded_chunks(self):
+        """Test that each delete statement covers at most one chunk"""
+        with CaptureQueriesContext(connection) as queries:
+            deleted = delete_vehicle(self.vehicle, self.user, chunk_size=10)
+
+        self.assertEqual(deleted, 33)
+        record_deletes = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('DELETE FROM "vehicles_servicerecord"')
+        ]
+        self.assertEqual(len(record_deletes), 3)
+        self.assertFalse(Vehicle.objects.filter(pk=self.vehicle.pk).exists())
+        self.assertFalse(ServiceRecord.objects.exists())
+        self.assertFalse(FuelFillUp.objects.exists())
+        self.assertFalse(CarRegistration.objects.exists())
+
+    def test_delete_hooks_still_run(self):
+        """Test that the tombstone and per-row delete signals are kept"""
+        vehicle_id = self.vehicle.pk
+        get_fuel_stats(vehicle_id)
+
+        delete_vehicle(self.vehicle, self.user, chunk_size=4)
+
+        self.assertTrue(Tombstone.objects.filter(
+            user=self.user, model='vehicles.vehicle', object_id=vehicle_id
+        ).exists())
+        self.assertEqual(get_fuel_stats(vehicle_id)['fill_ups'], 0)
+
+    def test_only_owner_can_delete(self):
+        """Test that ownership is checked by the view and the helper"""
+        self.client.login(username='otheruser', password='testpass123')
+        response = self.client.post(reverse('vehicles:vehicle_delete', args=[self.vehicle.pk]))
+
+        self.assertEqual(response.status_code, 404)
+        with self.assertRaises(PermissionDenied):
+            delete_vehicle(self.vehicle, self.other_user)
+        self.assertEqual(self.vehicle.service_records.count(), 25)
+
+    def test_delete_view_uses_chunked_path(self):
+        """Test that the delete view removes the vehicle and its history"""
+        with mock.patch('vehicles.views.delete_vehicle', wraps=delete_vehicle) as chunked:
+            response = self.client.post(reverse('vehicles:vehicle_delete', args=[self.vehicle.pk]))
+
+        self.assertRedirects(response, reverse('vehicles:vehicle_list'))
+        chunked.assert_called_once()
+        self.assertFalse(ServiceRecord.objects.exists())
+
+
+class AccountBackupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.fleet = Fleet.objects.create(name='Acme')
+        self.vehicles = [
+            Vehicle.objects.create(
+                user=self.user, fleet=self.fleet, make='Toyota', model=f'Model {n}',
+                year=2018 + n, current_mileage=10000 * n, vin=f'VIN{n}'
+            )
+            for n in range(3)
+        ]
+        for vehicle in self.vehicles:
+            for n in range(4):
+                ServiceRecord.objects.create(
+                    vehicle=vehicle, service_type='oil_change', date=date(2024, n + 1, 1),
+                    mileage=1000 * n, cost=Decimal('49.99'), notes=f'note {n}'
+                )
+        CarRegistration.objects.create(
+            vehicle=self.vehicles[0], registration_number='ABC123', state='CA',
+            registration_date=date(2024, 1, 1), expiration_date=date(2025, 1, 1)
+        )
+        InsurancePolicy.objects.create(
+            user=self.user, vehicle=self.vehicles[1], provider='Acme Mutual',
+            policy_number='P-1', coverage_start=date(2024, 1, 1),
+            coverage_end=date(2025, 1, 1), premium=Decimal('600.00')
+        )
+        FuelFillUp.objects.create(
+            vehicle=self.vehicles[2], date=date(2024, 5, 1), odometer=20500,
+            gallons=Decimal('10.250'), total_cost=Decimal('41.00')
+        )
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = f'{self.tempdir}/account.jsonl.gz'
+
+    def test_round_trip_remaps_keys(self):
+        """Test that a restored account matches the original under new ids"""
+        counts = export_account(self.user, self.path)
+        InsurancePolicy.objects.all().delete()
+
+        restored = restore_account(self.path, self.other, batch_size=5)
+
+        self.assertEqual(restored, counts)
+        self.assertEqual(counts['vehicles.servicerecord'], 12)
+        copies = Vehicle.objects.filter(user=self.other).order_by('year')
+        self.assertEqual(len(copies), 3)
+        self.assertTrue(all(copy.fleet is None for copy in copies))
+        self.assertFalse({copy.pk for copy in copies} & {v.pk for v in self.vehicles})
+        for original, copy in zip(self.vehicles, copies):
+            self.assertEqual(copy.vin, original.vin)
+            self.assertEqual(copy.created_at, original.created_at.replace(
+                microsecond=original.created_at.microsecond // 1000 * 1000
+            ))
+            self.assertEqual(
+                list(copy.service_records.values_list('date', 'mileage', 'cost', 'notes')),
+                list(original.service_records.values_list('date', 'mileage', 'cost', 'notes')),
+            )
+        self.assertEqual(copies[0].car_registrations.get().registration_number, 'ABC123')
+        policy = copies[1].insurance_policies.get()
+        self.assertEqual((policy.user, policy.premium), (self.other, Decimal('600.00')))
+        self.assertEqual(copies[2].fuel_fill_ups.get().gallons, Decimal('10.250'))
+
+    def test_archiving_after_restoring_archived_records(self):
+        """Test that restored archived records do not take ids later archived"""
+        archive_service_records(before=date(2024, 2, 1))
+        export_account(self.user, self.path)
+        InsurancePolicy.objects.all().delete()
+        restore_account(self.path, self.other)
+
+        moved = archive_service_records(before=date(2025, 1, 1))
+
+        self.assertEqual(moved, 18)
+        self.assertEqual(ArchivedServiceRecord.objects.count(), 24)
+        self.assertEqual(
+            ArchivedServiceRecord.objects.filter(vehicle__user=self.other).count(), 12
+        )
+        self.assertFalse(ServiceRecord.objects.exists())
+
+    def test_archive_streams_json_lines(self):
+        """Test that the archive is gzip JSON lines with a header and trailer"""
+        export_account(self.user, self.path)
+
+        with gzip.open(self.path, 'rt') as archive:
+            lines = [json.loads(line) for line in archive]
+
+        self.assertEqual(lines[0]['username'], 'testuser')
+        self.assertEqual(lines[1], {
+            'model': 'vehicles.vehicle',
+            'columns': [
+                'id', 'make', 'model', 'year', 'current_mileage', 'vin', 'condition',
+                'nickname', 'created_at', 'updated_at',
+            ],
+        })
+        self.assertEqual(lines[-1]['end']['vehicles.vehicle'], 3)
+
+    def test_failed_restore_changes_nothing(self):
+        """Test that a conflicting or truncated archive restores no rows"""
+        export_account(self.user, self.path)
+
+        # The policy number is still taken by the original account
+        with self.assertRaises(IntegrityError):
+            restore_account(self.path, self.other)
+        self.assertFalse(Vehicle.objects.filter(user=self.other).exists())
+
+        with gzip.open(self.path, 'rt') as archive:
+            lines = archive.readlines()[:-1]
+        with gzip.open(self.path, 'wt') as archive:
+            archive.writelines(lines)
+        InsurancePolicy.objects.all().delete()
+        with self.assertRaises(BackupError):
+            restore_account(self.path, self.other)
+        self.assertFalse(Vehicle.objects.filter(user=self.other).exists())
+
+    def test_commands(self):
+        """Test that backup_account and restore_account round-trip an account"""
+        out = io.StringIO()
+        call_command('backup_account', 'testuser', self.path, stdout=out)
+        self.assertIn('18 row(s) written', out.getvalue())
+        InsurancePolicy.objects.all().delete()
+
+        call_command('restore_account', self.path, user='other', stdout=out)
+
+        self.assertIn("18 row(s) restored into 'other'", out.getvalue())
+        self.assertEqual(ServiceRecord.objects.filter(vehicle__user=self.other).count(), 12)
+
+
+@override_settings(SERVICE_RECORD_ARCHIVE_AFTER_DAYS=730)
+class ServiceRecordArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, make='Honda', model='Civic', year=2012, current_mileage=150000
+        )
+        self.old = [
+            ServiceRecord.objects.create(
+                vehicle=self.vehicle, service_type='oil_change', date=date(2015, month, 1),
+                mileage=month * 1000, cost=Decimal('40.00'), notes=f'old {month}'
+            )
+            for month in range(1, 8)
+        ]
+        self.recent = ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type='tire_rotation', date=date.today(),
+            mileage=149000, cost=Decimal('25.00')
+        )
+
+    def test_moves_old_records_in_chunks(self):
+        """Test that old records move to the archive with their ids and values"""
+        progress = []
+
+        moved = archive_service_records(chunk_size=3, progress=progress.append)
+
+        self.assertEqual(moved, 7)
+        self.assertEqual(progress, [3, 6, 7])
+        self.assertEqual(list(ServiceRecord.objects.all()), [self.recent])
+        archived = ArchivedServiceRecord.objects.get(pk=self.old[2].pk)
+        self.assertEqual(
+            (archived.vehicle, archived.date, archived.cost, archived.notes,
+             archived.created_at),
+            (self.vehicle, date(2015, 3, 1), Decimal('40.00'), 'old 3',
+             self.old[2].created_at),
+        )
+        self.assertEqual(archive_service_records(), 0)
+
+    def test_records_with_attachments_stay_hot(self):
+        """Test that a record with attachments is not archived"""
+        ServiceAttachment.objects.create(
+            service_record=self.old[0], sha256='0' * 64, original_name='receipt.pdf',
+            content_type='application/pdf', size=10
+        )
+
+        archive_service_records(before=date(2016, 1, 1))
+
+        self.assertTrue(ServiceRecord.objects.filter(pk=self.old[0].pk).exists())
+        self.assertEqual(ArchivedServiceRecord.objects.count(), 6)
+
+    def test_history_reads_archive_only_on_request(self):
+        """Test that the detail page merges the archive in only for show all"""
+        archive_service_records()
+        url = reverse('vehicles:vehicle_detail', args=[self.vehicle.pk])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(list(response.context['service_records']), [self.recent])
+        self.assertContains(response, '?history=all')
+        # The page may check for and count archived records, but not read them
+        archive_reads = [
+            query['sql'] for query in queries.captured_queries
+            if '"vehicles_archivedservicerecord"."notes"' in query['sql']
+        ]
+        self.assertEqual(archive_reads, [])
+
+        response = self.client.get(url, {'history': 'all'})
+        records = response.context['service_records']
+        self.assertEqual(len(records), 8)
+        self.assertEqual(records[0], self.recent)
+        self.assertEqual([r.date.month for r in records[1:]], [7, 6, 5, 4, 3, 2, 1])
+        self.assertContains(response, 'Archived')
+
+    def test_service_history_merges_by_date(self):
+        """Test that hot records older than archived ones are merged in order"""
+        archive_service_records()
+        late_entry = ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type='repair', date=date(2015, 4, 15),
+            mileage=4500, cost=Decimal('300.00')
+        )
+
+        records = service_history(self.vehicle, show_all=True)
+
+        self.assertEqual(records.index(late_entry), 4)
+        self.assertEqual(list(service_history(self.vehicle)), [self.recent, late_entry])
+
+    def test_command(self):
+        """Test that the command archives records before the given day"""
+        out = io.StringIO()
+
+        call_command('archive_service_records', before='2015-04-01', stdout=out)
+
+        self.assertIn('3 service record(s) dated before 2015-04-01 archived', out.getvalue())
+        self.assertEqual(ServiceRecord.objects.count(), 5)
+
+
+class ServiceCostStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, make='Toyota', model='Camry', year=2018, current_mileage=60000
+        )
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.other_vehicle = Vehicle.objects.create(
+            user=other, make='toyota ', model='CAMRY', year=2018, current_mileage=30000
+        )
+        for index, cost in enumerate([40, 50, 60]):
+            self.add(self.vehicle, 'oil_change', date(2023, 1 + index * 4, 1), cost)
+
+    def add(self, vehicle, service_type, day, cost):
+        return ServiceRecord.objects.create(
+            vehicle=vehicle, service_type=service_type, date=day, mileage=1000,
+            cost=Decimal(cost)
+        )
+
+    def test_refresh_is_incremental(self):
+        """Test that refreshing folds in only records added since the last run"""
+        self.assertEqual(refresh_service_stats(chunk_size=2), 3)
+        self.assertEqual(refresh_service_stats(), 0)
+        self.add(self.other_vehicle, 'oil_change', date(2023, 6, 1), 70)
+        self.add(self.other_vehicle, 'oil_change', date(2023, 12, 1), 80)
+
+        self.assertEqual(refresh_service_stats(), 2)
+
+        stats = ServiceCostStats.objects.get()
+        self.assertEqual(
+            (stats.make, stats.model, stats.year, stats.service_type),
+            ('toyota', 'camry', 2018, 'oil_change'),
+        )
+        self.assertEqual((stats.count, stats.cost_sum, stats.mean_cost), (5, 300, 60))
+        # Intervals between services of the same type on the same vehicle
+        self.assertEqual(stats.interval_count, 3)
+        self.assertEqual(stats.interval_days_sum, 120 + 123 + 183)
+        self.assertAlmostEqual(float(stats.median_cost), 60, delta=60 * 0.05)
+        self.assertAlmostEqual(float(stats.p90_cost), 80, delta=80 * 0.05)
+
+    def test_rebuild_matches_refresh_and_covers_edits_and_archive(self):
+        """Test that a rebuild recomputes every group from both tables"""
+        refresh_service_stats()
+        self.add(self.vehicle, 'oil_change', date(2010, 1, 1), 30)
+        archive_service_records(before=date(2011, 1, 1))
+        ServiceRecord.objects.filter(cost=60).update(cost=Decimal('100'))
+
+        self.assertEqual(rebuild_service_stats(), 1)
+
+        stats = ServiceCostStats.objects.get()
+        self.assertEqual((stats.count, stats.cost_sum), (4, 220))
+        self.assertEqual(stats.interval_count, 3)
+        # Nothing is folded in twice after a rebuild
+        self.assertEqual(refresh_service_stats(), 0)
+
+    def test_percentile_from_histogram(self):
+        """Test that percentiles are read off the histogram within a bucket"""
+        self.assertIsNone(percentile({}, 0, 0.5))
+        self.assertEqual(percentile({'0': 3}, 3, 0.5), Decimal('0.50'))
+
+    def test_refresh_and_rebuild_agree_on_intervals(self):
+        """Test that same-day and archived services give the same intervals"""
+        self.add(self.other_vehicle, 'oil_change', date(2010, 6, 1), 35)
+        refresh_service_stats()
+        archive_service_records(before=date(2011, 1, 1))
+        # The previous services are on the same day, and in the archive
+        self.add(self.vehicle, 'oil_change', date(2023, 9, 1), 55)
+        self.add(self.other_vehicle, 'oil_change', date(2023, 6, 1), 70)
+
+        refresh_service_stats()
+        refreshed = ServiceCostStats.objects.get()
+        rebuild_service_stats()
+        rebuilt = ServiceCostStats.objects.get()
+
+        self.assertEqual(
+            (refreshed.count, refreshed.interval_count, refreshed.interval_days_sum),
+            (rebuilt.count, rebuilt.interval_count, rebuilt.interval_days_sum),
+        )
+        self.assertEqual(rebuilt.interval_count, 4)
+        self.assertEqual(rebuilt.interval_days_sum, 120 + 123 + 123 + 4748)
+
+    @override_settings(SERVICE_STATS_MIN_OWNERS=2)
+    def test_groups_of_a_single_owner_are_hidden(self):
+        """Test that many records from one owner do not make a group public"""
+        refresh_service_stats()
+        self.assertEqual(stats_for_vehicle(self.vehicle), {})
+
+        self.add(self.other_vehicle, 'oil_change', date(2023, 6, 1), 70)
+        refresh_service_stats()
+
+        stats = stats_for_vehicle(self.vehicle)['oil_change']
+        self.assertEqual((stats.count, stats.owner_count), (4, 2))
+
+    @override_settings(SERVICE_STATS_MIN_OWNERS=2)
+    def test_detail_page_shows_typical_cost(self):
+        """Test that the detail page shows the typical cost of larger groups only"""
+        self.add(self.vehicle, 'repair', date(2023, 3, 1), 500)
+        self.add(self.other_vehicle, 'oil_change', date(2023, 6, 1), 70)
+        refresh_service_stats()
+        self.assertEqual(set(stats_for_vehicle(self.other_vehicle)), {'oil_change'})
+
+        url = reverse('vehicles:vehicle_detail', args=[self.vehicle.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        stats_queries = [
+            query for query in queries.captured_queries
+            if 'vehicles_servicecoststats' in query['sql']
+        ]
+        self.assertEqual(len(stats_queries), 1)
+        costs = {
+            record.service_type: record.cost_stats
+            for record in response.context['service_records']
+        }
+        self.assertEqual(costs['oil_change'].count, 4)
+        self.assertIsNone(costs['repair'])
+        self.assertContains(response, 'Typical $')
+
+    def test_command(self):
+        """Test that the command refreshes or rebuilds the statistics"""
+        out = io.StringIO()
+
+        call_command('refresh_service_stats', stdout=out)
+        call_command('refresh_service_stats', rebuild=True, stdout=out)
+
+        self.assertIn('3 new service record(s) folded in', out.getvalue())
+        self.assertIn('Rebuilt 1 service cost group(s)', out.getvalue())
+
+
+class DuplicateServiceRecordTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, make='Ford', model='Focus', year=2016, current_mileage=80000
+        )
+        self.record = ServiceRecord.objects.create(
+            vehicle=self.vehicle, service_type='oil_change', date=date(2024, 3, 1),
+            mileage=75000, cost=Decimal('49.99'), notes='Synthetic'
+        )
+
+    def add(self, **overrides):
+        values = {
+            'vehicle': self.vehicle, 'service_type': 'oil_change', 'date': date(2024, 3, 1),
+            'mileage': 75000, 'cost': Decimal('49.99'),
+        }
+        values.update(overrides)
+        return ServiceRecord.objects.create(**values)
+
+    def test_fingerprint_is_kept_up_to_date(self):
+        """Test that the fingerprint is set on save and follows edits"""
+        first = self.record.fingerprint
+        self.assertEqual(len(first), 16)
+        self.assertEqual(self.add(cost=Decimal('46.50')).fingerprint, first)
+
+        self.record.mileage = 76000
+        self.record.save(update_fields=['mileage'])
+        self.record.refresh_from_db()
+        self.assertNotEqual(self.record.fingerprint, first)
+
+    def test_near_matches_are_found_across_bucket_boundaries(self):
+        """Test that the lookup finds near matches in neighbouring buckets"""
+        def found(**changes):
+            values = {
+                'service_type': 'oil_change', 'date': date(2024, 3, 1),
+                'mileage': 75000, 'cost': Decimal('49.99'),
+            }
+            values.update(changes)
+            return list(find_duplicates(self.vehicle.pk, **values))
+
+        self.assertEqual(found(), [self.record])
+        self.assertEqual(found(date=date(2024, 3, 2), mileage=75010, cost=Decimal('51.00')), [self.record])
+        self.assertEqual(found(service_type='tire_rotation'), [])
+        self.assertEqual(found(date=date(2024, 4, 1)), [])
+        self.assertEqual(found(mileage=76000), [])
+        self.assertEqual(found(cost=Decimal('90.00')), [])
+
+    def test_form_rejects_duplicate_unless_confirmed(self):
+        """Test that entering a duplicate by hand asks for confirmation"""
+        data = {
+            'vehicle': self.vehicle.pk, 'service_type': 'oil_change', 'date': '2024-03-01',
+            'mileage': 75000, 'cost': '49.99',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            form = ServiceRecordForm(data=data, user=self.user)
+            self.assertFalse(form.is_valid())
+        self.assertIn('looks like a duplicate', form.non_field_errors()[0])
+        # The vehicle choice, its validation and one indexed duplicate lookup
+        self.assertEqual(len(queries), 3)
+
+        response = self.client.post(reverse('vehicles:service_add'), data=data)
+        self.assertEqual(ServiceRecord.objects.count(), 1)
+        response = self.client.get(response.url)
+        self.assertContains(response, 'looks like a duplicate')
+        self.assertContains(response, 'Save anyway')
+
+        self.client.post(reverse('vehicles:service_add'), data={**data, 'allow_duplicate': 'on'})
+        self.assertEqual(ServiceRecord.objects.count(), 2)
+
+    def test_merge_keeps_oldest_record(self):
+        """Test that merging keeps the oldest record with notes and attachments"""
+        duplicate = self.add(cost=Decimal('48.00'), notes='Imported from shop')
+        self.add(notes='Synthetic')
+        unrelated = self.add(service_type='tire_rotation')
+        ServiceAttachment.objects.create(
+            service_record=duplicate, sha256='1' * 64, original_name='invoice.pdf',
+            content_type='application/pdf', size=10
+        )
+
+        self.assertEqual(merge_duplicates(dry_run=True), (1, 2))
+        self.assertEqual(ServiceRecord.objects.count(), 4)
+        self.assertEqual(merge_duplicates(), (1, 2))
+
+        self.assertEqual(
+            set(ServiceRecord.objects.values_list('pk', flat=True)), {self.record.pk, unrelated.pk}
+        )
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.notes, 'Synthetic\n\nImported from shop')
+        self.assertEqual(self.record.attachments.get().original_name, 'invoice.pdf')
+        self.assertEqual(Tombstone.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(merge_duplicates(), (0, 0))
+
+    def test_command_fingerprints_bulk_written_records(self):
+        """Test that the command fingerprints records written without save"""
+        ServiceRecord.objects.bulk_create([
+            ServiceRecord(
+                vehicle=self.vehicle, service_type='oil_change', date=date(2024, 3, 1),
+                mileage=75000, cost=Decimal('49.99')
+            )
+        ])
+        out = io.StringIO()
+
+        call_command('merge_duplicate_services', stdout=out)
+
+        self.assertIn('1 service record(s) fingerprinted', out.getvalue())
+        self.assertIn('1 duplicate group(s) found, 1 record(s) removed', out.getvalue())
+        self.assertEqual(ServiceRecord.objects.get(), self.record)
@@ -10,9 +10,24 @@ urlpatterns = [
     path("update/<int:pk>/", views.VehicleUpdateView.as_view(), name="vehicle_update"),
     path("<int:pk>/delete/", views.VehicleDeleteView.as_view(), name="vehicle_delete"),
     path("<int:pk>/", VehicleDetailView.as_view(), name="vehicle_detail"),
+    path("<int:pk>/report/", views.vehicle_report_generate, name="vehicle_report_generate"),
+    path("<int:pk>/report/download/", views.vehicle_report_download, name="vehicle_report_download"),
     
     # Service record URLs
     path("service/add/", views.ServiceRecordCreateView.as_view(), name="service_add"),
     path("service/update/<int:pk>/", views.ServiceRecordUpdateView.as_view(), name="service_update"),
     path("service/<int:pk>/delete/", views.ServiceRecordDeleteView.as_view(), name="service_delete"),
+
+    # Service record attachment URLs
+    path("service/<int:pk>/attachments/", views.attachment_list, name="attachment_list"),
+    path("service/<int:pk>/attachments/upload/", views.attachment_upload, name="attachment_upload"),
+    path("attachments/<int:pk>/", views.attachment_download, name="attachment_download"),
+    path("attachments/<int:pk>/thumbnail/", views.attachment_thumbnail, name="attachment_thumbnail"),
+
+    # Fuel log URLs
+    path("fuel/add/", views.FuelFillUpCreateView.as_view(), name="fuel_add"),
+
+    # Odometer time series URLs
+    path("odometer/ingest/", views.odometer_ingest, name="odometer_ingest"),
+    path("<int:pk>/odometer/", views.odometer_series, name="odometer_series"),
 ]
@@ -1,6 +1,23 @@
+import json
+from datetime import date
+
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
-from django.shortcuts import redirect
+from django.db import transaction
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_POST
 from django.urls import reverse_lazy
 from django.views.generic import (
     ListView,
@@ -9,12 +26,82 @@ from django.views.generic import (
     UpdateView,
     DeleteView,
 )
-from .models import Vehicle, ServiceRecord
-from .forms import VehicleForm, ServiceRecordForm
+from .models import (
+    Vehicle,
+    ServiceRecord,
+    ArchivedServiceRecord,
+    FuelFillUp,
+    MaintenanceForecast,
+    ServiceAttachment,
+)
+from .attachments import (
+    ContentAddressedUploadHandler,
+    blob_path,
+    schedule_thumbnail,
+    store_lock,
+    thumbnail_path,
+)
+from .odometer import PERIODS, estimate_mileage_rates, ingest_readings, rollups
+from .forms import VehicleForm, ServiceRecordForm, FuelFillUpForm
+from .archive import service_history
+from .deletion import delete_vehicle
+from .fuel import get_fuel_stats
+from .reports import FORMATS, is_ready, report_path, report_version, request_report
+from .service_stats import stats_for_vehicle
 from insurance.models import InsurancePolicy
 from insurance.forms import InsurancePolicyForm
+from insurance.coverage import find_coverage_issues
 from compliance.models import CarRegistration
 from compliance.forms import CarRegistrationForm
+from sync.tombstones import record_deletion
+
+
+def annotate_garage_summary(queryset, today=None):
+    """Annotate vehicles with their garage card summary using correlated subqueries.
+
+    Adds ``last_service_date``, ``lifetime_cost``, ``next_registration_expiry``
+    and ``has_active_insurance`` without issuing any per-vehicle queries.
+    Service figures cover archived records as well as live ones.
+    """
+    today = today or date.today()
+    cost_field = DecimalField(max_digits=12, decimal_places=2)
+    last_dates, costs = [], []
+    for model in (ServiceRecord, ArchivedServiceRecord):
+        services = model.objects.filter(vehicle=OuterRef("pk")).order_by()
+        last_dates.append(
+            Subquery(services.order_by("-date").values("date")[:1])
+        )
+        costs.append(
+            Subquery(
+                services.values("vehicle").annotate(total=Sum("cost")).values("total"),
+                output_field=cost_field,
+            )
+        )
+    # Either side is NULL when a vehicle has no records in that table, which
+    # would make GREATEST and + NULL too, so fall back to the other side
+    (live_date, archived_date), (live_cost, archived_cost) = last_dates, costs
+    return queryset.annotate(
+        last_service_date=Coalesce(
+            Greatest(live_date, archived_date), live_date, archived_date
+        ),
+        lifetime_cost=Coalesce(
+            live_cost + archived_cost, live_cost, archived_cost, output_field=cost_field
+        ),
+        next_registration_expiry=Subquery(
+            CarRegistration.objects.filter(
+                vehicle=OuterRef("pk"), expiration_date__gte=today
+            )
+            .order_by("expiration_date")
+            .values("expiration_date")[:1]
+        ),
+        has_active_insurance=Exists(
+            InsurancePolicy.objects.filter(
+                vehicle=OuterRef("pk"),
+                coverage_start__lte=today,
+                coverage_end__gt=today,
+            )
+        ),
+    )
 
 
 class VehicleListView(LoginRequiredMixin, ListView):
@@ -23,7 +110,7 @@ class VehicleListView(LoginRequiredMixin, ListView):
     context_object_name = "vehicles"
 
     def get_queryset(self):
-        return Vehicle.objects.filter(user=self.request.user)
+        return annotate_garage_summary(Vehicle.objects.filter(user=self.request.user))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -43,6 +130,9 @@ class VehicleDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         context["insurance_policies"] = InsurancePolicy.objects.filter(
             vehicle=self.object, user=self.request.user
+        ).order_by("coverage_start", "coverage_end")
+        context["coverage_issues"] = find_coverage_issues(
+            context["insurance_policies"], as_of=date.today(), presorted=True
         )
         context["insurance_form"] = InsurancePolicyForm(
             initial={"vehicle": self.object}
@@ -52,9 +142,18 @@ class VehicleDetailView(LoginRequiredMixin, DetailView):
             vehicle=self.object
         )
         
-        # Add service records context
-        context["service_records"] = ServiceRecord.objects.filter(
-            vehicle=self.object
+        # Add service records context; the archive is only read on request
+        context["show_all_history"] = self.request.GET.get("history") == "all"
+        context["service_records"] = list(
+            service_history(self.object, show_all=context["show_all_history"])
+        )
+        # Typical costs of this make, model and year, one indexed lookup
+        cost_stats = stats_for_vehicle(self.object)
+        for record in context["service_records"]:
+            record.cost_stats = cost_stats.get(record.service_type)
+        context["has_archived_records"] = (
+            context["show_all_history"]
+            or self.object.archived_service_records.exists()
         )
         
         # Check for service record form errors in session
@@ -114,6 +213,30 @@ class VehicleDetailView(LoginRequiredMixin, DetailView):
             context["registration_edit_form_data"] = registration_edit_form_data  
             context["registration_edit_form_id"] = registration_edit_form_id
         
+        # Add fuel log context
+        context["fuel_stats"] = get_fuel_stats(self.object.pk)
+        fuel_form_errors = self.request.session.pop('fuel_form_errors', None)
+        fuel_form_data = self.request.session.pop('fuel_form_data', None)
+
+        if fuel_form_errors and fuel_form_data:
+            # Recreate form with errors and data for the add modal
+            import json
+            from django.forms.utils import ErrorDict
+
+            fuel_form = FuelFillUpForm(data=fuel_form_data, user=self.request.user)
+            fuel_form._errors = ErrorDict(json.loads(fuel_form_errors))
+            context["fuel_form"] = fuel_form
+        else:
+            context["fuel_form"] = FuelFillUpForm(
+                initial={"vehicle": self.object}, user=self.request.user
+            )
+
+        context["report_ready"] = is_ready(self.object.pk, report_version(self.object))
+
+        context["maintenance_forecast"] = MaintenanceForecast.objects.filter(
+            vehicle=self.object
+        ).first()
+
         # Add form for editing the vehicle
         context["form"] = VehicleForm(instance=self.object)
         return context
@@ -173,6 +296,13 @@ class VehicleDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     def get_queryset(self):
         return Vehicle.objects.filter(user=self.request.user)
 
+    def form_valid(self, form):
+        # Deleted in short chunked transactions; sync clients drop the
+        # vehicle's service records and registrations with its tombstone
+        delete_vehicle(self.object, self.request.user)
+        messages.success(self.request, self.success_message)
+        return HttpResponseRedirect(self.get_success_url())
+
 
 # ServiceRecord CRUD Views
 class ServiceRecordCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -254,9 +384,230 @@ class ServiceRecordDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteVie
         # Only allow deleting service records for vehicles owned by the user
         return ServiceRecord.objects.filter(vehicle__user=self.request.user)
 
+    def form_valid(self, form):
+        with transaction.atomic():
+            record_deletion(self.request.user, self.object)
+            return super().form_valid(form)
+
     def get_success_url(self):
         return reverse_lazy("vehicles:vehicle_detail", kwargs={'pk': self.object.vehicle.pk})
 
     def get(self, request, *args, **kwargs):
         # For GET requests, redirect to vehicle detail page
         return redirect('vehicles:vehicle_detail', pk=self.get_object().vehicle.pk)
+
+
+class FuelFillUpCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
+    model = FuelFillUp
+    form_class = FuelFillUpForm
+    template_name = None  # Using modal, no template needed
+    success_message = "Fill-up added successfully."
+
+    def form_invalid(self, form):
+        # Store form errors and data in session for modal display
+        import json
+        self.request.session['fuel_form_errors'] = json.dumps(dict(form.errors))
+        self.request.session['fuel_form_data'] = form.data
+
+        # Redirect back to vehicle detail page
+        vehicle_id = form.data.get('vehicle', '')
+        if vehicle_id.isdigit() and Vehicle.objects.filter(
+            pk=vehicle_id, user=self.request.user
+        ).exists():
+            return redirect('vehicles:vehicle_detail', pk=vehicle_id)
+        return redirect('vehicles:vehicle_list')
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+    def get_success_url(self):
+        return reverse_lazy("vehicles:vehicle_detail", kwargs={'pk': self.object.vehicle.pk})
+
+    def get(self, request, *args, **kwargs):
+        # For GET requests, redirect to vehicle list since we're using modals
+        return redirect('vehicles:vehicle_list')
+
+
+# Odometer time series views
+@login_required
+@require_POST
+def odometer_ingest(request):
+    """Bulk-ingest odometer readings posted as a JSON array or JSON lines."""
+    try:
+        body = request.body.decode()
+        if body.lstrip().startswith("["):
+            items = json.loads(body)
+        else:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return HttpResponseBadRequest("Expected a JSON array or JSON lines.")
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        return HttpResponseBadRequest("Each reading must be a JSON object.")
+
+    result = ingest_readings(request.user, items)
+    return JsonResponse(result._asdict())
+
+
+@login_required
+@require_GET
+def odometer_series(request, pk):
+    """Return daily or weekly odometer rollups and the estimated mileage rate."""
+    vehicle = get_object_or_404(Vehicle, pk=pk, user=request.user)
+    period = request.GET.get("period", "day")
+    if period not in PERIODS:
+        return HttpResponseBadRequest("period must be 'day' or 'week'.")
+
+    readings = vehicle.odometer_readings.all()
+    rate = estimate_mileage_rates(readings).get(vehicle.pk)
+    return JsonResponse(
+        {
+            "vehicle": vehicle.pk,
+            "period": period,
+            "miles_per_day": round(rate.miles_per_day, 2) if rate else None,
+            "points": [
+                {
+                    "period": row.period.isoformat(),
+                    "min": row.min,
+                    "max": row.max,
+                    "readings": row.readings,
+                }
+                for row in rollups(readings, period)
+            ],
+        }
+    )
+
+
+# Service record attachment views
+
+@login_required
+@require_GET
+def attachment_list(request, pk):
+    """Render the attachment list of a service record as an HTML fragment."""
+    record = get_object_or_404(ServiceRecord, pk=pk, vehicle__user=request.user)
+    attachments = [
+        (attachment, thumbnail_path(attachment.sha256).exists())
+        for attachment in record.attachments.all()
+    ]
+    return render(
+        request,
+        "vehicles/includes/attachment_list.html",
+        {"record": record, "attachments": attachments},
+    )
+
+
+@csrf_exempt
+@login_required
+@require_POST
+def attachment_upload(request, pk):
+    # Ownership is checked before the body is read, and the upload handler
+    # has to be swapped in before CSRF validation touches request.POST.
+    record = get_object_or_404(ServiceRecord, pk=pk, vehicle__user=request.user)
+    handler = ContentAddressedUploadHandler(request)
+    request.upload_handlers = [handler]
+    try:
+        return _attachment_upload(request, record, handler)
+    finally:
+        # Temporary files are left behind if CSRF fails or saving raises
+        handler.close()
+
+
+@csrf_protect
+def _attachment_upload(request, record, handler):
+    uploads = request.FILES.getlist("files")
+    for name in handler.rejected:
+        messages.error(request, f"{name} is larger than the upload limit.")
+    stored = 0
+    for upload in uploads:
+        # The row is committed before the lock is released, so a concurrent
+        # delete cannot remove a blob this upload found already stored
+        with store_lock():
+            upload.store()
+            attachment, created = ServiceAttachment.objects.get_or_create(
+                service_record=record,
+                sha256=upload.sha256,
+                defaults={
+                    "original_name": upload.name,
+                    "content_type": upload.content_type,
+                    "size": upload.size,
+                },
+            )
+        if created:
+            stored += 1
+            schedule_thumbnail(attachment)
+    if stored:
+        messages.success(request, f"{stored} attachment(s) uploaded.")
+    elif uploads:
+        messages.info(request, "These files are already attached.")
+    elif not handler.rejected:
+        messages.error(request, "Choose at least one file to upload.")
+    return redirect("vehicles:vehicle_detail", pk=record.vehicle_id)
+
+
+@login_required
+@require_GET
+def attachment_download(request, pk):
+    attachment = get_object_or_404(
+        ServiceAttachment, pk=pk, service_record__vehicle__user=request.user
+    )
+    try:
+        blob = open(blob_path(attachment.sha256), "rb")
+    except FileNotFoundError:
+        raise Http404("Attachment file is missing.")
+    return FileResponse(
+        blob,
+        as_attachment=True,
+        filename=attachment.original_name,
+        content_type=attachment.content_type,
+    )
+
+
+@login_required
+@require_GET
+def attachment_thumbnail(request, pk):
+    attachment = get_object_or_404(
+        ServiceAttachment, pk=pk, service_record__vehicle__user=request.user
+    )
+    try:
+        thumbnail = open(thumbnail_path(attachment.sha256), "rb")
+    except FileNotFoundError:
+        raise Http404("No thumbnail yet.")
+    return FileResponse(thumbnail, content_type="image/png")
+
+
+# Vehicle history report views
+
+@login_required
+@require_POST
+def vehicle_report_generate(request, pk):
+    vehicle = get_object_or_404(Vehicle, pk=pk, user=request.user)
+    _version, ready = request_report(vehicle)
+    if ready:
+        messages.success(request, "The history report is ready to download.")
+    else:
+        messages.info(
+            request, "The history report is being generated. Refresh in a moment."
+        )
+    return redirect("vehicles:vehicle_detail", pk=vehicle.pk)
+
+
+@login_required
+@require_GET
+def vehicle_report_download(request, pk):
+    """Serve the report for the vehicle's current data, if it has been rendered."""
+    vehicle = get_object_or_404(Vehicle, pk=pk, user=request.user)
+    fmt = request.GET.get("format", "html")
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest("format must be 'html' or 'pdf'.")
+    version = report_version(vehicle)
+    try:
+        report = open(report_path(vehicle.pk, version, fmt), "rb")
+    except FileNotFoundError:
+        raise Http404("The report for this vehicle's current data is not ready.")
+    return FileResponse(
+        report,
+        as_attachment=True,
+        filename=f"vehicle-{vehicle.pk}-history.{fmt}",
+        content_type=FORMATS[fmt],
+    )